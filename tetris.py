@@ -1,14 +1,23 @@
+import time
+STARTUP_TIME = time.perf_counter()  # Start of the time-to-first-frame measurement
+
+import argparse
 import pygame
+PYGAME_IMPORTED_TIME = time.perf_counter()
 import random
-import time
 import json
 import os
 import math
+import mmap
+import struct
 
-# Initialize Pygame
-pygame.init()
-pygame.mixer.init()  # Initialize the mixer for sound effects
-pygame.key.set_repeat(200, 50)  # Enable key repeat (initial delay, repeat interval in ms)
+from tetris_events import (EventBus, PieceLocked, LinesCleared, SpecialClear, MultiplierUp, LevelUp,
+                           GameOver)
+from tetris_profiler import Profiler
+from tetris_rotation import ROTATION_SYSTEMS
+from tetris_scoring import SCORING_SYSTEMS
+from tetris_input import InputHandler
+from tetris_stats import GameStats
 
 # Colors
 BLACK = (0, 0, 0)
@@ -79,55 +88,173 @@ def load_sound(filename, default_volume=0.5):
     print("Warning: Using silent sound as last resort")
     return pygame.mixer.Sound(buffer=bytearray(100))
 
-# Try to load sounds
-try:
+# Sounds are decoded on first use or by load_sounds(), not at import
+SOUND_VOLUMES = {"line_clear": 0.7, "multiplier_up": 0.6}
+SOUNDS = {}  # name -> Sound, or None if audio is unavailable
+
+
+def init_display():
+    # Only the subsystems the window needs, instead of pygame.init() starting
+    # every subsystem (joystick, mixer, ...) whether it is used or not
+    if not pygame.display.get_init():
+        pygame.display.init()
+    if not pygame.font.get_init():
+        pygame.font.init()
+
+
+def get_sound(name):
+    if name not in SOUNDS:
+        if not pygame.mixer.get_init():
+            try:
+                pygame.mixer.init()
+            except pygame.error as e:
+                print(f"Sound disabled: {e}")
+                SOUNDS.update(dict.fromkeys(SOUND_VOLUMES))
+                return None
+        try:
+            SOUNDS[name] = load_sound(name, SOUND_VOLUMES[name])
+        except Exception as e:
+            print(f"Critical sound loading error: {e}")
+            SOUNDS[name] = pygame.mixer.Sound(buffer=bytearray(100))
+    return SOUNDS[name]
+
+
+def load_sounds():
     print("Attempting to load sound effects...")
-    LINE_CLEAR_SOUND = load_sound("line_clear", 0.7)
-    MULTIPLIER_UP_SOUND = load_sound("multiplier_up", 0.6)
-except Exception as e:
-    print(f"Critical sound loading error: {e}")
-    # Create silent sounds if all else fails
-    LINE_CLEAR_SOUND = pygame.mixer.Sound(buffer=bytearray(100))
-    MULTIPLIER_UP_SOUND = pygame.mixer.Sound(buffer=bytearray(100))
+    for name in SOUND_VOLUMES:
+        get_sound(name)
+
+# Keys that count as inputs for keys per piece; C only counts with Ctrl (hold)
+GAME_KEYS = frozenset((pygame.K_LEFT, pygame.K_RIGHT, pygame.K_DOWN, pygame.K_UP, pygame.K_x,
+                       pygame.K_z, pygame.K_a, pygame.K_SPACE))
+
+
+def is_game_key(event):
+    # A KEYDOWN that maps to a game action
+    return event.key in GAME_KEYS or (event.key == pygame.K_c and event.mod & pygame.KMOD_CTRL)
+
+# How present() scales the logical surface to the window: 'sharp' uses the
+# largest whole multiple that fits (crisp pixels, letterboxed), 'smooth' fills
+# the window with filtered scaling
+SCALE_MODES = ('sharp', 'smooth')
 
 # Highscore file
 HIGHSCORE_FILE = "tetris_highscores.json"
+# Chrome trace-event JSON written by the profiler (F4)
+TRACE_FILE = "tetris_trace.json"
 
-# Pop-up animation class
-class PopUp:
-    def __init__(self, text, position, color, size=36, duration=1.5):
-        self.text = text
-        self.position = list(position)  # Make a copy to modify
-        self.color = color
-        self.size = size
-        self.start_time = time.time()
-        self.duration = duration
-        self.font = pygame.font.SysFont('Arial', size, bold=True)
-        
+# Save-state written on quit and resumed on the next launch
+SAVE_FILE = "tetris_save.bin"
+SAVE_VERSION = 3
+# magic, layout version, valid flag, snapshot length; then a tetris_snapshot
+# game snapshot (board, pieces, timers and RNG state) padded to its largest size
+SAVE_HEADER = struct.Struct('<4sHBI')
+
+# Pop-up animation system
+POPUP_FPS = 60  # Popups age one frame per update()
+POPUP_PULSE_STEPS = 4  # Pre-rendered sizes between 1.0x and 1.1x
+POPUP_ALPHA_STEPS = 8  # Distinct alpha levels used while fading out
+POPUP_MAX_FRAMES = 4 * POPUP_FPS
+
+# Pulse size index for every frame of a popup's life (was 1.0 + 0.1 * |sin(t * 10)|)
+POPUP_PULSE_TABLE = tuple(
+    min(POPUP_PULSE_STEPS - 1, int(abs(math.sin(frame / POPUP_FPS * 10)) * POPUP_PULSE_STEPS))
+    for frame in range(POPUP_MAX_FRAMES))
+
+
+class PopUpRecord:
+    __slots__ = ('x', 'y', 'age', 'frames', 'surfaces', 'alpha_table')
+
+
+class PopUpPool:
+    def __init__(self, capacity=32):
+        # Fixed set of records; bursts beyond capacity recycle the oldest popup
+        self.records = [PopUpRecord() for _ in range(capacity)]
+        self.active = []
+        self.free = list(self.records)
+        self.fonts = {}  # size -> font
+        self.text_cache = {}  # (text, color, size) -> [[surface per alpha level] per pulse step]
+        self.alpha_tables = {}  # frames -> alpha level per frame
+    
+    def __len__(self):
+        return len(self.active)
+    
+    def get_font(self, size):
+        font = self.fonts.get(size)
+        if font is None:
+            font = self.fonts[size] = pygame.font.SysFont('Arial', size, bold=True)
+        return font
+    
+    def get_surfaces(self, text, color, size):
+        key = (text, color, size)
+        surfaces = self.text_cache.get(key)
+        if surfaces is None:
+            if len(self.text_cache) > 64:
+                self.text_cache.clear()  # Score texts vary; keep the cache small
+            surfaces = []
+            for step in range(POPUP_PULSE_STEPS):
+                pulse_size = int(size * (1.0 + 0.1 * step / (POPUP_PULSE_STEPS - 1)))
+                surface = self.get_font(pulse_size).render(text, True, color)
+                # One copy per alpha level so popups sharing a text never fight over set_alpha
+                levels = []
+                for level in range(POPUP_ALPHA_STEPS - 1):
+                    faded = surface.copy()
+                    faded.set_alpha(255 * level // (POPUP_ALPHA_STEPS - 1))
+                    levels.append(faded)
+                levels.append(surface)
+                surfaces.append(levels)
+            self.text_cache[key] = surfaces
+        return surfaces
+    
+    def get_alpha_table(self, frames):
+        table = self.alpha_tables.get(frames)
+        if table is None:
+            # Opaque for the first 70% of the duration, then fade out linearly
+            fade_start = frames * 0.7
+            top = POPUP_ALPHA_STEPS - 1
+            table = self.alpha_tables[frames] = tuple(
+                top if age <= fade_start else
+                int(top * (1 - (age - fade_start) / (frames - fade_start)))
+                for age in range(frames))
+        return table
+    
+    def spawn(self, text, position, color, size=36, duration=1.5):
+        if self.free:
+            record = self.free.pop()
+        else:
+            record = self.active.pop(0)
+        record.x, record.y = position
+        record.age = 0
+        record.frames = min(POPUP_MAX_FRAMES, int(duration * POPUP_FPS))
+        record.surfaces = self.get_surfaces(text, color, size)
+        record.alpha_table = self.get_alpha_table(record.frames)
+        self.active.append(record)
+    
     def update(self):
-        # Move upward slightly
-        self.position[1] -= 0.5
-        # Check if expired
-        return time.time() - self.start_time < self.duration
-        
+        expired = False
+        for record in self.active:
+            record.age += 1
+            if record.age >= record.frames:
+                expired = True
+        if expired:
+            self.free.extend(r for r in self.active if r.age >= r.frames)
+            self.active = [r for r in self.active if r.age < r.frames]
+    
+    def clear(self):
+        self.free.extend(self.active)
+        self.active = []
+    
     def draw(self, screen):
-        # Calculate alpha (fade out)
-        elapsed = time.time() - self.start_time
-        if elapsed > self.duration * 0.7:  # Start fading out after 70% of duration
-            alpha = 255 * (1 - (elapsed - self.duration * 0.7) / (self.duration * 0.3))
-        else:
-            alpha = 255
-            
-        # Render with pulsing size
-        pulse = 1.0 + 0.1 * abs(math.sin(elapsed * 10))
-        current_size = int(self.size * pulse)
-        font = pygame.font.SysFont('Arial', current_size, bold=True)
-        
-        text_surface = font.render(self.text, True, self.color)
-        text_surface.set_alpha(int(alpha))
-        screen.blit(text_surface, 
-                   (self.position[0] - text_surface.get_width() // 2, 
-                    self.position[1] - text_surface.get_height() // 2))
+        if not self.active:
+            return
+        blit_list = []
+        for record in self.active:
+            age = record.age
+            surface = record.surfaces[POPUP_PULSE_TABLE[age]][record.alpha_table[age]]
+            # Drift upward half a pixel per frame
+            blit_list.append((surface, (record.x - surface.get_width() // 2,
+                                        record.y - age * 0.5 - surface.get_height() // 2)))
+        screen.blits(blit_list, False)
 
 # Tetromino shapes represented as [rotation][y][x]
 SHAPES = {
@@ -258,77 +385,262 @@ SHAPE_COLORS = {
     'L': ORANGE
 }
 
-# Game constants
-CELL_SIZE = 30
-BOARD_WIDTH = 10
-BOARD_HEIGHT = 20
-SCREEN_WIDTH = BOARD_WIDTH * CELL_SIZE + 200  # Extra space for UI elements
-SCREEN_HEIGHT = BOARD_HEIGHT * CELL_SIZE
+# Lines GameStats.panel_lines() shows under the multiplier
+PANEL_STATS_LINES = 5
+
+
+class GameRules:
+    """Board geometry and rule set for one game variant.
+    
+    Everything the engine and renderer used to read from module constants or
+    hard-coded numbers lives here, so variants (big boards, 20G) need no
+    fork. Derived tables are computed once in __init__; treat an instance as
+    read-only after construction.
+    """
+    
+    def __init__(self, board_width=10, board_height=20, cell_size=30, panel_width=200,
+                 initial_drop_speed=1.0, speed_increase_factor=0.9995, min_drop_speed=0.1,
+                 level_speed_step=0.05, lines_per_level=10,
+                 scoring_table=(0, 100, 300, 500, 800), combo_decay_time=5.0,
+                 spawn_x=None, spawn_y=-1, instant_drop=False, max_level=100,
+                 rotation_system='srs', lock_delay=0.5, lock_resets=15, scoring='classic'):
+        self.board_width = board_width
+        self.board_height = board_height
+        self.cell_size = cell_size
+        self.panel_width = panel_width  # Extra space for UI elements
+        
+        # Gravity: seconds between drops, shortened a little per piece and
+        # reset from the level curve on every level up
+        self.initial_drop_speed = initial_drop_speed
+        self.speed_increase_factor = speed_increase_factor
+        self.min_drop_speed = min_drop_speed
+        self.level_speed_step = level_speed_step
+        self.lines_per_level = lines_per_level
+        # 20G: the piece falls to the floor as soon as it spawns or moves
+        self.instant_drop = instant_drop
+        # Seconds a grounded piece waits before locking (0 locks at once), and how
+        # many moves/rotations on the ground may restart that wait (move reset)
+        self.lock_delay = lock_delay
+        self.lock_resets = lock_resets
+        
+        self.scoring_table = tuple(scoring_table)  # Base points by lines cleared at once
+        self.combo_decay_time = combo_decay_time  # Seconds before the multiplier resets
+        
+        # Wall kicks: 'srs', 'none' (rotate in place or not at all) or a RotationSystem instance
+        if isinstance(rotation_system, str):
+            rotation_system = ROTATION_SYSTEMS[rotation_system]()
+        self.rotation_system = rotation_system
+        # Points per lock: 'classic', 'guideline' (T-spins, all clears,
+        # back-to-back) or a ScoringSystem instance
+        if isinstance(scoring, str):
+            scoring = SCORING_SYSTEMS[scoring]()
+        self.scoring = scoring
+        
+        # Derived tables
+        self.screen_width = board_width * cell_size + panel_width
+        self.screen_height = board_height * cell_size
+        self.spawn_position = (board_width // 2 - 2 if spawn_x is None else spawn_x, spawn_y)
+        self.level_drop_speeds = tuple(
+            max(min_drop_speed, initial_drop_speed - (level - 1) * level_speed_step)
+            for level in range(max_level + 1))
+        self.panel_layout = self.build_panel_layout()
+    
+    def build_panel_layout(self):
+        # Side panel y positions, stacked top to bottom from the preview cell
+        # size, then squeezed if the stack is taller than the board
+        preview = self.cell_size - 5  # Cell size of the next/hold previews
+        line = 30  # Height of one panel text line
+        layout = {'score': 30, 'level': 60, 'lines': 90, 'next_label': 140, 'next': 170}
+        layout['hold_label'] = layout['next'] + 2 * preview + 20
+        layout['hold'] = layout['hold_label'] + line
+        layout['hold_width'] = 4 * preview + 20
+        layout['hold_height'] = 4 * preview
+        layout['multiplier'] = layout['hold'] + layout['hold_height'] + 20
+        layout['multiplier_height'] = 50
+        layout['stats'] = layout['multiplier'] + layout['multiplier_height'] + 15
+        layout['stats_step'] = 20
+        bottom = layout['stats'] + PANEL_STATS_LINES * layout['stats_step']
+        if bottom > self.screen_height:
+            scale = self.screen_height / bottom
+            layout = {name: int(value * scale) for name, value in layout.items()}
+            layout['hold_width'] = 4 * preview + 20
+        return layout
+    
+    def drop_speed_for_level(self, level):
+        speeds = self.level_drop_speeds
+        return speeds[level] if level < len(speeds) else speeds[-1]
+
+
+DEFAULT_RULES = GameRules()
+# Large board for benchmarking, and a 20G variant where pieces land instantly
+BIG_BOARD_RULES = GameRules(board_width=20, board_height=40, cell_size=15)
+TWENTY_G_RULES = GameRules(instant_drop=True, initial_drop_speed=0.5, min_drop_speed=0.25,
+                           level_speed_step=0.01)
+# Competitive play: guideline scoring with T-spins, all clears and back-to-back
+COMPETITIVE_RULES = GameRules(scoring='guideline')
+# Rule sets by name; game snapshots (saves, replays) record which one a game used
+RULE_SETS = {'default': DEFAULT_RULES, 'big': BIG_BOARD_RULES, '20g': TWENTY_G_RULES,
+             'competitive': COMPETITIVE_RULES}
+
+
+def rule_set_name(rules):
+    # Name of a rule set in RULE_SETS, or '' for a custom GameRules
+    for name, known in RULE_SETS.items():
+        if known is rules:
+            return name
+    return ''
+
+# Game constants (the default rule set)
+CELL_SIZE = DEFAULT_RULES.cell_size
+BOARD_WIDTH = DEFAULT_RULES.board_width
+BOARD_HEIGHT = DEFAULT_RULES.board_height
+SCREEN_WIDTH = DEFAULT_RULES.screen_width
+SCREEN_HEIGHT = DEFAULT_RULES.screen_height
+
+class PieceRotation:
+    # Precomputed, shared data for one rotation of one shape
+    __slots__ = ('cells', 'min_x', 'max_x', 'min_y', 'max_y', 'width', 'height')
+    
+    def __init__(self, matrix):
+        # Occupied (dx, dy) offsets, so callers never visit the empty cells of the 4x4 matrix
+        self.cells = tuple((x, y) for y in range(4) for x in range(4) if matrix[y][x])
+        xs = [x for x, _ in self.cells]
+        ys = [y for _, y in self.cells]
+        # Bounding box / left, right and bottom extents
+        self.min_x, self.max_x = min(xs), max(xs)
+        self.min_y, self.max_y = min(ys), max(ys)
+        self.width = self.max_x - self.min_x + 1
+        self.height = self.max_y - self.min_y + 1
+
+
+# Interned rotation tables: SHAPE_ROTATIONS[shape][rotation]
+SHAPE_ROTATIONS = {
+    shape: tuple(PieceRotation(matrix) for matrix in rotations)
+    for shape, rotations in SHAPES.items()
+}
+
 
 class Tetromino:
+    __slots__ = ('shape', 'rotation', 'shape_data', 'rotations', 'color')
+    
     def __init__(self, shape):
         self.shape = shape
         self.rotation = 0
         self.shape_data = SHAPES[shape]
+        self.rotations = SHAPE_ROTATIONS[shape]
         self.color = SHAPE_COLORS[shape]
     
     def get_shape_matrix(self):
         return self.shape_data[self.rotation]
     
+    def get_rotation(self):
+        return self.rotations[self.rotation]
+    
+    def get_cells(self):
+        return self.rotations[self.rotation].cells
+    
     def rotate(self, direction=1):
         # Rotate clockwise (1) or counterclockwise (-1)
-        num_rotations = len(self.shape_data)
+        num_rotations = len(self.rotations)
         self.rotation = (self.rotation + direction) % num_rotations
 
 
 class GameBoard:
-    def __init__(self, width, height):
+    def __init__(self, width, height, buffer=None):
         self.width = width
         self.height = height
-        self.grid = [[0 for _ in range(width)] for _ in range(height)]
+        # Occupancy lives in one flat byte buffer so it can be shared (e.g. as a
+        # NumPy view) without copying; grid rows are writable windows into it
+        self.cells = buffer if buffer is not None else bytearray(width * height)
+        view = memoryview(self.cells).cast('B')
+        self.grid = [view[y * width:(y + 1) * width] for y in range(height)]
         self.colors = [[0 for _ in range(width)] for _ in range(height)]
+        self.version = 0  # Bumped on every change so derived data (e.g. the ghost) can be cached
+        # Occupancy summary: filled cells per row and in total, kept up to date by
+        # every method here, so full rows and an empty board are found without a scan.
+        # clear_lines() trusts it, so grid rows are for reading: edit cells through
+        # set_cell() and load() rather than writing to grid or cells
+        self.row_counts = [0] * height
+        self.filled = 0
+        self.recount()
+    
+    def recount(self):
+        # Rebuild the occupancy summary, for decoders that fill cells row by row
+        width = self.width
+        cells = bytes(self.cells)
+        self.row_counts = [width - cells.count(0, y * width, (y + 1) * width)
+                           for y in range(self.height)]
+        self.filled = sum(self.row_counts)
+    
+    def set_cell(self, x, y, filled, color=0):
+        row = self.grid[y]
+        if filled and not row[x]:
+            self.row_counts[y] += 1
+            self.filled += 1
+        elif row[x] and not filled:
+            self.row_counts[y] -= 1
+            self.filled -= 1
+        row[x] = 1 if filled else 0
+        self.colors[y][x] = color if filled else 0
+        self.version += 1
+    
+    def load(self, cells, colors=None):
+        # Replace the whole occupancy (width * height bytes, row by row) and
+        # optionally the colors (rows of colors)
+        memoryview(self.cells).cast('B')[:] = bytes(cells)
+        if colors is not None:
+            for row, source in zip(self.colors, colors):
+                row[:] = source
+        self.recount()
+        self.version += 1
+    
+    def clear(self):
+        # Zero the cells in one slice assignment; grid rows stay valid views
+        memoryview(self.cells).cast('B')[:] = bytes(self.width * self.height)
+        for row in self.colors:
+            row[:] = [0] * self.width
+        self.row_counts = [0] * self.height
+        self.filled = 0
+        self.version += 1
     
     def is_collision(self, tetromino, position):
-        shape_matrix = tetromino.get_shape_matrix()
-        for y in range(4):
-            for x in range(4):
-                if shape_matrix[y][x]:
-                    board_x = position[0] + x
-                    board_y = position[1] + y
-                    
-                    # Check for boundaries or collision with placed pieces
-                    if (board_x < 0 or board_x >= self.width or 
-                        board_y >= self.height or 
-                        (board_y >= 0 and self.grid[board_y][board_x])):
-                        return True
+        rotation = tetromino.rotations[tetromino.rotation]
+        pos_x, pos_y = position
+        
+        # Walls and floor from the precomputed extents
+        if (pos_x + rotation.min_x < 0 or pos_x + rotation.max_x >= self.width or
+                pos_y + rotation.max_y >= self.height):
+            return True
+        
+        # Collision with placed pieces
+        grid = self.grid
+        for x, y in rotation.cells:
+            board_y = pos_y + y
+            if board_y >= 0 and grid[board_y][pos_x + x]:
+                return True
         return False
     
     def place_tetromino(self, tetromino, position):
-        shape_matrix = tetromino.get_shape_matrix()
-        for y in range(4):
-            for x in range(4):
-                if shape_matrix[y][x]:
-                    board_x = position[0] + x
-                    board_y = position[1] + y
-                    if 0 <= board_y < self.height and 0 <= board_x < self.width:
-                        self.grid[board_y][board_x] = 1
-                        self.colors[board_y][board_x] = tetromino.color
+        pos_x, pos_y = position
+        row_counts = self.row_counts
+        for x, y in tetromino.get_cells():
+            board_x = pos_x + x
+            board_y = pos_y + y
+            if 0 <= board_y < self.height and 0 <= board_x < self.width:
+                row = self.grid[board_y]
+                if not row[board_x]:
+                    row[board_x] = 1
+                    row_counts[board_y] += 1
+                    self.filled += 1
+                self.colors[board_y][board_x] = tetromino.color
+        self.version += 1
     
     def clear_lines(self):
-        lines_cleared = 0
-        lines_to_clear = []
-        
-        # Find complete lines
-        for y in range(self.height - 1, -1, -1):
-            if all(self.grid[y]):
-                lines_to_clear.append(y)
-                lines_cleared += 1
-        
-        # Return early if no lines to clear
-        if not lines_cleared:
-            return 0, []
-            
-        return lines_cleared, lines_to_clear
+        # Complete lines, bottom first, straight from the row counts
+        width = self.width
+        row_counts = self.row_counts
+        lines_to_clear = [y for y in range(self.height - 1, -1, -1) if row_counts[y] == width]
+        return len(lines_to_clear), lines_to_clear
     
     def remove_lines(self, lines_to_clear):
         # Remove the lines in order from top to bottom
@@ -343,21 +655,99 @@ class GameBoard:
             for x in range(self.width):
                 self.grid[0][x] = 0
                 self.colors[0][x] = 0
+            self.filled -= self.row_counts.pop(line)
+            self.row_counts.insert(0, 0)
+        self.version += 1
+    
+    def add_garbage(self, lines, hole_x, color=GRAY):
+        # Push the stack up and fill the bottom rows, leaving one gap per row.
+        # Returns True if occupied cells were pushed off the top
+        overflow = any(any(self.grid[y]) for y in range(min(lines, self.height)))
+        for y in range(self.height):
+            source = y + lines
+            for x in range(self.width):
+                if source < self.height:
+                    self.grid[y][x] = self.grid[source][x]
+                    self.colors[y][x] = self.colors[source][x]
+                else:
+                    filled = x != hole_x
+                    self.grid[y][x] = 1 if filled else 0
+                    self.colors[y][x] = color if filled else 0
+        kept = self.row_counts[lines:]
+        garbage_count = self.width - (0 <= hole_x < self.width)
+        self.row_counts = kept + [garbage_count] * (self.height - len(kept))
+        self.filled = sum(self.row_counts)
+        self.version += 1
+        return overflow
+    
+    def drop_distance(self, tetromino, position):
+        # How many rows the piece can fall from position before it lands
+        distance = 0
+        while not self.is_collision(tetromino, [position[0], position[1] + distance + 1]):
+            distance += 1
+        return distance
 
 
 class TetrisGame:
-    def __init__(self):
-        self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-        pygame.display.set_caption('Tetris MVP')
+    def __init__(self, headless=False, seed=None, board=None, rules=None, scale_mode='sharp',
+                 window_scale=1):
+        self.rules = rules if rules is not None else DEFAULT_RULES
+        # Headless games run the rules only: no window, fonts, sounds or popups
+        self.headless = headless
+        self.screen = None
+        self.window = None
+        self.scale_mode = scale_mode  # See SCALE_MODES; F5 switches
+        self.window_scale = window_scale  # Initial window size as a multiple of the logical size
+        if not headless:
+            self.init_graphics()
         
-        self.board = GameBoard(BOARD_WIDTH, BOARD_HEIGHT)
+        rules = self.rules
+        self.board = board if board is not None else GameBoard(rules.board_width, rules.board_height)
         self.clock = pygame.time.Clock()
+        self.rng = random.Random(seed)
+        self.time_source = time.time  # Swap for a virtual clock to step deterministically
+        self.events = EventBus()
+        if not headless:
+            self.subscribe_effects()
+        self.profiler = Profiler()  # F3 toggles timing and the overlay, F4 exports a trace
+        
+        self.input = InputHandler()
+        self.popups = PopUpPool()  # Active popups
+        self.combo_decay_time = rules.combo_decay_time  # Seconds before combo resets
+        self.speed_increase_factor = rules.speed_increase_factor
+        self.min_drop_speed = rules.min_drop_speed
+        self.save_map = None  # mmap of SAVE_FILE, opened on first save or resume
+        self.recorder = None  # tetris_replay.ReplayRecorder while a replay is being recorded
+        self.metrics = None  # This thread's tetris_metrics.GameMetrics, set by MetricsRegistry.attach()
+        self.stats = None if headless else GameStats()  # PPS, KPP, APM... for the side panel
+        self.frame_count = 0  # Frames drawn by run_frame() this session
+        self.first_frame_time = None
+        
+        # Highscore system
+        self.highscores = self.load_highscores()
+        
+        self.reset()
+    
+    def reset(self, seed=None):
+        # Start a new game in place. The window, fonts, clock, event bus and
+        # highscores are kept, so restarting does not rebuild them.
+        if seed is not None:
+            self.rng.seed(seed)
+        self.board.clear()
+        self.input.reset()
+        self.popups.clear()
         
         self.current_tetromino = None
         self.next_tetromino = None
         self.saved_tetromino = None  # Add a saved/held piece
         self.can_save_piece = True   # Flag to prevent multiple saves in a row
         self.position = [0, 0]
+        self.last_kick = 0  # Kick offset index used by the last successful rotation
+        self.last_rotation = None  # (direction, kick) if the piece's last move was a rotation
+        self.back_to_back = False  # Last line clear was a tetris or T-spin (guideline scoring)
+        self.lock_start = None  # When the grounded piece started its lock delay
+        self.lock_resets = 0  # Move resets used since the piece last reached a new lowest row
+        self.lowest_y = 0
         
         self.score = 0
         self.level = 1
@@ -366,29 +756,132 @@ class TetrisGame:
         self.game_over_ready_to_restart = False  # New state to track after name entry
         self.paused = False  # Add pause state
         self.multiplier = 1  # Starting multiplier
-        self.last_clear_time = 0  # Time of last line clear
+        # Time of last line clear; virtual clocks start at 0, so "never" must not look recent
+        self.last_clear_time = float('-inf')
         self.flash_lines = []  # Lines currently being flashed
         self.flash_start_time = 0  # When the flash effect started
-        self.combo_decay_time = 5.0  # Seconds before combo resets
-        self.popups = []  # List of active popups
         self.prev_multiplier = 1  # Track previous multiplier for animations
+        self.ghost_key = None  # (piece, rotation, x, board version) the ghost was computed for
+        self.ghost_y = 0
         
-        self.drop_speed = 1.0  # seconds between drops
-        self.speed_increase_factor = 0.9995  # Make this closer to 1 for slower increase
-        self.min_drop_speed = 0.1  # Increase min speed to make it not get too fast
-        self.last_drop_time = time.time()
-        
-        self.font = pygame.font.SysFont('Arial', 24)
-        self.big_font = pygame.font.SysFont('Arial', 32, bold=True)
+        self.drop_speed = self.rules.initial_drop_speed  # seconds between drops
+        self.last_drop_time = self.time_source()
         
-        # Highscore system
-        self.highscores = self.load_highscores()
         self.player_name = ""
         self.name_input_active = False
         
+        if self.metrics is not None:
+            self.metrics.games_started += 1
+        if self.stats is not None:
+            self.stats.reset(self.last_drop_time)
+        
         # Initialize with random pieces
         self.spawn_tetromino()
     
+    def init_graphics(self, surface=None):
+        # Draw into the given surface (offscreen rendering) or open the window.
+        # Either way render() draws at the logical resolution from the rules;
+        # present() scales that to whatever size the window has.
+        logical_size = (self.rules.screen_width, self.rules.screen_height)
+        if surface is None:
+            init_display()
+            scale = self.window_scale
+            self.window = pygame.display.set_mode((logical_size[0] * scale, logical_size[1] * scale),
+                                                  pygame.RESIZABLE)
+            pygame.display.set_caption('Tetris MVP')
+            surface = pygame.Surface(logical_size).convert()
+        elif not pygame.font.get_init():
+            pygame.font.init()
+        self.screen = surface
+        self.font = pygame.font.SysFont('Arial', 24)
+        self.big_font = pygame.font.SysFont('Arial', 32, bold=True)
+        self.fonts = {}  # (size, bold) -> font for text whose size changes
+        self.sprites = {}  # (color, outline) -> pre-rendered cell surface
+        self.stats_surfaces = []  # Rendered stats panel lines, for stats_version
+        self.stats_version = None
+        self.background = self.build_background()
+        if self.window is not None:
+            self.resize(self.window.get_size())
+    
+    def build_background(self):
+        # Everything render() draws that never changes: the board grid, the
+        # panel labels and the hold box outline
+        cell_size = self.rules.cell_size
+        ui_x = self.rules.board_width * cell_size + 20
+        background = pygame.Surface(self.screen.get_size(), 0, self.screen)
+        background.fill(BLACK)
+        for y in range(self.rules.board_height):
+            for x in range(self.rules.board_width):
+                pygame.draw.rect(background, GRAY, [x * cell_size, y * cell_size, cell_size, cell_size], 1)
+        layout = self.rules.panel_layout
+        background.blit(self.font.render("Next:", True, WHITE), (ui_x, layout['next_label']))
+        background.blit(self.font.render("Hold (Ctrl+C):", True, WHITE), (ui_x, layout['hold_label']))
+        pygame.draw.rect(background, GRAY, pygame.Rect(ui_x, layout['hold'], layout['hold_width'],
+                                                       layout['hold_height']), 1)
+        return background
+    
+    def resize(self, size):
+        # Lay the logical surface out in a window of this size. Runs on
+        # resize and mode changes only, never per frame.
+        self.window = pygame.display.get_surface()
+        logical_w, logical_h = self.screen.get_size()
+        window_w, window_h = size
+        scale = min(window_w // logical_w, window_h // logical_h)
+        if self.scale_mode == 'sharp' and scale >= 1:
+            # Integer scale: every logical pixel becomes a scale x scale block
+            frame_size = (logical_w * scale, logical_h * scale)
+            self.smooth_scaling = False
+        else:
+            # Fit the window keeping the aspect ratio (also sharp mode in a
+            # window smaller than the logical size)
+            factor = min(window_w / logical_w, window_h / logical_h)
+            frame_size = (max(1, round(logical_w * factor)), max(1, round(logical_h * factor)))
+            self.smooth_scaling = True
+        self.frame_rect = pygame.Rect((0, 0), frame_size)
+        self.frame_rect.center = (window_w // 2, window_h // 2)
+        # The scaled frame is written straight into its part of the window;
+        # the letterbox bars around it are painted once here
+        self.window.fill(BLACK)
+        self.frame = None if frame_size == (logical_w, logical_h) else self.window.subsurface(self.frame_rect)
+        self.full_update = True
+    
+    def toggle_scale_mode(self):
+        self.scale_mode = SCALE_MODES[(SCALE_MODES.index(self.scale_mode) + 1) % len(SCALE_MODES)]
+        self.resize(self.window.get_size())
+    
+    def present(self):
+        # Copy the logical surface to the window: a plain blit at scale 1,
+        # otherwise a scale into the cached window subsurface (no allocation)
+        if self.frame is None:
+            self.window.blit(self.screen, self.frame_rect)
+        elif self.smooth_scaling:
+            pygame.transform.smoothscale(self.screen, self.frame_rect.size, self.frame)
+        else:
+            pygame.transform.scale(self.screen, self.frame_rect.size, self.frame)
+        if self.full_update:
+            pygame.display.flip()
+            self.full_update = False
+        else:
+            pygame.display.update(self.frame_rect)
+    
+    def get_font(self, size, bold=False):
+        font = self.fonts.get((size, bold))
+        if font is None:
+            font = self.fonts[(size, bold)] = pygame.font.SysFont('Arial', size, bold=bold)
+        return font
+    
+    def get_cell_sprite(self, color, outline=False):
+        sprite = self.sprites.get((color, outline))
+        if sprite is None:
+            cell_size = self.rules.cell_size
+            sprite = pygame.Surface((cell_size - 2, cell_size - 2), pygame.SRCALPHA)
+            if outline:
+                pygame.draw.rect(sprite, color, sprite.get_rect(), 2)
+            else:
+                sprite.fill(color)
+            self.sprites[(color, outline)] = sprite
+        return sprite
+    
     def load_highscores(self):
         if os.path.exists(HIGHSCORE_FILE):
             try:
@@ -400,8 +893,68 @@ class TetrisGame:
         return []
         
     def save_highscores(self):
+        start = time.perf_counter()
         with open(HIGHSCORE_FILE, 'w') as f:
             json.dump(self.highscores, f)
+        if self.metrics is not None:
+            self.metrics.highscore_write.observe(time.perf_counter() - start)
+    
+    def open_save_map(self):
+        # Map SAVE_FILE at the fixed size for this board, creating it if needed
+        if self.save_map is None:
+            # tetris_snapshot imports this module, so it is only imported here
+            from tetris_snapshot import game_snapshot_size
+            size = SAVE_HEADER.size + game_snapshot_size(self.board.width, self.board.height)
+            fd = os.open(SAVE_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if os.fstat(fd).st_size != size:
+                    os.ftruncate(fd, size)
+                self.save_map = mmap.mmap(fd, size)
+            finally:
+                os.close(fd)
+        return self.save_map
+    
+    def save_game(self):
+        # Write the game in progress to the save file; a finished game is discarded
+        if self.game_over:
+            self.discard_saved_game()
+            return
+        from tetris_snapshot import encode_game
+        save = self.open_save_map()
+        snapshot = encode_game(self)
+        # Marked invalid while writing, so an interrupted save is never resumed
+        SAVE_HEADER.pack_into(save, 0, b'TSAV', SAVE_VERSION, 0, len(snapshot))
+        save[SAVE_HEADER.size:SAVE_HEADER.size + len(snapshot)] = snapshot
+        save[6] = 1  # Valid flag
+        save.flush()
+    
+    def load_saved_game(self):
+        # Resume the game saved on the last quit; returns False if there is none
+        if self.save_map is None and not os.path.exists(SAVE_FILE):
+            return False
+        from tetris_snapshot import SnapshotError, decode_game
+        save = self.open_save_map()
+        magic, version, valid, length = SAVE_HEADER.unpack_from(save)
+        if magic != b'TSAV' or version != SAVE_VERSION or not valid:
+            return False
+        try:
+            # Rejects saves made with another board size
+            decode_game(save[SAVE_HEADER.size:SAVE_HEADER.size + length], self)
+        except SnapshotError:
+            return False
+        self.game_over = False
+        self.game_over_ready_to_restart = False
+        self.name_input_active = False
+        self.ghost_key = None
+        self.input.reset()
+        self.popups.clear()
+        return True
+    
+    def discard_saved_game(self):
+        # Invalidate the save file, e.g. once the saved game has ended
+        if self.save_map is not None:
+            self.save_map[6] = 0
+            self.save_map.flush()
             
     def check_highscore(self):
         # Only activate name input when game is over
@@ -411,8 +964,11 @@ class TetrisGame:
         return False
     
     def add_highscore(self, name):
-        # Always add new score
-        self.highscores.append({"name": name, "score": self.score})
+        # Always add new score, with the game's stats when they were tracked
+        entry = {"name": name, "score": self.score}
+        if self.stats is not None:
+            entry["stats"] = self.stats.summary(self.time_source())
+        self.highscores.append(entry)
         self.highscores.sort(key=lambda x: x["score"], reverse=True)
         # Keep only top 5
         self.highscores = self.highscores[:5]
@@ -429,270 +985,409 @@ class TetrisGame:
         if self.next_tetromino:
             self.current_tetromino = self.next_tetromino
         else:
-            shape = random.choice(list(SHAPES.keys()))
+            shape = self.rng.choice(list(SHAPES.keys()))
             self.current_tetromino = Tetromino(shape)
         
-        shape = random.choice(list(SHAPES.keys()))
+        shape = self.rng.choice(list(SHAPES.keys()))
         self.next_tetromino = Tetromino(shape)
         
         # Initial position (centered at the top)
-        self.position = [self.board.width // 2 - 2, -1]
+        self.position = list(self.rules.spawn_position)
         
         # Apply a very small speed increase with each new piece
         self.drop_speed = max(self.min_drop_speed, self.drop_speed * self.speed_increase_factor)
         
         # Allow saving again with the new piece
         self.can_save_piece = True
+        self.last_rotation = None
+        self.reset_lock()
         
         # Check if the new piece immediately collides (game over)
         if self.board.is_collision(self.current_tetromino, self.position):
-            self.game_over = True
-            # When game over happens, immediately check for highscore
-            self.check_highscore()
+            self.end_game()
+    
+    def reset_lock(self):
+        self.lock_start = None
+        self.lock_resets = 0
+        self.lowest_y = self.position[1]
+    
+    def on_ground(self):
+        return self.board.is_collision(self.current_tetromino, [self.position[0], self.position[1] + 1])
+    
+    def after_move(self):
+        # Move reset: a shift or rotation on the ground restarts the lock delay,
+        # a limited number of times per row so the piece cannot stall forever
+        if self.lock_start is not None:
+            if not self.on_ground():
+                self.lock_start = None
+            elif self.lock_resets < self.rules.lock_resets:
+                self.lock_resets += 1
+                self.lock_start = self.time_source()
     
     def move_left(self):
         new_position = [self.position[0] - 1, self.position[1]]
         if not self.board.is_collision(self.current_tetromino, new_position):
             self.position = new_position
+            self.last_rotation = None
+            self.after_move()
+            return True
+        return False
     
     def move_right(self):
         new_position = [self.position[0] + 1, self.position[1]]
         if not self.board.is_collision(self.current_tetromino, new_position):
             self.position = new_position
+            self.last_rotation = None
+            self.after_move()
+            return True
+        return False
     
     def move_down(self):
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.moves_down += 1
         new_position = [self.position[0], self.position[1] + 1]
         if not self.board.is_collision(self.current_tetromino, new_position):
             self.position = new_position
+            self.lock_start = None
+            self.last_rotation = None
+            if new_position[1] > self.lowest_y:
+                # New lowest row: move resets are available again
+                self.lowest_y = new_position[1]
+                self.lock_resets = 0
             return True
-        else:
+        elif self.rules.lock_delay <= 0:
             # Place the piece if it can't move down anymore
-            self.board.place_tetromino(self.current_tetromino, self.position)
+            self.lock_piece()
+        elif self.lock_start is None:
+            # Grounded: lock once the lock delay runs out (see check_lock)
+            self.lock_start = self.time_source()
+        return False
+    
+    def check_lock(self):
+        if self.lock_start is None:
+            return
+        if self.time_source() - self.lock_start >= self.rules.lock_delay:
+            if self.on_ground():
+                self.lock_piece()
+            else:
+                self.lock_start = None
+    
+    def lock_piece(self):
+        # Rules only; sounds, popups and other consumers react to the events
+        events = self.events
+        self.lock_start = None
+        self.board.place_tetromino(self.current_tetromino, self.position)
+        if self.metrics is not None:
+            self.metrics.pieces_locked += 1
+        if events.active:
+            events.publish(PieceLocked(self.current_tetromino.shape,
+                                       self.current_tetromino.rotation,
+                                       tuple(self.position)))
+        
+        # Check for lines, and what the piece scores
+        lines, lines_to_clear = self.board.clear_lines()
+        points, special = self.rules.scoring.award(self, lines)
+        if self.stats is not None:
+            self.stats.on_lock(self.time_source(), lines)
+        
+        if lines > 0:
+            # Start the flash effect
+            self.flash_lines = lines_to_clear
+            self.flash_start_time = self.time_source()
             
-            # Check for lines
-            lines, lines_to_clear = self.board.clear_lines()
+            # Update multiplier and score
+            current_time = self.time_source()
+            self.prev_multiplier = self.multiplier  # Save for animation
             
-            if lines > 0:
-                # Start the flash effect
-                self.flash_lines = lines_to_clear
-                self.flash_start_time = time.time()
-                
-                # Play sound effect
-                LINE_CLEAR_SOUND.play()
-                
-                # Update multiplier and score
-                current_time = time.time()
-                self.prev_multiplier = self.multiplier  # Save for animation
-                
-                if current_time - self.last_clear_time <= self.combo_decay_time:
-                    self.multiplier += 1
-                    # Play multiplier sound if it increased
-                    if self.multiplier > self.prev_multiplier:
-                        MULTIPLIER_UP_SOUND.play()
-                        # Add multiplier popup
-                        center_x = SCREEN_WIDTH // 2
-                        self.popups.append(PopUp(f"MULTIPLIER x{self.multiplier}!", 
-                                             [center_x, SCREEN_HEIGHT // 2 + 50], 
-                                             ORANGE, 32, 2.0))
-                else:
-                    self.multiplier = 1
-                
-                self.last_clear_time = current_time
-                
-                # Add score with multiplier
-                base_score = [0, 100, 300, 500, 800][lines] * self.level
-                points_earned = base_score * self.multiplier
-                self.score += points_earned
-                
-                # Create a popup for points
-                center_x = SCREEN_WIDTH // 2
-                center_y = SCREEN_HEIGHT // 2
-                self.popups.append(PopUp(f"+{points_earned}", [center_x, center_y], GREEN, 48, 1.5))
-                
-                self.lines_cleared += lines
-                
-                # Level up every 10 lines
-                old_level = self.level
-                self.level = (self.lines_cleared // 10) + 1
-                
-                # If leveled up, make a more significant speed increase
-                if self.level > old_level:
-                    # Make level speed increase more gradual (0.05 per level instead of 0.1)
-                    self.drop_speed = max(self.min_drop_speed, 1.0 - (self.level - 1) * 0.05)
-                    # Add level up popup
-                    center_x = SCREEN_WIDTH // 2
-                    self.popups.append(PopUp(f"LEVEL UP! {self.level}", 
-                                        [center_x, SCREEN_HEIGHT // 2 - 50], 
-                                        YELLOW, 40, 2.0))
+            if current_time - self.last_clear_time <= self.combo_decay_time:
+                self.multiplier += 1
+                if events.active:
+                    events.publish(MultiplierUp(self.multiplier))
             else:
-                # Check if multiplier should reset (no lines cleared)
-                current_time = time.time()
-                if current_time - self.last_clear_time > self.combo_decay_time:
-                    self.multiplier = 1
-                    
-                # Spawn a new piece immediately if no lines to clear
-                self.spawn_tetromino()
+                self.multiplier = 1
             
-            return False
+            self.last_clear_time = current_time
+            
+            # Add score with multiplier
+            points_earned = points * self.multiplier
+            self.score += points_earned
+            if special is not None and events.active:
+                events.publish(SpecialClear(special, points_earned))
+            
+            self.lines_cleared += lines
+            
+            # Level up every 10 lines
+            old_level = self.level
+            self.level = (self.lines_cleared // self.rules.lines_per_level) + 1
+            
+            if events.active:
+                events.publish(LinesCleared(lines, tuple(lines_to_clear), points_earned,
+                                            self.multiplier, self.level))
+            
+            # If leveled up, make a more significant speed increase
+            if self.level > old_level:
+                self.drop_speed = self.rules.drop_speed_for_level(self.level)
+                if events.active:
+                    events.publish(LevelUp(self.level))
+        else:
+            # Check if multiplier should reset (no lines cleared)
+            current_time = self.time_source()
+            if current_time - self.last_clear_time > self.combo_decay_time:
+                self.multiplier = 1
+            
+            # T-spins score without clearing lines
+            if points:
+                self.score += points * self.multiplier
+                if special is not None and events.active:
+                    events.publish(SpecialClear(special, points * self.multiplier))
+                
+            # Spawn a new piece immediately if no lines to clear
+            self.spawn_tetromino()
+    
+    def end_game(self):
+        if self.metrics is not None and not self.game_over:
+            self.metrics.games_over += 1
+        if self.stats is not None:
+            self.stats.finish(self.time_source())
+        self.game_over = True
+        self.discard_saved_game()
+        if self.events.active:
+            self.events.publish(GameOver(self.score, self.lines_cleared, self.level))
+        # When game over happens, immediately check for highscore
+        self.check_highscore()
+    
+    def subscribe_effects(self):
+        # Sounds and popups for the windowed game
+        self.events.subscribe(LinesCleared, self.on_lines_cleared)
+        self.events.subscribe(SpecialClear, self.on_special_clear)
+        self.events.subscribe(MultiplierUp, self.on_multiplier_up)
+        self.events.subscribe(LevelUp, self.on_level_up)
+    
+    def play_sound(self, sound):
+        if sound is not None:
+            sound.play()
+    
+    def on_lines_cleared(self, event):
+        self.play_sound(get_sound("line_clear"))
+        # Create a popup for points
+        center_x = self.rules.screen_width // 2
+        center_y = self.rules.screen_height // 2
+        self.popups.spawn(f"+{event.points}", (center_x, center_y), GREEN, 48, 1.5)
+    
+    def on_special_clear(self, event):
+        center_x = self.rules.screen_width // 2
+        self.popups.spawn(event.label, (center_x, self.rules.screen_height // 2 - 100),
+                          PURPLE, 28, 2.0)
+    
+    def on_multiplier_up(self, event):
+        self.play_sound(get_sound("multiplier_up"))
+        center_x = self.rules.screen_width // 2
+        self.popups.spawn(f"MULTIPLIER x{event.multiplier}!", 
+                          (center_x, self.rules.screen_height // 2 + 50), 
+                          ORANGE, 32, 2.0)
+    
+    def on_level_up(self, event):
+        center_x = self.rules.screen_width // 2
+        self.popups.spawn(f"LEVEL UP! {event.level}", 
+                          (center_x, self.rules.screen_height // 2 - 50), 
+                          YELLOW, 40, 2.0)
+    
+    def apply_gravity(self):
+        # One gravity step; under 20G the piece first falls all the way down
+        if self.rules.instant_drop:
+            self.position = [self.position[0], self.get_ghost_y()]
+        return self.move_down()
     
     def hard_drop(self):
-        while self.move_down():
-            pass
+        # Fall to the landing row and lock immediately, skipping the lock delay
+        distance = self.board.drop_distance(self.current_tetromino, self.position)
+        if distance:
+            self.position = [self.position[0], self.position[1] + distance]
+            self.last_rotation = None
+        self.lock_piece()
     
-    def rotate(self):
-        self.current_tetromino.rotate()
-        if self.board.is_collision(self.current_tetromino, self.position):
-            # If rotation causes collision, rotate back
-            self.current_tetromino.rotate(-1)
+    def rotate(self, direction=1):
+        # 1 clockwise, -1 counter-clockwise, 2 for 180 degrees; kicks come from the rule set
+        result = self.rules.rotation_system.rotate(self.board, self.current_tetromino,
+                                                   self.position, direction)
+        if result is None:
+            return False
+        self.position, self.last_kick = result
+        self.last_rotation = (direction, self.last_kick)
+        self.after_move()
+        return True
+    
+    def finish_line_clear(self):
+        # Remove the flashed lines and bring in the next piece
+        if self.metrics is not None:
+            self.metrics.line_clears[len(self.flash_lines)] += 1
+        self.board.remove_lines(self.flash_lines)
+        self.flash_lines = []
+        self.spawn_tetromino()
+    
+    def get_ghost_y(self):
+        # Landing row of the current piece. Falling straight down never changes
+        # it, so it is only recomputed after a sideways move, a rotation, a new
+        # piece or a board change
+        piece = self.current_tetromino
+        key = (piece, piece.rotation, self.position[0], self.board.version)
+        if key != self.ghost_key:
+            self.ghost_key = key
+            self.ghost_y = self.position[1] + self.board.drop_distance(piece, self.position)
+        return self.ghost_y
     
     def update(self):
-        current_time = time.time()
+        current_time = self.time_source()
+        
+        # Held movement keys (DAS/ARR) and soft drop
+        self.input.update(self, current_time)
         
         # Handle line clear animation
         if self.flash_lines:
             # Flash effect duration (0.5 seconds)
             if current_time - self.flash_start_time > 0.5:
-                # Remove the lines after flash effect
-                self.board.remove_lines(self.flash_lines)
-                self.flash_lines = []
-                # Spawn a new piece after lines are cleared
-                self.spawn_tetromino()
+                self.finish_line_clear()
         else:
+            # 20G: keep the piece on the floor; the drop timer then only decides when it locks
+            if self.rules.instant_drop:
+                self.position = [self.position[0], self.get_ghost_y()]
+            
             # Only perform normal drop if not in the middle of line clear animation
             if current_time - self.last_drop_time > self.drop_speed:
-                self.move_down()
+                self.apply_gravity()
                 self.last_drop_time = current_time
+            self.check_lock()
             
             # Check if multiplier should reset (time elapsed)
             if self.multiplier > 1 and current_time - self.last_clear_time > self.combo_decay_time:
                 self.multiplier = 1
         
         # Update popups
-        self.popups = [popup for popup in self.popups if popup.update()]
+        self.popups.update()
     
     def draw(self):
-        self.screen.fill(BLACK)
+        self.render()
+        if self.profiler.enabled:
+            self.profiler.draw_overlay(self.screen)
+        self.present()
+    
+    def render(self):
+        cell_size = self.rules.cell_size
+        screen_width = self.rules.screen_width
+        screen_height = self.rules.screen_height
         
-        # Draw the board grid
+        # Grid, labels and outlines come from the cached background layer
+        self.screen.blit(self.background, (0, 0))
+        
+        # Draw the occupied cells
         for y in range(self.board.height):
             for x in range(self.board.width):
-                # Draw cell border
-                pygame.draw.rect(self.screen, GRAY, 
-                                [x * CELL_SIZE, y * CELL_SIZE, CELL_SIZE, CELL_SIZE], 1)
-                
-                # If cell is occupied, fill it
                 if self.board.grid[y][x]:
                     # Flash effect if this row is being cleared
                     if y in self.flash_lines:
                         pygame.draw.rect(self.screen, FLASH_WHITE,
-                                        [x * CELL_SIZE + 1, y * CELL_SIZE + 1, CELL_SIZE - 2, CELL_SIZE - 2])
+                                        [x * cell_size + 1, y * cell_size + 1, cell_size - 2, cell_size - 2])
                     else:
                         pygame.draw.rect(self.screen, self.board.colors[y][x],
-                                        [x * CELL_SIZE + 1, y * CELL_SIZE + 1, CELL_SIZE - 2, CELL_SIZE - 2])
+                                        [x * cell_size + 1, y * cell_size + 1, cell_size - 2, cell_size - 2])
         
         # Draw current tetromino (only if not during line clear animation)
         if self.current_tetromino and not self.flash_lines:
-            shape_matrix = self.current_tetromino.get_shape_matrix()
-            for y in range(4):
-                for x in range(4):
-                    if shape_matrix[y][x]:
-                        pygame.draw.rect(self.screen, self.current_tetromino.color,
-                                        [(self.position[0] + x) * CELL_SIZE + 1,
-                                         (self.position[1] + y) * CELL_SIZE + 1,
-                                         CELL_SIZE - 2, CELL_SIZE - 2])
+            cells = self.current_tetromino.get_cells()
+            
+            # Ghost piece outlining where the current piece will land
+            ghost_y = self.get_ghost_y()
+            if ghost_y > self.position[1]:
+                sprite = self.get_cell_sprite(self.current_tetromino.color, outline=True)
+                self.screen.blits([(sprite, ((self.position[0] + x) * cell_size + 1,
+                                             (ghost_y + y) * cell_size + 1))
+                                   for x, y in cells],
+                                  False)
+            
+            for x, y in cells:
+                pygame.draw.rect(self.screen, self.current_tetromino.color,
+                                [(self.position[0] + x) * cell_size + 1,
+                                 (self.position[1] + y) * cell_size + 1,
+                                 cell_size - 2, cell_size - 2])
         
         # Draw UI (score, level, next piece)
-        ui_x = BOARD_WIDTH * CELL_SIZE + 20
+        ui_x = self.board.width * cell_size + 20
+        layout = self.rules.panel_layout
         
         # Score
         score_text = self.font.render(f"Score: {self.score}", True, WHITE)
-        self.screen.blit(score_text, (ui_x, 30))
+        self.screen.blit(score_text, (ui_x, layout['score']))
         
         # Level
         level_text = self.font.render(f"Level: {self.level}", True, WHITE)
-        self.screen.blit(level_text, (ui_x, 60))
+        self.screen.blit(level_text, (ui_x, layout['level']))
         
         # Lines
         lines_text = self.font.render(f"Lines: {self.lines_cleared}", True, WHITE)
-        self.screen.blit(lines_text, (ui_x, 90))
+        self.screen.blit(lines_text, (ui_x, layout['lines']))
         
         # Next piece
-        next_text = self.font.render("Next:", True, WHITE)
-        self.screen.blit(next_text, (ui_x, 140))
-        
         if self.next_tetromino:
-            shape_matrix = self.next_tetromino.get_shape_matrix()
-            for y in range(4):
-                for x in range(4):
-                    if shape_matrix[y][x]:
-                        pygame.draw.rect(self.screen, self.next_tetromino.color,
-                                        [ui_x + x * (CELL_SIZE - 5),
-                                         170 + y * (CELL_SIZE - 5),
-                                         CELL_SIZE - 7, CELL_SIZE - 7])
-        
-        # Draw saved/held piece section with better layout
-        saved_text = self.font.render("Hold (Ctrl+C):", True, WHITE)
-        self.screen.blit(saved_text, (ui_x, 240))
-        
-        # Draw a box to indicate the hold area
-        hold_box_rect = pygame.Rect(ui_x, 270, 120, 100)
-        pygame.draw.rect(self.screen, GRAY, hold_box_rect, 1)
+            for x, y in self.next_tetromino.get_cells():
+                pygame.draw.rect(self.screen, self.next_tetromino.color,
+                                [ui_x + x * (cell_size - 5),
+                                 layout['next'] + y * (cell_size - 5),
+                                 cell_size - 7, cell_size - 7])
         
+        # Held piece, inside the hold box drawn by the background
         if self.saved_tetromino:
-            shape_matrix = self.saved_tetromino.get_shape_matrix()
-            # Center the piece in the box
-            center_x = ui_x + 60
-            center_y = 270 + 50
-            
-            # Calculate the dimensions of the tetromino to center it
-            min_x, max_x, min_y, max_y = 4, 0, 4, 0
-            for y in range(4):
-                for x in range(4):
-                    if shape_matrix[y][x]:
-                        min_x = min(min_x, x)
-                        max_x = max(max_x, x)
-                        min_y = min(min_y, y)
-                        max_y = max(max_y, y)
-            
-            width = max_x - min_x + 1
-            height = max_y - min_y + 1
+            rotation = self.saved_tetromino.get_rotation()
+            # Center the piece in the box using its precomputed bounding box
+            center_x = ui_x + layout['hold_width'] // 2
+            center_y = layout['hold'] + layout['hold_height'] // 2
+            left = center_x - (rotation.width * (cell_size - 5)) // 2
+            top = center_y - (rotation.height * (cell_size - 5)) // 2
             
             # Draw the piece centered
-            for y in range(4):
-                for x in range(4):
-                    if shape_matrix[y][x]:
-                        pygame.draw.rect(self.screen, self.saved_tetromino.color,
-                                        [center_x - (width * (CELL_SIZE - 5)) // 2 + (x - min_x) * (CELL_SIZE - 5),
-                                         center_y - (height * (CELL_SIZE - 5)) // 2 + (y - min_y) * (CELL_SIZE - 5),
-                                         CELL_SIZE - 7, CELL_SIZE - 7])
+            for x, y in rotation.cells:
+                pygame.draw.rect(self.screen, self.saved_tetromino.color,
+                                [left + (x - rotation.min_x) * (cell_size - 5),
+                                 top + (y - rotation.min_y) * (cell_size - 5),
+                                 cell_size - 7, cell_size - 7])
         else:
             # Show "Empty" text when no piece is saved
             empty_text = self.font.render("Empty", True, GRAY)
-            self.screen.blit(empty_text, (ui_x + 60 - empty_text.get_width() // 2, 270 + 50 - empty_text.get_height() // 2))
+            self.screen.blit(empty_text, (ui_x + layout['hold_width'] // 2 - empty_text.get_width() // 2,
+                                          layout['hold'] + layout['hold_height'] // 2 - empty_text.get_height() // 2))
         
         # Multiplier (highlight if higher than 1)
-        pygame.draw.rect(self.screen, GRAY, [ui_x, 390, 160, 50], 0 if self.multiplier > 1 else 1)
+        pygame.draw.rect(self.screen, GRAY, [ui_x, layout['multiplier'], 160, layout['multiplier_height']], 0 if self.multiplier > 1 else 1)
         
         # Calculate font size based on multiplier value for pulsing effect
         mult_size = 24
         if self.multiplier > 1:
             # Make it pulse a bit
-            elapsed = time.time() - self.last_clear_time
+            elapsed = self.time_source() - self.last_clear_time
             if elapsed < 1.0:  # Pulse for 1 second after increasing
                 mult_size = int(24 + 8 * abs(math.sin(elapsed * 10)))
         
-        mult_font = pygame.font.SysFont('Arial', mult_size, bold=(self.multiplier > 1))
+        mult_font = self.get_font(mult_size, self.multiplier > 1)
         multiplier_color = ORANGE if self.multiplier > 1 else WHITE
         multiplier_text = mult_font.render(f"Multiplier: x{self.multiplier}", True, multiplier_color)
-        self.screen.blit(multiplier_text, (ui_x + 80 - multiplier_text.get_width()//2, 415 - multiplier_text.get_height()//2))
+        self.screen.blit(multiplier_text, (ui_x + 80 - multiplier_text.get_width()//2, layout['multiplier'] + layout['multiplier_height'] // 2 - multiplier_text.get_height()//2))
+        
+        # Live stats; the text is re-rendered only after a lock changed them
+        stats = self.stats
+        if stats is not None:
+            if stats.version != self.stats_version:
+                small_font = self.get_font(16)
+                self.stats_surfaces = [small_font.render(line, True, WHITE) for line in stats.panel_lines()]
+                self.stats_version = stats.version
+            self.screen.blits([(surface, (ui_x, layout['stats'] + i * layout['stats_step']))
+                               for i, surface in enumerate(self.stats_surfaces)], False)
         
         # Draw popups
-        for popup in self.popups:
-            popup.draw(self.screen)
+        self.popups.draw(self.screen)
         
         # Pause overlay
         if self.paused:
-            pause_surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+            pause_surface = pygame.Surface((screen_width, screen_height))
             pause_surface.set_alpha(150)
             pause_surface.fill(BLACK)
             self.screen.blit(pause_surface, (0, 0))
@@ -701,15 +1396,15 @@ class TetrisGame:
             resume_text = self.font.render("Press P to resume", True, WHITE)
             
             self.screen.blit(pause_text, 
-                            (SCREEN_WIDTH // 2 - pause_text.get_width() // 2, 
-                             SCREEN_HEIGHT // 2 - 30))
+                            (screen_width // 2 - pause_text.get_width() // 2, 
+                             screen_height // 2 - 30))
             self.screen.blit(resume_text, 
-                            (SCREEN_WIDTH // 2 - resume_text.get_width() // 2, 
-                             SCREEN_HEIGHT // 2 + 20))
+                            (screen_width // 2 - resume_text.get_width() // 2, 
+                             screen_height // 2 + 20))
         
         # Game over or name input
         if self.game_over:
-            game_over_surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+            game_over_surface = pygame.Surface((screen_width, screen_height))
             game_over_surface.set_alpha(150)
             game_over_surface.fill(BLACK)
             self.screen.blit(game_over_surface, (0, 0))
@@ -717,8 +1412,8 @@ class TetrisGame:
             if self.name_input_active:
                 # Draw name input dialog
                 pygame.draw.rect(self.screen, GRAY, 
-                                [SCREEN_WIDTH // 4, SCREEN_HEIGHT // 3, 
-                                 SCREEN_WIDTH // 2, SCREEN_HEIGHT // 3])
+                                [screen_width // 4, screen_height // 3, 
+                                 screen_width // 2, screen_height // 3])
                 
                 # Change text based on whether it's a new highscore or just game over
                 if not self.highscores or self.score > min([hs["score"] for hs in self.highscores]) or len(self.highscores) < 5:
@@ -731,17 +1426,17 @@ class TetrisGame:
                 instruction = self.font.render("Press ENTER when done", True, WHITE)
                 
                 self.screen.blit(input_text, 
-                                (SCREEN_WIDTH // 2 - input_text.get_width() // 2, 
-                                 SCREEN_HEIGHT // 3 + 20))
+                                (screen_width // 2 - input_text.get_width() // 2, 
+                                 screen_height // 3 + 20))
                 self.screen.blit(name_prompt, 
-                                (SCREEN_WIDTH // 2 - name_prompt.get_width() // 2, 
-                                 SCREEN_HEIGHT // 3 + 70))
+                                (screen_width // 2 - name_prompt.get_width() // 2, 
+                                 screen_height // 3 + 70))
                 self.screen.blit(name_text, 
-                                (SCREEN_WIDTH // 2 - name_text.get_width() // 2, 
-                                 SCREEN_HEIGHT // 3 + 120))
+                                (screen_width // 2 - name_text.get_width() // 2, 
+                                 screen_height // 3 + 120))
                 self.screen.blit(instruction, 
-                                (SCREEN_WIDTH // 2 - instruction.get_width() // 2, 
-                                 SCREEN_HEIGHT // 3 + 170))
+                                (screen_width // 2 - instruction.get_width() // 2, 
+                                 screen_height // 3 + 170))
             elif self.game_over_ready_to_restart:
                 # Ready to restart with any key
                 game_over_text = self.big_font.render("GAME OVER", True, WHITE)
@@ -749,42 +1444,40 @@ class TetrisGame:
                 restart_text = self.font.render("Press ANY KEY to play again", True, WHITE)
                 
                 self.screen.blit(game_over_text, 
-                                (SCREEN_WIDTH // 2 - game_over_text.get_width() // 2, 
-                                 SCREEN_HEIGHT // 2 - 80))
+                                (screen_width // 2 - game_over_text.get_width() // 2, 
+                                 screen_height // 2 - 80))
                 self.screen.blit(score_text, 
-                                (SCREEN_WIDTH // 2 - score_text.get_width() // 2, 
-                                 SCREEN_HEIGHT // 2 - 40))
+                                (screen_width // 2 - score_text.get_width() // 2, 
+                                 screen_height // 2 - 40))
                 
                 # Draw highscores below
                 highscore_text = self.font.render("Highscores:", True, WHITE)
                 self.screen.blit(highscore_text, 
-                                (SCREEN_WIDTH // 2 - highscore_text.get_width() // 2, 
-                                 SCREEN_HEIGHT // 2))
+                                (screen_width // 2 - highscore_text.get_width() // 2, 
+                                 screen_height // 2))
                 
                 if self.highscores:
                     for i, hs in enumerate(self.highscores):
                         hs_text = self.font.render(f"{i+1}. {hs['name']}: {hs['score']}", True, 
                                                  YELLOW if i == 0 else WHITE)
                         self.screen.blit(hs_text, 
-                                        (SCREEN_WIDTH // 2 - hs_text.get_width() // 2, 
-                                         SCREEN_HEIGHT // 2 + 30 + i * 25))
+                                        (screen_width // 2 - hs_text.get_width() // 2, 
+                                         screen_height // 2 + 30 + i * 25))
                 
                 self.screen.blit(restart_text, 
-                                (SCREEN_WIDTH // 2 - restart_text.get_width() // 2, 
-                                 SCREEN_HEIGHT // 2 + 160))
+                                (screen_width // 2 - restart_text.get_width() // 2, 
+                                 screen_height // 2 + 160))
             else:
                 # Standard game over screen
                 game_over_text = self.big_font.render("GAME OVER", True, WHITE)
                 restart_text = self.font.render("Press R to restart", True, WHITE)
                 
                 self.screen.blit(game_over_text, 
-                                (SCREEN_WIDTH // 2 - game_over_text.get_width() // 2, 
-                                 SCREEN_HEIGHT // 2 - 30))
+                                (screen_width // 2 - game_over_text.get_width() // 2, 
+                                 screen_height // 2 - 30))
                 self.screen.blit(restart_text, 
-                                (SCREEN_WIDTH // 2 - restart_text.get_width() // 2, 
-                                 SCREEN_HEIGHT // 2 + 20))
-        
-        pygame.display.flip()
+                                (screen_width // 2 - restart_text.get_width() // 2, 
+                                 screen_height // 2 + 20))
     
     def handle_name_input(self, event):
         if event.key == pygame.K_RETURN:
@@ -813,15 +1506,16 @@ class TetrisGame:
             self.current_tetromino, self.saved_tetromino = self.saved_tetromino, self.current_tetromino
             
             # Reset position to top of board
-            self.position = [self.board.width // 2 - 2, -1]
+            self.position = list(self.rules.spawn_position)
             
             # Check for collision after swap (game over if can't place)
             if self.board.is_collision(self.current_tetromino, self.position):
-                self.game_over = True
-                self.check_highscore()
+                self.end_game()
         
         # Prevent saving again until a piece is placed
         self.can_save_piece = False
+        self.last_rotation = None
+        self.reset_lock()
 
     def spawn_new_current_piece(self):
         # Helper method to get a new current piece from next queue
@@ -829,72 +1523,218 @@ class TetrisGame:
             self.current_tetromino = self.next_tetromino
             
             # Get a new next piece
-            shape = random.choice(list(SHAPES.keys()))
+            shape = self.rng.choice(list(SHAPES.keys()))
             self.next_tetromino = Tetromino(shape)
             
             # Reset position
-            self.position = [self.board.width // 2 - 2, -1]
+            self.position = list(self.rules.spawn_position)
             
             # Check for collision (game over if can't place)
             if self.board.is_collision(self.current_tetromino, self.position):
-                self.game_over = True
-                self.check_highscore()
+                self.end_game()
     
-    def run(self):
-        running = True
+    def handle_event(self, event):
+        # A key event that plays the game. Replays feed recorded events through
+        # here too, so it must only depend on the event and the game state.
+        if self.recorder is not None:
+            self.recorder.record(event)
+        if (self.stats is not None and event.type == pygame.KEYDOWN and is_game_key(event)
+                and not self.game_over and not self.paused):
+            self.stats.on_key()
         
-        while running:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
-                
-                # Handle keyboard inputs
-                if event.type == pygame.KEYDOWN:
-                    if self.game_over:
-                        if self.name_input_active:
-                            # Handle name input
-                            self.handle_name_input(event)
-                        elif self.game_over_ready_to_restart:
-                            # Restart game with any key
-                            self.__init__()
-                        elif event.key == pygame.K_r:
-                            # Original restart with R key
-                            self.__init__()
-                    else:
-                        # Game is active
-                        if event.key == pygame.K_LEFT:
-                            self.move_left()
-                        elif event.key == pygame.K_RIGHT:
-                            self.move_right()
-                        elif event.key == pygame.K_DOWN:
-                            self.move_down()
-                        elif event.key == pygame.K_UP:
-                            self.rotate()
-                        elif event.key == pygame.K_SPACE:
-                            self.hard_drop()
-                        elif event.key == pygame.K_p:  # P key toggles pause
-                            self.paused = not self.paused
-                        elif event.key == pygame.K_c and pygame.key.get_mods() & pygame.KMOD_CTRL:
-                            # Ctrl+C to save/swap piece
-                            if not self.paused:
-                                self.save_piece()
-            
-            # Game logic update
-            if not self.game_over and not self.paused:
-                self.update()
-            # Ensure name input is activated as soon as game over happens
-            elif self.game_over and not self.name_input_active and not self.game_over_ready_to_restart:
-                self.check_highscore()
-            
-            # Drawing
-            self.draw()
-            
-            # Cap at 60 FPS
-            self.clock.tick(60)
+        # Held movement keys go to the input engine, both down and up
+        if not self.game_over and not self.paused and self.input.handle_event(self, event):
+            return
+        if event.type != pygame.KEYDOWN:
+            return
+        
+        if self.game_over:
+            if self.name_input_active:
+                # Handle name input
+                self.handle_name_input(event)
+            elif self.game_over_ready_to_restart:
+                # Restart game with any key
+                self.reset()
+            elif event.key == pygame.K_r:
+                # Original restart with R key
+                self.reset()
+        elif event.key == pygame.K_p:  # P key toggles pause
+            self.paused = not self.paused
+            self.input.reset()
+            if self.stats is not None:
+                self.stats.set_paused(self.paused, self.time_source())
+        elif not self.paused and not self.flash_lines:
+            # Game is active and the piece is not locked yet
+            if event.key in (pygame.K_UP, pygame.K_x):
+                self.rotate()
+            elif event.key == pygame.K_z:
+                self.rotate(-1)
+            elif event.key == pygame.K_a:
+                self.rotate(2)
+            elif event.key == pygame.K_SPACE:
+                self.hard_drop()
+            elif event.key == pygame.K_c and event.mod & pygame.KMOD_CTRL:
+                # Ctrl+C to save/swap piece
+                self.save_piece()
+    
+    def step(self):
+        # Game logic for one frame, after its key events
+        if not self.game_over and not self.paused:
+            self.update()
+        # Ensure name input is activated as soon as game over happens
+        elif self.game_over and not self.name_input_active and not self.game_over_ready_to_restart:
+            self.check_highscore()
         
+        # Deliver this frame's game events (sounds, popups, other subscribers)
+        self.events.flush()
+    
+    def run(self, report_startup=False):
+        # Pick up the game left on the last quit, paused until P is pressed
+        if self.load_saved_game():
+            self.paused = True
+            if self.stats is not None:
+                self.stats.set_paused(True, self.time_source())
+        
+        while self.run_frame():
+            if report_startup and self.frame_count == 1:
+                ready = self.first_frame_time
+                print(f"Time to first frame: {(ready - STARTUP_TIME) * 1000:.0f} ms "
+                      f"(importing pygame {(PYGAME_IMPORTED_TIME - STARTUP_TIME) * 1000:.0f} ms, "
+                      f"bootstrap and first frame {(ready - PYGAME_IMPORTED_TIME) * 1000:.0f} ms)")
+        
+        if self.recorder is not None:
+            self.recorder.finish(self)
+        # Keep the game in progress for the next launch
+        self.save_game()
+        if self.save_map is not None:
+            self.save_map.close()
         pygame.quit()
+    
+    def run_frame(self):
+        # One frame of the main loop; returns False once the window is closed.
+        # The browser build calls this from an asyncio loop instead of run().
+        running = True
+        profiler = self.profiler
+        profiling = profiler.enabled
+        if profiling:
+            phase_start = profiler.begin()
+        
+        if self.recorder is not None:
+            self.recorder.begin_frame(self)
+        
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.VIDEORESIZE:
+                self.resize(event.size)
+            elif event.type == pygame.WINDOWEXPOSED:
+                self.full_update = True
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                # Toggle profiling and its overlay
+                profiler.toggle(self)
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F4:
+                profiler.export_chrome_trace(TRACE_FILE)
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F5:
+                self.toggle_scale_mode()
+            elif event.type in (pygame.KEYDOWN, pygame.KEYUP):
+                self.handle_event(event)
+        
+        # Toggling above may have changed the profiler state
+        profiling = profiling and profiler.enabled
+        if profiling:
+            profiler.end('events', phase_start)
+            phase_start = profiler.begin()
+        
+        self.step()
+        
+        if profiling:
+            profiler.end('update', phase_start)
+            phase_start = profiler.begin()
+        
+        # Drawing
+        self.draw()
+        
+        if self.frame_count == 0:
+            self.first_frame_time = time.perf_counter()
+            # Decode the sounds now the window is up, before the first line clear needs them
+            load_sounds()
+        self.frame_count += 1
+        
+        if profiling:
+            profiler.end('draw', phase_start)
+            phase_start = profiler.begin()
+        
+        # Cap at 60 FPS
+        self.clock.tick(60)
+        if self.metrics is not None:
+            self.metrics.frame_time.observe(self.clock.get_time() / 1000)
+        
+        if profiling:
+            profiler.end('tick', phase_start)
+            profiler.end_frame()
+        return running
 
 
-if __name__ == "__main__":
+def benchmark_restart(restarts=200):
+    """Times restarts, each up to and including the new game's first frame.
+
+    'rebuild' constructs a new TetrisGame the way restarts used to work
+    (window, fonts, highscore file and board all set up again); 'reset'
+    restarts one game in place with reset().
+    """
     game = TetrisGame()
-    game.run()
\ No newline at end of file
+    
+    def rebuild():
+        return TetrisGame()
+    
+    def reset():
+        game.reset()
+        return game
+    
+    for name, restart in (('rebuild', rebuild), ('reset', reset)):
+        times = []
+        for _ in range(restarts):
+            start = time.perf_counter()
+            restart().draw()
+            times.append((time.perf_counter() - start) * 1000)
+        times.sort()
+        print(f"{name:>8}: p50 {times[len(times) // 2]:.3f} ms  "
+              f"p99 {times[int(len(times) * 0.99)]:.3f} ms  max {times[-1]:.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tetris")
+    parser.add_argument('--benchmark-restart', type=int, nargs='?', const=200, default=None,
+                        metavar='RESTARTS', help="time restarts instead of playing")
+    parser.add_argument('--startup-report', action='store_true',
+                        help="print the time from startup to the first frame")
+    parser.add_argument('--scale-mode', choices=SCALE_MODES, default='sharp',
+                        help="window scaling (F5 switches while playing)")
+    parser.add_argument('--window-scale', type=int, default=1, metavar='N',
+                        help="open the window at N times the logical size")
+    parser.add_argument('--record', metavar='REPLAY', default=None,
+                        help="record the game for tetris_replay.py to render")
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="serve Prometheus metrics on this port")
+    parser.add_argument('--competitive', action='store_true',
+                        help="guideline scoring: T-spins, all clears and back-to-back")
+    args = parser.parse_args()
+    
+    if args.benchmark_restart:
+        benchmark_restart(args.benchmark_restart)
+        return
+    rules = COMPETITIVE_RULES if args.competitive else DEFAULT_RULES
+    game = TetrisGame(rules=rules, scale_mode=args.scale_mode, window_scale=args.window_scale)
+    if args.record:
+        from tetris_replay import ReplayRecorder
+        game.recorder = ReplayRecorder(args.record)
+    if args.metrics_port:
+        from tetris_metrics import MetricsRegistry
+        registry = MetricsRegistry()
+        registry.attach(game)
+        registry.serve(args.metrics_port)
+    game.run(report_startup=args.startup_report)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
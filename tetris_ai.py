@@ -0,0 +1,514 @@
+import argparse
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+from typing import NamedTuple
+
+from tetris import TetrisGame, SHAPES, DEFAULT_RULES
+from tetris_solver import piece_masks, finesse
+
+# AI player: searches hard-drop placements of the current piece, looking ahead
+# through the known queue (next and held piece) and then over every shape.
+#
+# Boards are bitboards as in tetris_solver (bit y * width + x, y counted from
+# the bottom), and the evaluation is Dellacherie's feature set with the
+# El-Tetris weights, each feature computed for the whole board at once with
+# shifts and masks rather than per cell.
+#
+# Parallel mode splits the root placements across worker processes. The board
+# and queue go to the workers through one shared memory block, so a search
+# only sends each worker a generation number and a list of root indexes. The
+# block's deadline is checked by the workers, and search() merges whatever
+# roots were finished when it passes, so a move is ready within the gravity
+# interval even when a deep search is not.
+
+# El-Tetris weights
+LANDING_HEIGHT = -4.500158825082766
+ERODED_CELLS = 3.4181268101392694
+ROW_TRANSITIONS = -3.2178882868487753
+COLUMN_TRANSITIONS = -9.348695305445199
+HOLES = -7.899265427351652
+WELL_SUMS = -3.3855972247263626
+LOSS = -1e9  # Value of a board with no legal placement
+
+SHAPE_IDS = {shape: i + 1 for i, shape in enumerate(SHAPES)}  # 0 means "no piece"
+ID_SHAPES = {i: shape for shape, i in SHAPE_IDS.items()}
+DEFAULT_DEPTH = 2  # Plies, the root included
+DEFAULT_BEAM = 6  # Children searched further at plies below the root
+DEADLINE_SHARE = 0.8  # Part of the gravity interval a decision may take
+DEADLINE_CHECK_NODES = 256
+
+# Shared block: header, queue piece ids, then the board cells as in
+# GameBoard.cells (row-major, top row first, one byte per cell)
+# generation, deadline (time.monotonic()), width, height, depth, beam, queue length, held id, can hold
+SHARED_HEADER = struct.Struct('<IdBBBBBBB')
+MAX_QUEUE = 16
+BIT_CHARS = bytes.maketrans(b'\x00\x01', b'01')
+
+
+class Move(NamedTuple):
+    shape: str
+    rotation: int
+    position: tuple  # TetrisGame position (x, y) of the piece's 4x4 box
+    hold: bool  # Hold is pressed before placing the piece
+    value: float
+    depth: int  # Plies the value was searched to: 1 if only the fallback finished
+
+
+class Expired(Exception):
+    pass
+
+
+def field_from_cells(cells, width, height):
+    # Bitboard from GameBoard.cells-style bytes
+    field = 0
+    for y in range(height):
+        start = (height - 1 - y) * width
+        row = cells[start:start + width].translate(BIT_CHARS)[::-1]
+        if b'1' in row:
+            field |= int(row, 2) << (y * width)
+    return field
+
+
+class Evaluator:
+    """Placements and evaluation for one board size."""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.masks = piece_masks(width)
+        self.area = (1 << (width * height)) - 1
+        self.full_row = (1 << width) - 1
+        self.left_column = sum(1 << (y * width) for y in range(height))
+        self.right_column = self.left_column << (width - 1)
+
+    def placements(self, field, shape):
+        # (eroded cells times lines, landing height, new field, x, landing row, mask entry)
+        # for each hard drop that stays inside the board
+        width, height = self.width, self.height
+        full_row = self.full_row
+        top = (field.bit_length() + width - 1) // width
+        for entry in self.masks[shape]:
+            mask, piece_width, piece_height, _, _ = entry
+            for x in range(width - piece_width + 1):
+                shifted = mask << x
+                y = top
+                while y > 0 and not field & (shifted << ((y - 1) * width)):
+                    y -= 1
+                if y + piece_height > height:
+                    continue
+                piece = shifted << (y * width)
+                placed = field | piece
+                lines = 0
+                eroded = 0
+                for row in range(y + piece_height - 1, y - 1, -1):
+                    if (placed >> (row * width)) & full_row == full_row:
+                        eroded += ((piece >> (row * width)) & full_row).bit_count()
+                        below = (1 << (row * width)) - 1
+                        piece = (piece & below) | ((piece >> ((row + 1) * width)) << (row * width))
+                        placed = (placed & below) | ((placed >> ((row + 1) * width)) << (row * width))
+                        lines += 1
+                yield lines * eroded, y + (piece_height - 1) / 2, placed, x, y, entry
+
+    def board_value(self, field):
+        width, area = self.width, self.area
+        left_column, right_column = self.left_column, self.right_column
+        empty = ~field & area
+        # Neighbours of every cell, with walls and floor filled
+        left = ((field << 1) & ~left_column & area) | left_column
+        right = ((field >> 1) & ~right_column) | right_column
+        below = ((field << width) & area) | self.full_row
+        row_transitions = ((field ^ left) & area).bit_count() + (empty & right_column).bit_count()
+        column_transitions = ((field ^ below) & area).bit_count()
+
+        # Holes: empty cells with a filled cell somewhere above
+        covered = field >> width
+        shift = width
+        while shift < width * self.height:
+            covered |= covered >> shift
+            shift *= 2
+        holes = (covered & empty).bit_count()
+
+        # Well sums: each well cell counts its depth within its run of well cells
+        wells = empty & left & right
+        well_sums = 0
+        while wells:
+            well_sums += wells.bit_count()
+            wells &= wells >> width
+
+        return (ROW_TRANSITIONS * row_transitions + COLUMN_TRANSITIONS * column_transitions
+                + HOLES * holes + WELL_SUMS * well_sums)
+
+
+def move_value(eroded, landing):
+    return LANDING_HEIGHT * landing + ERODED_CELLS * eroded
+
+
+class Search:
+    """Depth-limited search below one root placement.
+
+    Known queue pieces are searched in order; plies past the queue average
+    the best value over every shape. Below the root only the `beam` best
+    children (by their own evaluation) are searched further. Raises Expired
+    once the monotonic `deadline` has passed.
+    """
+
+    def __init__(self, evaluator, depth=DEFAULT_DEPTH, beam=DEFAULT_BEAM, deadline=None):
+        self.evaluator = evaluator
+        self.depth = depth
+        self.beam = beam
+        self.deadline = deadline
+        self.nodes = 0
+
+    def tick(self):
+        self.nodes += 1
+        if (self.deadline is not None and not self.nodes % DEADLINE_CHECK_NODES
+                and time.monotonic() > self.deadline):
+            raise Expired()
+
+    def value(self, field, queue, plies):
+        # Best value reachable from `field` in `plies` more pieces
+        shapes = queue[:1] or list(SHAPES)
+        total = 0.0
+        for shape in shapes:
+            total += self.shape_value(field, shape, queue[1:], plies)
+        return total / len(shapes)
+
+    def shape_value(self, field, shape, queue, plies):
+        evaluator = self.evaluator
+        scored = []
+        for eroded, landing, placed, _, _, _ in evaluator.placements(field, shape):
+            self.tick()
+            scored.append((move_value(eroded, landing) + evaluator.board_value(placed),
+                           eroded, landing, placed))
+        if not scored:
+            return LOSS
+        if plies == 1:
+            return max(scored)[0]
+        scored.sort(reverse=True)
+        return max(move_value(eroded, landing) + self.value(placed, queue, plies - 1)
+                   for _, eroded, landing, placed in scored[:self.beam])
+
+
+def root_moves(evaluator, field, queue, held, can_hold):
+    """Every first move as (hold, shape, rest of the queue, placement), in a fixed order.
+
+    The order only depends on the arguments, so workers and the coordinator
+    can refer to roots by index.
+    """
+    options = [(False, queue[0], queue[1:])]
+    if can_hold:
+        if held is None:
+            if len(queue) > 1:
+                options.append((True, queue[1], queue[2:]))
+        elif held != queue[0]:
+            options.append((True, held, queue[1:]))
+    roots = []
+    for hold, shape, rest in options:
+        for placement in evaluator.placements(field, shape):
+            roots.append((hold, shape, rest, placement))
+    return roots
+
+
+def quick_value(evaluator, root):
+    eroded, landing, placed = root[3][:3]
+    return move_value(eroded, landing) + evaluator.board_value(placed)
+
+
+def search_roots(search, roots, indexes):
+    # [(index, value)] for the roots finished before the deadline
+    results = []
+    plies = search.depth - 1
+    try:
+        for index in indexes:
+            _, _, rest, (eroded, landing, placed, _, _, _) = roots[index]
+            value = move_value(eroded, landing)
+            value += search.value(placed, rest, plies) if plies else search.evaluator.board_value(placed)
+            results.append((index, value))
+    except Expired:
+        pass
+    return results
+
+
+def to_move(evaluator, root, value, depth):
+    hold, shape, _, (_, _, _, x, y, entry) = root
+    _, _, _, rotation, shape_rotation = entry
+    position = (x - shape_rotation.min_x, evaluator.height - 1 - y - shape_rotation.max_y)
+    return Move(shape, rotation, position, hold, value, depth)
+
+
+_worker_state = None  # (shared memory, {(width, height): Evaluator}) in a worker
+
+
+def _init_worker(name):
+    global _worker_state
+    _worker_state = (shared_memory.SharedMemory(name=name), {})
+
+
+def _search_shared(generation, indexes):
+    # Runs in a worker: reads the board and queue of `generation` from shared memory
+    shared, evaluators = _worker_state
+    (current, deadline, width, height, depth, beam, queue_length, held_id,
+     can_hold) = SHARED_HEADER.unpack_from(shared.buf)
+    if current != generation:
+        return generation, [], 0  # Already superseded
+    offset = SHARED_HEADER.size
+    queue = [ID_SHAPES[i] for i in bytes(shared.buf[offset:offset + queue_length])]
+    offset += MAX_QUEUE
+    cells = bytes(shared.buf[offset:offset + width * height])
+    evaluator = evaluators.get((width, height))
+    if evaluator is None:
+        evaluator = evaluators[(width, height)] = Evaluator(width, height)
+    field = field_from_cells(cells, width, height)
+    held = ID_SHAPES.get(held_id)
+    roots = root_moves(evaluator, field, queue, held, bool(can_hold))
+    search = Search(evaluator, depth, beam, deadline)
+    return generation, search_roots(search, roots, indexes), search.nodes
+
+
+class ParallelSearch:
+    """Root-parallel search on a pool of worker processes.
+
+    The workers attach to one shared memory block at start-up; search()
+    writes the board cells and queue into it, bumps the generation and hands
+    each worker an interleaved share of the roots, best quick value first.
+    At the deadline it merges the roots finished so far; workers stop on
+    their own at the same deadline, and any result of an older generation
+    is dropped. With no finished root it falls back to the best quick
+    (one-ply) value. Call close() (or use it as a context manager) to stop
+    the workers and free the block.
+    """
+
+    def __init__(self, width, height, processes=None, depth=DEFAULT_DEPTH, beam=DEFAULT_BEAM):
+        self.width = width
+        self.height = height
+        self.depth = depth
+        self.beam = beam
+        self.processes = processes or os.cpu_count() or 1
+        self.evaluator = Evaluator(width, height)
+        self.generation = 0
+        self.nodes = 0
+        size = SHARED_HEADER.size + MAX_QUEUE + width * height
+        self.shared = shared_memory.SharedMemory(create=True, size=size)
+        self.pool = ProcessPoolExecutor(self.processes, initializer=_init_worker,
+                                        initargs=(self.shared.name,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+            self.shared.close()
+            self.shared.unlink()
+
+    def search(self, board, queue, held=None, can_hold=True, deadline=None):
+        # Best Move for `board` (a GameBoard) and the queue of shapes, current piece first
+        evaluator = self.evaluator
+        cells = bytes(board.cells)
+        field = field_from_cells(cells, self.width, self.height)
+        queue = list(queue[:MAX_QUEUE])
+        roots = root_moves(evaluator, field, queue, held, can_hold)
+        if not roots:
+            return None
+        quick = [quick_value(evaluator, root) for root in roots]
+        fallback = max(range(len(roots)), key=quick.__getitem__)
+        if self.depth <= 1:
+            return to_move(evaluator, roots[fallback], quick[fallback], 1)
+        if deadline is None:
+            deadline = float('inf')
+
+        self.generation = (self.generation + 1) & 0xFFFFFFFF
+        buffer = self.shared.buf
+        offset = SHARED_HEADER.size
+        buffer[offset:offset + len(queue)] = bytes(SHAPE_IDS[shape] for shape in queue)
+        offset += MAX_QUEUE
+        buffer[offset:offset + len(cells)] = cells
+        SHARED_HEADER.pack_into(buffer, 0, self.generation, deadline, self.width, self.height,
+                                self.depth, self.beam, len(queue), SHAPE_IDS.get(held, 0), can_hold)
+
+        order = sorted(range(len(roots)), key=quick.__getitem__, reverse=True)
+        futures = [self.pool.submit(_search_shared, self.generation, order[i::self.processes])
+                   for i in range(min(self.processes, len(order)))]
+        done, _ = wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+        best = None
+        for future in done:
+            generation, results, nodes = future.result()
+            if generation != self.generation:
+                continue  # A stale worker result: its roots are from another board
+            self.nodes += nodes
+            for index, value in results:
+                if best is None or value > best[1]:
+                    best = (index, value)
+        if best is None:
+            return to_move(evaluator, roots[fallback], quick[fallback], 1)
+        return to_move(evaluator, roots[best[0]], best[1], self.depth)
+
+
+class SerialSearch:
+    """The same search in this process, for one core or a shallow depth."""
+
+    def __init__(self, width, height, depth=DEFAULT_DEPTH, beam=DEFAULT_BEAM):
+        self.width = width
+        self.height = height
+        self.depth = depth
+        self.beam = beam
+        self.evaluator = Evaluator(width, height)
+        self.nodes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        pass
+
+    def search(self, board, queue, held=None, can_hold=True, deadline=None):
+        evaluator = self.evaluator
+        field = field_from_cells(bytes(board.cells), self.width, self.height)
+        queue = list(queue[:MAX_QUEUE])
+        roots = root_moves(evaluator, field, queue, held, can_hold)
+        if not roots:
+            return None
+        quick = [quick_value(evaluator, root) for root in roots]
+        order = sorted(range(len(roots)), key=quick.__getitem__, reverse=True)
+        if self.depth <= 1:
+            return to_move(evaluator, roots[order[0]], quick[order[0]], 1)
+        search = Search(evaluator, self.depth, self.beam, deadline)
+        results = search_roots(search, roots, order)
+        self.nodes += search.nodes
+        if not results:
+            return to_move(evaluator, roots[order[0]], quick[order[0]], 1)
+        index, value = max(results, key=lambda result: result[1])
+        return to_move(evaluator, roots[index], value, self.depth)
+
+
+class AIPlayer:
+    """Plays a TetrisGame: one search per piece, then its finesse inputs.
+
+    Each decision gets DEADLINE_SHARE of the game's current gravity interval,
+    so at high levels a deep search returns its best finished roots instead
+    of letting the piece fall.
+    """
+
+    def __init__(self, game, processes=1, depth=DEFAULT_DEPTH, beam=DEFAULT_BEAM):
+        self.game = game
+        board = game.board
+        if processes == 1:
+            self.searcher = SerialSearch(board.width, board.height, depth, beam)
+        else:
+            self.searcher = ParallelSearch(board.width, board.height, processes, depth, beam)
+        self.decisions = 0
+        self.late = 0  # Decisions that took longer than the gravity interval
+        self.shallow = 0  # Decisions that only had the one-ply fallback
+        self.think_time = 0.0
+        self.max_think_time = 0.0
+
+    def close(self):
+        self.searcher.close()
+
+    def decide(self):
+        game = self.game
+        started = time.monotonic()
+        held = game.saved_tetromino.shape if game.saved_tetromino is not None else None
+        queue = [game.current_tetromino.shape, game.next_tetromino.shape]
+        move = self.searcher.search(game.board, queue, held, game.can_save_piece,
+                                    started + game.drop_speed * DEADLINE_SHARE)
+        elapsed = time.monotonic() - started
+        self.decisions += 1
+        self.think_time += elapsed
+        self.max_think_time = max(self.max_think_time, elapsed)
+        if elapsed > game.drop_speed:
+            self.late += 1
+        if move is not None and move.depth == 1 and self.searcher.depth > 1:
+            self.shallow += 1
+        return move
+
+    def play(self, move):
+        # Hold if the move says so, then the finesse inputs ending in a hard drop
+        game = self.game
+        if move.hold:
+            game.save_piece()
+            if game.game_over:
+                return
+        keys = finesse(game.board, move.shape, move.rotation, move.position, game.rules)
+        if keys is None:
+            keys = ('hard_drop',)  # Unreachable from spawn: drop where the piece is
+        for key in keys:
+            if key == 'left':
+                game.move_left()
+            elif key == 'right':
+                game.move_right()
+            elif key == 'das_left':
+                while game.move_left():
+                    pass
+            elif key == 'das_right':
+                while game.move_right():
+                    pass
+            elif key == 'cw':
+                game.rotate()
+            elif key == 'ccw':
+                game.rotate(-1)
+            elif key == '180':
+                game.rotate(2)
+            elif key == 'hard_drop':
+                game.hard_drop()
+        if game.flash_lines:
+            game.finish_line_clear()
+
+    def step(self):
+        move = self.decide()
+        if move is None:
+            game = self.game
+            game.hard_drop()  # Nowhere left to go; the game is about to end
+            if game.flash_lines:
+                game.finish_line_clear()
+            return
+        self.play(move)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Let the AI play a headless game")
+    parser.add_argument('--pieces', type=int, default=500)
+    parser.add_argument('--depth', type=int, default=DEFAULT_DEPTH,
+                        help="plies searched, the current piece included")
+    parser.add_argument('--beam', type=int, default=DEFAULT_BEAM,
+                        help="children searched further below the root")
+    parser.add_argument('--processes', type=int, default=1, help="0 for one per CPU")
+    parser.add_argument('--level', type=int, default=1,
+                        help="start at this level; its gravity interval sets the deadline")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    game = TetrisGame(headless=True, seed=args.seed)
+    game.highscores = []
+    game.level = args.level
+    game.lines_cleared = (args.level - 1) * DEFAULT_RULES.lines_per_level
+    game.drop_speed = DEFAULT_RULES.drop_speed_for_level(args.level)
+    start_lines = game.lines_cleared
+    player = AIPlayer(game, args.processes or os.cpu_count() or 1, args.depth, args.beam)
+    started = time.perf_counter()
+    try:
+        while player.decisions < args.pieces and not game.game_over:
+            player.step()
+    finally:
+        player.close()
+    elapsed = time.perf_counter() - started
+    decisions = max(1, player.decisions)
+    print(f"{player.decisions} pieces, {game.lines_cleared - start_lines} lines, score {game.score}"
+          f"{', game over' if game.game_over else ''} in {elapsed:.1f} s")
+    print(f"Decision time: mean {player.think_time / decisions * 1000:.1f} ms, "
+          f"max {player.max_think_time * 1000:.1f} ms; {player.late} over the gravity interval, "
+          f"{player.shallow} fell back to one ply; {player.searcher.nodes} nodes")
+
+
+if __name__ == "__main__":
+    main()
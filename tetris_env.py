@@ -0,0 +1,301 @@
+import gc
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+import pygame
+
+from tetris import TetrisGame, GameBoard, SHAPES, DEFAULT_RULES
+
+# Gymnasium is optional: without it the env still offers the same reset/step API
+try:
+    import gymnasium as gym
+    from gymnasium import spaces
+    _EnvBase = gym.Env
+except ImportError:
+    gym = None
+    spaces = None
+    _EnvBase = object
+
+# Discrete action ids
+NOOP = 0
+LEFT = 1
+RIGHT = 2
+ROTATE = 3
+SOFT_DROP = 4
+HARD_DROP = 5
+HOLD = 6
+ROTATE_CCW = 7
+ROTATE_180 = 8
+NUM_ACTIONS = 9
+
+SHAPE_IDS = {shape: i + 1 for i, shape in enumerate(SHAPES)}  # 0 means "no piece"
+
+
+class TetrisEnv(_EnvBase):
+    """Reset/step environment around the rules in TetrisGame.
+
+    Each step applies one action and then one gravity tick on a virtual clock,
+    so episodes are deterministic for a given seed. The observation is a
+    (height, width) uint8 NumPy view over the board's own storage: it is not
+    copied, so it changes on the next step - copy it if you need to keep it.
+    It is read-only, since the board keeps per-row counts of its cells.
+    """
+
+    metadata = {"render_modes": ["rgb_array"], "render_fps": 60}
+
+    def __init__(self, render_mode=None, board_buffer=None, rules=None):
+        if render_mode not in (None, "rgb_array"):
+            raise ValueError(f"Unsupported render_mode: {render_mode}")
+        self.render_mode = render_mode
+        self.rules = rules if rules is not None else DEFAULT_RULES
+        height, width = self.rules.board_height, self.rules.board_width
+
+        # The board is created once and cleared on reset, so the observation
+        # view stays valid for the whole lifetime of the env
+        self.board = GameBoard(width, height, board_buffer)
+        self.observation = np.frombuffer(self.board.cells, dtype=np.uint8).reshape(height, width)
+        self.observation.flags.writeable = False
+        self.game = None
+        self.now = 0.0
+        self.surface = None
+
+        if spaces is not None:
+            self.action_space = spaces.Discrete(NUM_ACTIONS)
+            self.observation_space = spaces.Box(0, 1, (height, width), np.uint8)
+
+    def _clock(self):
+        return self.now
+
+    def _info(self):
+        game = self.game
+        return {
+            "score": game.score,
+            "level": game.level,
+            "lines": game.lines_cleared,
+            "multiplier": game.multiplier,
+            "piece": SHAPE_IDS[game.current_tetromino.shape],
+            "rotation": game.current_tetromino.rotation,
+            "position": tuple(game.position),
+            "next_piece": SHAPE_IDS[game.next_tetromino.shape],
+            "held_piece": SHAPE_IDS[game.saved_tetromino.shape] if game.saved_tetromino else 0,
+        }
+
+    def reset(self, seed=None, options=None):
+        self.now = 0.0
+        if self.game is None:
+            self.game = TetrisGame(headless=True, seed=seed, board=self.board, rules=self.rules)
+            self.game.time_source = self._clock
+            self.game.last_drop_time = self.now
+        else:
+            # Later episodes restart the same game in place; without a new seed
+            # the previous random stream continues
+            self.game.reset(seed)
+        return self.observation, self._info()
+
+    def step(self, action):
+        game = self.game
+        score_before = game.score
+
+        if action == LEFT:
+            game.move_left()
+        elif action == RIGHT:
+            game.move_right()
+        elif action == ROTATE:
+            game.rotate()
+        elif action == SOFT_DROP:
+            game.move_down()
+        elif action == HARD_DROP:
+            game.hard_drop()
+        elif action == HOLD:
+            game.save_piece()
+        elif action == ROTATE_CCW:
+            game.rotate(-1)
+        elif action == ROTATE_180:
+            game.rotate(2)
+
+        # Gravity tick; a piece that was just locked has already been replaced
+        if not game.game_over and not game.flash_lines:
+            game.apply_gravity()
+            game.check_lock()
+        # No flash animation between steps - clear lines immediately
+        if game.flash_lines:
+            game.finish_line_clear()
+        self.now += game.drop_speed
+        game.events.flush()
+
+        reward = game.score - score_before
+        return self.observation, reward, game.game_over, False, self._info()
+
+    def render(self):
+        if self.render_mode != "rgb_array":
+            return None
+        if self.surface is None:
+            # Offscreen surface: no window is ever opened
+            pygame.font.init()
+            self.surface = pygame.Surface((self.rules.screen_width, self.rules.screen_height))
+            self.game.init_graphics(self.surface)
+        self.game.render()
+        # surfarray is (width, height, 3); return the usual (height, width, 3)
+        return pygame.surfarray.array3d(self.surface).transpose(1, 0, 2)
+
+    def close(self):
+        self.surface = None
+
+
+class SyncVectorEnv:
+    """Steps several TetrisEnv instances in-process.
+
+    All boards live in one (num_envs, height, width) array, so the batched
+    observation is returned without stacking or copying. Finished envs are
+    reset automatically; their final info is kept under "final_info".
+    """
+
+    def __init__(self, num_envs, render_mode=None, rules=None):
+        rules = rules if rules is not None else DEFAULT_RULES
+        self.num_envs = num_envs
+        self.observations = np.zeros((num_envs, rules.board_height, rules.board_width),
+                                     dtype=np.uint8)
+        self.envs = [TetrisEnv(render_mode, memoryview(self.observations[i]), rules)
+                     for i in range(num_envs)]
+        self.observations.flags.writeable = False  # The boards write through their own views
+
+    def reset(self, seed=None):
+        infos = []
+        for i, env in enumerate(self.envs):
+            _, info = env.reset(seed=None if seed is None else seed + i)
+            infos.append(info)
+        return self.observations, infos
+
+    def step(self, actions):
+        rewards = np.zeros(self.num_envs, dtype=np.float64)
+        terminated = np.zeros(self.num_envs, dtype=bool)
+        infos = []
+        for i, env in enumerate(self.envs):
+            _, rewards[i], terminated[i], _, info = env.step(int(actions[i]))
+            if terminated[i]:
+                _, reset_info = env.reset()
+                reset_info["final_info"] = info
+                info = reset_info
+            infos.append(info)
+        truncated = np.zeros(self.num_envs, dtype=bool)
+        return self.observations, rewards, terminated, truncated, infos
+
+    def close(self):
+        for env in self.envs:
+            env.close()
+
+
+def _async_worker(conn, shm_name, index, render_mode, rules):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    size = rules.board_width * rules.board_height
+    env = TetrisEnv(render_mode, shm.buf[index * size:(index + 1) * size], rules)
+    try:
+        while True:
+            command, data = conn.recv()
+            if command == "step":
+                # Only the views' owner may hold the board buffer, so never keep
+                # the returned observation around here
+                reward, terminated, truncated, info = env.step(data)[1:]
+                if terminated:
+                    reset_info = env.reset()[1]
+                    reset_info["final_info"] = info
+                    info = reset_info
+                conn.send((reward, terminated, truncated, info))
+            elif command == "reset":
+                info = env.reset(seed=data)[1]
+                conn.send(info)
+            elif command == "render":
+                conn.send(env.render())
+            elif command == "close":
+                break
+    finally:
+        env.close()
+        conn.close()
+        del env
+        gc.collect()  # The env and its game reference each other
+        try:
+            shm.close()
+        except BufferError:
+            pass  # Board views still referenced; released when the process exits
+
+
+class AsyncVectorEnv:
+    """Steps TetrisEnv instances in worker processes.
+
+    Workers write their boards straight into a shared memory block, so only
+    actions, rewards and info dicts cross the pipes; the batched observation
+    is a NumPy view over that block.
+    """
+
+    def __init__(self, num_envs, render_mode=None, context=None, rules=None):
+        rules = rules if rules is not None else DEFAULT_RULES
+        self.num_envs = num_envs
+        shape = (num_envs, rules.board_height, rules.board_width)
+        self.shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+        self.observations = np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf)
+        self.observations[:] = 0
+        self.observations.flags.writeable = False  # Only the workers' boards write here
+
+        ctx = mp.get_context(context)
+        self.conns = []
+        self.processes = []
+        self.closed = False
+        for i in range(num_envs):
+            parent, child = ctx.Pipe()
+            process = ctx.Process(target=_async_worker,
+                                  args=(child, self.shm.name, i, render_mode, rules),
+                                  daemon=True)
+            process.start()
+            child.close()
+            self.conns.append(parent)
+            self.processes.append(process)
+
+    def reset(self, seed=None):
+        for i, conn in enumerate(self.conns):
+            conn.send(("reset", None if seed is None else seed + i))
+        infos = [conn.recv() for conn in self.conns]
+        return self.observations, infos
+
+    def step_async(self, actions):
+        for conn, action in zip(self.conns, actions):
+            conn.send(("step", int(action)))
+
+    def step_wait(self):
+        results = [conn.recv() for conn in self.conns]
+        rewards = np.array([r[0] for r in results], dtype=np.float64)
+        terminated = np.array([r[1] for r in results], dtype=bool)
+        truncated = np.array([r[2] for r in results], dtype=bool)
+        infos = [r[3] for r in results]
+        return self.observations, rewards, terminated, truncated, infos
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def render(self):
+        for conn in self.conns:
+            conn.send(("render", None))
+        return [conn.recv() for conn in self.conns]
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for conn in self.conns:
+            try:
+                conn.send(("close", None))
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join(timeout=1)
+        del self.observations
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # Caller still holds an observation view
+        self.shm.unlink()
+
+    def __del__(self):
+        if hasattr(self, "closed"):
+            self.close()
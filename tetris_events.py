@@ -0,0 +1,115 @@
+import queue
+import threading
+from typing import NamedTuple
+
+
+# Game events. Positions are board cells; times come from the game's time source
+class PieceLocked(NamedTuple):
+    shape: str
+    rotation: int
+    position: tuple
+
+
+class LinesCleared(NamedTuple):
+    lines: int
+    rows: tuple
+    points: int
+    multiplier: int
+    level: int
+
+
+class SpecialClear(NamedTuple):
+    # T-spin, back-to-back or all clear, as named by the rule set's scoring system
+    label: str
+    points: int
+
+
+class MultiplierUp(NamedTuple):
+    multiplier: int
+
+
+class LevelUp(NamedTuple):
+    level: int
+
+
+class GameOver(NamedTuple):
+    score: int
+    lines: int
+    level: int
+
+
+class EventBus:
+    """In-process publish/subscribe for game events.
+
+    publish() only queues events; flush() delivers everything queued since the
+    last flush in one batch, normally once per frame. Handlers run inline in
+    flush() or, if subscribed with threaded=True, on a single worker thread so
+    slow consumers (analytics, replay writers) stay off the game loop.
+
+    Publishers should check `active` before building an event, so a game with
+    no subscribers pays one attribute lookup per event site and nothing else.
+    """
+
+    def __init__(self):
+        self.active = False
+        self.inline = {}    # event type -> [handler]
+        self.threaded = {}  # event type -> [handler]
+        self.pending = []
+        self.worker = None
+        self.worker_queue = None
+
+    def subscribe(self, event_type, handler, threaded=False):
+        handlers = self.threaded if threaded else self.inline
+        handlers.setdefault(event_type, []).append(handler)
+        if threaded and self.worker is None:
+            self.worker_queue = queue.Queue()
+            self.worker = threading.Thread(target=self._run_worker, daemon=True)
+            self.worker.start()
+        self.active = True
+
+    def unsubscribe(self, event_type, handler):
+        for handlers in (self.inline, self.threaded):
+            if handler in handlers.get(event_type, ()):
+                handlers[event_type].remove(handler)
+                if not handlers[event_type]:
+                    del handlers[event_type]
+        self.active = bool(self.inline or self.threaded)
+
+    def publish(self, event):
+        self.pending.append(event)
+
+    def flush(self):
+        if not self.pending:
+            return
+        batch = self.pending
+        self.pending = []
+
+        if self.threaded:
+            self.worker_queue.put(batch)
+        inline = self.inline
+        for event in batch:
+            for handler in inline.get(type(event), ()):
+                handler(event)
+
+    def _run_worker(self):
+        while True:
+            batch = self.worker_queue.get()
+            if batch is None:
+                self.worker_queue.task_done()
+                break
+            threaded = self.threaded
+            for event in batch:
+                for handler in threaded.get(type(event), ()):
+                    try:
+                        handler(event)
+                    except Exception as e:
+                        print(f"Error in event handler {handler!r}: {e}")
+            self.worker_queue.task_done()
+
+    def close(self):
+        # Deliver what is left and stop the worker thread
+        self.flush()
+        if self.worker is not None:
+            self.worker_queue.put(None)
+            self.worker.join(timeout=1)
+            self.worker = None
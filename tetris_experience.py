@@ -0,0 +1,396 @@
+import argparse
+import multiprocessing as mp
+import struct
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from tetris import DEFAULT_RULES
+
+# Experience ring buffer for RL: one producer (the process stepping the envs)
+# appends transitions to a ring of fixed-layout records in shared memory, and
+# any number of learner processes read batches from it without locks.
+#
+# Layout: a header line, the write counter on its own cache line, then
+# `capacity` records. Record k of the stream goes to slot k % capacity. Each
+# slot starts with a seqlock word: 2k + 1 while the producer writes record k
+# there and 2k + 2 once it is complete. A reader that sees 2k + 2 both before
+# and after copying a record got record k whole; anything else means the
+# producer lapped it, and the record is dropped from the batch. This relies on
+# the producer's stores becoming visible in program order, as on x86-64.
+
+MAGIC = b'TEXP'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHBBII')  # magic, version, board width, height, capacity, record size
+COUNTER_OFFSET = 64  # uint64 records written, then float64 highest priority
+RECORDS_OFFSET = 128
+
+
+def record_dtype(width, height):
+    # One transition: seqlock word, score delta, priority, shape ids (tetris_env.SHAPE_IDS,
+    # 0 for none), action, episode end, then both boards bit-packed row by row
+    board_bytes = (width * height + 7) // 8
+    itemsize = (24 + 2 * board_bytes + 7) // 8 * 8
+    return np.dtype({
+        'names': ['seq', 'reward', 'priority', 'piece', 'next_piece', 'held_piece', 'action',
+                  'done', 'board', 'next_board'],
+        'formats': ['<u8', '<i4', '<f4', 'u1', 'u1', 'u1', 'u1', 'u1',
+                    ('u1', board_bytes), ('u1', board_bytes)],
+        'offsets': [0, 8, 12, 16, 17, 18, 19, 20, 24, 24 + board_bytes],
+        'itemsize': itemsize,
+    })
+
+
+def pack_boards(boards):
+    # (n, height, width) 0/1 boards -> (n, board bytes) bit-packed rows
+    boards = np.asarray(boards, dtype=np.uint8)
+    return np.packbits(boards.reshape(len(boards), -1), axis=1)
+
+
+def unpack_boards(packed, width, height):
+    # Inverse of pack_boards()
+    return np.unpackbits(packed, axis=1, count=width * height).reshape(-1, height, width)
+
+
+class Batch:
+    """Sampled transitions: a record array plus where they came from.
+
+    `records` is a copy (a gather cannot be a view) holding only records
+    that were read whole; `numbers` are their positions in the stream, for
+    update_priorities(), and `weights` their importance-sampling weights
+    (all 1 for uniform sampling).
+    """
+
+    def __init__(self, records, numbers, weights, width, height):
+        self.records = records
+        self.numbers = numbers
+        self.weights = weights
+        self.width = width
+        self.height = height
+
+    def __len__(self):
+        return len(self.records)
+
+    def boards(self):
+        return unpack_boards(self.records['board'], self.width, self.height)
+
+    def next_boards(self):
+        return unpack_boards(self.records['next_board'], self.width, self.height)
+
+
+class ExperienceRing:
+    """Single-producer, multi-consumer transition ring in shared memory.
+
+    create() makes the block in the producer; learners attach() to it by
+    name. Only the producer may call extend(). `records` is a zero-copy
+    structured view of all slots; window() gives zero-copy views of recent
+    records, and sample() gathers validated uniform batches (see
+    PrioritizedSampler for prioritised ones). Priorities are written by the
+    producer and updated by learners; those updates are best-effort, and one
+    that races the producer may land on the record that replaced its target.
+    """
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        magic, version, width, height, capacity, itemsize = HEADER.unpack_from(shm.buf)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"shared memory {shm.name} is not an experience ring of this version")
+        self.width = width
+        self.height = height
+        self.capacity = capacity
+        self.dtype = record_dtype(width, height)
+        if self.dtype.itemsize != itemsize:
+            raise ValueError("record layout mismatch")
+        self.counters = np.ndarray((1,), dtype='<u8', buffer=shm.buf, offset=COUNTER_OFFSET)
+        self.max_priority = np.ndarray((1,), dtype='<f8', buffer=shm.buf, offset=COUNTER_OFFSET + 8)
+        self.records = np.ndarray((capacity,), dtype=self.dtype, buffer=shm.buf,
+                                  offset=RECORDS_OFFSET)
+        self.seq = self.records['seq']
+        self.closed = False
+
+    @classmethod
+    def create(cls, capacity, width=DEFAULT_RULES.board_width, height=DEFAULT_RULES.board_height,
+               name=None):
+        itemsize = record_dtype(width, height).itemsize
+        shm = shared_memory.SharedMemory(name=name, create=True,
+                                         size=RECORDS_OFFSET + capacity * itemsize)
+        shm.buf[:RECORDS_OFFSET] = bytes(RECORDS_OFFSET)
+        HEADER.pack_into(shm.buf, 0, MAGIC, FORMAT_VERSION, width, height, capacity, itemsize)
+        ring = cls(shm, owner=True)
+        ring.seq[:] = 0  # No slot holds a record yet
+        ring.max_priority[0] = 1.0
+        return ring
+
+    @classmethod
+    def attach(cls, name):
+        return cls(shared_memory.SharedMemory(name=name), owner=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def written(self):
+        return int(self.counters[0])
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    def extend(self, boards, pieces, next_pieces, held_pieces, actions, rewards, next_boards,
+               dones, priorities=None):
+        """Appends n transitions; boards are pack_boards() output.
+
+        New records get `priorities`, or the highest priority seen so far.
+        Each contiguous run of slots is written with whole-array stores.
+        """
+        count = len(actions)
+        if priorities is None:
+            priorities = np.full(count, self.max_priority[0], dtype=np.float32)
+        start = self.written
+        if count > self.capacity:
+            # Only the newest `capacity` would survive anyway
+            skip = count - self.capacity
+            start += skip
+            boards, next_boards = boards[skip:], next_boards[skip:]
+            pieces, next_pieces, held_pieces = pieces[skip:], next_pieces[skip:], held_pieces[skip:]
+            actions, rewards, dones = actions[skip:], rewards[skip:], dones[skip:]
+            priorities = priorities[skip:]
+            count = self.capacity
+        records, seq = self.records, self.seq
+        done = 0
+        while done < count:
+            slot = (start + done) % self.capacity
+            run = min(count - done, self.capacity - slot)
+            numbers = np.arange(start + done, start + done + run, dtype=np.uint64)
+            target = records[slot:slot + run]
+            source = slice(done, done + run)
+            seq[slot:slot + run] = 2 * numbers + 1
+            target['reward'] = rewards[source]
+            target['priority'] = priorities[source]
+            target['piece'] = pieces[source]
+            target['next_piece'] = next_pieces[source]
+            target['held_piece'] = held_pieces[source]
+            target['action'] = actions[source]
+            target['done'] = dones[source]
+            target['board'] = boards[source]
+            target['next_board'] = next_boards[source]
+            seq[slot:slot + run] = 2 * numbers + 2
+            done += run
+        self.counters[0] = start + count
+
+    def window(self, count):
+        """The newest `count` records as (views, first stream number).
+
+        Zero-copy: one view, or two if the window wraps around the ring.
+        The producer may overwrite them while they are used; check them
+        afterwards with valid() and drop any that fail.
+        """
+        written = self.written
+        count = min(count, written, self.capacity)
+        first = written - count
+        slot = first % self.capacity
+        if slot + count <= self.capacity:
+            return [self.records[slot:slot + count]], first
+        split = self.capacity - slot
+        return [self.records[slot:], self.records[:count - split]], first
+
+    def valid(self, numbers):
+        # Mask of the stream records that are still whole in their slots
+        numbers = np.asarray(numbers, dtype=np.uint64)
+        return self.seq[numbers % self.capacity] == 2 * numbers + 2
+
+    def sample(self, batch_size, rng=None):
+        """A validated, uniformly drawn Batch of up to `batch_size` records.
+
+        Fewer come back if the producer overwrote some during the copy.
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        available = len(self)
+        slots = rng.integers(0, available, batch_size) if available else np.empty(0, np.int64)
+        return self.gather(slots, np.ones(len(slots), dtype=np.float32))
+
+    def gather(self, slots, weights):
+        # Copies the records in `slots`, keeping those read whole
+        written = self.written
+        if not written:
+            return Batch(np.empty(0, self.dtype), np.empty(0, np.uint64),
+                         np.empty(0, np.float32), self.width, self.height)
+        slots = np.asarray(slots, dtype=np.uint64)
+        # Stream number each slot holds as of `written`
+        numbers = written - 1 - (written - 1 - slots) % self.capacity
+        expected = 2 * numbers + 2
+        before = self.seq[slots]
+        records = self.records[slots]  # Gather: a copy
+        after = self.seq[slots]
+        whole = (before == expected) & (after == expected)
+        return Batch(records[whole], numbers[whole], weights[whole], self.width, self.height)
+
+    def update_priorities(self, numbers, priorities):
+        # Best-effort: skips records that have been overwritten since they were sampled
+        numbers = np.asarray(numbers, dtype=np.uint64)
+        priorities = np.asarray(priorities, dtype=np.float32)
+        keep = self.valid(numbers)
+        self.records['priority'][(numbers[keep] % self.capacity).astype(np.intp)] = priorities[keep]
+        if keep.any():
+            self.max_priority[0] = max(self.max_priority[0], float(priorities[keep].max()))
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        del self.records, self.seq, self.counters, self.max_priority
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # Caller still holds a record view; released when the process exits
+        if self.owner:
+            self.shm.unlink()
+
+
+class PrioritizedSampler:
+    """Draws batches with probability proportional to priority ** alpha.
+
+    The cumulative distribution over the ring is O(capacity) to build, so
+    it is rebuilt every `refresh` batches rather than per batch; in between,
+    new records and priority updates are seen with their old slot's
+    probability. Importance weights (n * P) ** -beta are normalised by the
+    batch maximum.
+    """
+
+    def __init__(self, ring, alpha=0.6, beta=0.4, refresh=256, rng=None):
+        self.ring = ring
+        self.alpha = alpha
+        self.beta = beta
+        self.refresh = refresh
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.cumulative = None
+        self.batches = 0
+
+    def rebuild(self):
+        available = len(self.ring)
+        scaled = self.ring.records['priority'][:available].astype(np.float64) ** self.alpha
+        self.cumulative = np.cumsum(scaled)
+        self.batches = 0
+
+    def sample(self, batch_size):
+        if self.cumulative is None or self.batches >= self.refresh or not len(self.cumulative):
+            self.rebuild()
+        self.batches += 1
+        cumulative = self.cumulative
+        available = len(cumulative)
+        if not available:
+            return self.ring.gather(np.empty(0, np.int64), np.empty(0, np.float32))
+        total = cumulative[-1]
+        slots = np.searchsorted(cumulative, self.rng.random(batch_size) * total, side='right')
+        slots = np.minimum(slots, available - 1)
+        # Slot i's probability is its step in the cumulative sum
+        probabilities = (cumulative[slots] - np.where(slots > 0, cumulative[slots - 1], 0.0)) / total
+        weights = (available * probabilities) ** -self.beta
+        return self.ring.gather(slots, (weights / weights.max()).astype(np.float32))
+
+
+def collect(envs, ring, steps, rng=None):
+    """Steps a SyncVectorEnv/AsyncVectorEnv with random actions into `ring`.
+
+    Boards are packed before each step, since the env's observation is a
+    view that the step overwrites. Auto-reset envs report the first board
+    of their next episode as next_board; it is masked by `done`.
+    """
+    from tetris_env import NUM_ACTIONS
+
+    rng = rng if rng is not None else np.random.default_rng()
+    observations, infos = envs.reset()
+    for _ in range(steps):
+        boards = pack_boards(observations)
+        pieces = np.array([info["piece"] for info in infos], dtype=np.uint8)
+        next_pieces = np.array([info["next_piece"] for info in infos], dtype=np.uint8)
+        held = np.array([info["held_piece"] for info in infos], dtype=np.uint8)
+        actions = rng.integers(0, NUM_ACTIONS, envs.num_envs)
+        observations, rewards, terminated, truncated, infos = envs.step(actions)
+        ring.extend(boards, pieces, next_pieces, held, actions.astype(np.uint8),
+                    rewards.astype(np.int32), pack_boards(observations), terminated | truncated)
+
+
+def _benchmark_reader(name, batch_size, prioritized, stop, results):
+    ring = ExperienceRing.attach(name)
+    rng = np.random.default_rng()
+    sampler = PrioritizedSampler(ring, rng=rng) if prioritized else None
+    sampled = torn = 0
+    while not stop.is_set():
+        batch = sampler.sample(batch_size) if prioritized else ring.sample(batch_size, rng)
+        sampled += len(batch)
+        torn += batch_size - len(batch)
+    results.put((sampled, torn))
+    ring.close()
+
+
+def benchmark(capacity=1 << 20, seconds=5.0, readers=2, chunk=4096, batch_size=256,
+              prioritized=True):
+    """Producer throughput with `readers` learner processes sampling alongside.
+
+    Transitions are synthetic (random boards and fields, generated up
+    front), so this measures the ring rather than the envs. Returns
+    (written per second, sampled per second, torn reads).
+    """
+    ring = ExperienceRing.create(capacity)
+    rng = np.random.default_rng(0)
+    width, height = ring.width, ring.height
+    boards = pack_boards(rng.integers(0, 2, (chunk, height, width)))
+    next_boards = np.roll(boards, -1, axis=0)
+    pieces = rng.integers(1, 8, chunk).astype(np.uint8)
+    actions = rng.integers(0, 9, chunk).astype(np.uint8)
+    rewards = rng.choice([0, 0, 0, 100, 300], chunk).astype(np.int32)
+    dones = rng.random(chunk) < 0.01
+    priorities = rng.random(chunk).astype(np.float32) + 0.01
+
+    # Fill the ring once so readers sample a full window from the start
+    for _ in range(capacity // chunk):
+        ring.extend(boards, pieces, pieces, pieces, actions, rewards, next_boards, dones, priorities)
+
+    ctx = mp.get_context()
+    stop = ctx.Event()
+    results = ctx.Queue()
+    processes = [ctx.Process(target=_benchmark_reader,
+                             args=(ring.name, batch_size, prioritized, stop, results), daemon=True)
+                 for _ in range(readers)]
+    for process in processes:
+        process.start()
+    written = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        ring.extend(boards, pieces, pieces, pieces, actions, rewards, next_boards, dones, priorities)
+        written += chunk
+    elapsed = time.perf_counter() - started
+    stop.set()
+    sampled = torn = 0
+    for _ in processes:
+        reader_sampled, reader_torn = results.get()
+        sampled += reader_sampled
+        torn += reader_torn
+    for process in processes:
+        process.join()
+    ring.close()
+    return written / elapsed, sampled / elapsed, torn
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Experience ring throughput benchmark")
+    parser.add_argument('--capacity', type=int, default=1 << 20, help="records in the ring")
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--readers', type=int, default=2, help="learner processes sampling")
+    parser.add_argument('--chunk', type=int, default=4096, help="transitions per extend()")
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--uniform', action='store_true', help="uniform instead of prioritised sampling")
+    args = parser.parse_args()
+
+    write_rate, sample_rate, torn = benchmark(args.capacity, args.seconds, args.readers, args.chunk,
+                                              args.batch_size, not args.uniform)
+    print(f"Wrote {write_rate / 1e6:.2f} M transitions/s; {args.readers} readers sampled "
+          f"{sample_rate / 1e6:.2f} M transitions/s "
+          f"({'uniform' if args.uniform else 'prioritised'}, {torn} torn reads dropped)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,822 @@
+import argparse
+import copy
+import importlib
+import os
+import random
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from tetris import (TetrisGame, GameBoard, Tetromino, SHAPES, GRAY, DEFAULT_RULES, COMPETITIVE_RULES,
+                    TWENTY_G_RULES)
+from tetris_env import (NOOP, LEFT, RIGHT, ROTATE, SOFT_DROP, HARD_DROP, HOLD, ROTATE_CCW,
+                        ROTATE_180, NUM_ACTIONS)
+
+# Differential fuzzing: the same random action sequence is played on a
+# reference game and on a game over the backend under test, in lockstep on a
+# virtual clock, and every step the two games must agree exactly. The
+# reference game runs on ReferenceBoard with frozen copies of the kick tables
+# (ReferenceRotation) and scoring (ReferenceScoring), so optimisations of the
+# board, the rotation systems and the scoring systems are all checked. The
+# game loop itself (gravity, lock delay, hold, combos) is TetrisGame on both
+# sides and is only checked through those.
+
+# Fuzz-only actions on top of tetris_env's: let time pass, or take a garbage
+# line with its gap in column (action - GARBAGE)
+WAIT = NUM_ACTIONS
+GARBAGE = NUM_ACTIONS + 1
+ACTION_NAMES = ['noop', 'left', 'right', 'rotate', 'soft_drop', 'hard_drop', 'hold', 'rotate_ccw',
+                'rotate_180', 'wait']
+
+FRAME_TIME = 1 / 60  # Clock advance per action
+WAIT_TIME = 0.25  # Clock advance of WAIT: long enough for lock delay, flashes and combo decay
+# Relative action frequencies; enough drops that pieces lock and lines clear often
+ACTION_WEIGHTS = {NOOP: 8, LEFT: 18, RIGHT: 18, ROTATE: 10, SOFT_DROP: 10, HARD_DROP: 8, HOLD: 3,
+                  ROTATE_CCW: 6, ROTATE_180: 4, WAIT: 4}
+GARBAGE_WEIGHT = 2  # Shared by all gap columns
+# Chance per action of a tuck instead: soft drop to the floor, maybe shift,
+# rotate once or twice and wait for the lock, so T-spins and late kicks occur
+TUCK_CHANCE = 0.03
+RULE_SETS = {'default': DEFAULT_RULES, 'competitive': COMPETITIVE_RULES, '20g': TWENTY_G_RULES}
+SEQUENCE_LENGTH = 2000
+SPOT_CHECKS = 50  # Random stacks per seed for Fuzzer.spot_check()
+CARVE_TRIES = 8  # Positions tried per kick case before spot_check() moves on
+SHAPE_NAMES = tuple(SHAPES)
+BATCH_SEQUENCES = 50  # Sequences per pool task
+
+
+class ReferenceBoard:
+    """The original list-of-lists board, kept as the oracle.
+
+    It reads every piece from its 4x4 shape matrix and stores plain nested
+    lists, so it shares no tables or storage tricks with GameBoard;
+    add_garbage() and drop_distance() spell out the same rules the same
+    slow way. Never optimise this class - that is what it checks.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.grid = [[0 for _ in range(width)] for _ in range(height)]
+        self.colors = [[0 for _ in range(width)] for _ in range(height)]
+        self.version = 0
+        self.matrix_cache = {}  # SHAPES matrices live for the whole process
+
+    def clear(self):
+        for y in range(self.height):
+            for x in range(self.width):
+                self.grid[y][x] = 0
+                self.colors[y][x] = 0
+        self.version += 1
+
+    def matrix_cells(self, tetromino):
+        # (x, y) of the filled entries of the piece's 4x4 matrix, remembered per matrix
+        shape_matrix = tetromino.get_shape_matrix()
+        cells = self.matrix_cache.get(id(shape_matrix))
+        if cells is None:
+            cells = [(x, y) for y in range(4) for x in range(4) if shape_matrix[y][x]]
+            self.matrix_cache[id(shape_matrix)] = cells
+        return cells
+
+    def is_collision(self, tetromino, position):
+        for x, y in self.matrix_cells(tetromino):
+            board_x = position[0] + x
+            board_y = position[1] + y
+            if (board_x < 0 or board_x >= self.width or
+                    board_y >= self.height or
+                    (board_y >= 0 and self.grid[board_y][board_x])):
+                return True
+        return False
+
+    def place_tetromino(self, tetromino, position):
+        for x, y in self.matrix_cells(tetromino):
+            board_x = position[0] + x
+            board_y = position[1] + y
+            if 0 <= board_y < self.height and 0 <= board_x < self.width:
+                self.grid[board_y][board_x] = 1
+                self.colors[board_y][board_x] = tetromino.color
+        self.version += 1
+
+    def clear_lines(self):
+        lines_to_clear = [y for y in range(self.height - 1, -1, -1) if all(self.grid[y])]
+        return len(lines_to_clear), lines_to_clear
+
+    def remove_lines(self, lines_to_clear):
+        for line in sorted(lines_to_clear):
+            for move_y in range(line, 0, -1):
+                for x in range(self.width):
+                    self.grid[move_y][x] = self.grid[move_y - 1][x]
+                    self.colors[move_y][x] = self.colors[move_y - 1][x]
+            for x in range(self.width):
+                self.grid[0][x] = 0
+                self.colors[0][x] = 0
+        self.version += 1
+
+    def add_garbage(self, lines, hole_x, color=GRAY):
+        overflow = False
+        for y in range(min(lines, self.height)):
+            for x in range(self.width):
+                if self.grid[y][x]:
+                    overflow = True
+        for _ in range(lines):
+            self.grid.pop(0)
+            self.colors.pop(0)
+            self.grid.append([0 if x == hole_x else 1 for x in range(self.width)])
+            self.colors.append([0 if x == hole_x else color for x in range(self.width)])
+        self.version += 1
+        return overflow
+
+    @property
+    def filled(self):
+        return sum(sum(row) for row in self.grid)
+
+    def drop_distance(self, tetromino, position):
+        distance = 0
+        while not self.is_collision(tetromino, [position[0], position[1] + distance + 1]):
+            distance += 1
+        return distance
+
+
+# SRS kicks as published, (x, y) with y pointing up, tried in order per
+# (from, to) rotation; 180 degree turns use the common guideline kicks
+REFERENCE_KICKS = {
+    'JLSTZ': {
+        (0, 1): [(0, 0), (-1, 0), (-1, 1), (0, -2), (-1, -2)],
+        (1, 0): [(0, 0), (1, 0), (1, -1), (0, 2), (1, 2)],
+        (1, 2): [(0, 0), (1, 0), (1, -1), (0, 2), (1, 2)],
+        (2, 1): [(0, 0), (-1, 0), (-1, 1), (0, -2), (-1, -2)],
+        (2, 3): [(0, 0), (1, 0), (1, 1), (0, -2), (1, -2)],
+        (3, 2): [(0, 0), (-1, 0), (-1, -1), (0, 2), (-1, 2)],
+        (3, 0): [(0, 0), (-1, 0), (-1, -1), (0, 2), (-1, 2)],
+        (0, 3): [(0, 0), (1, 0), (1, 1), (0, -2), (1, -2)],
+    },
+    'I': {
+        (0, 1): [(0, 0), (-2, 0), (1, 0), (-2, -1), (1, 2)],
+        (1, 0): [(0, 0), (2, 0), (-1, 0), (2, 1), (-1, -2)],
+        (1, 2): [(0, 0), (-1, 0), (2, 0), (-1, 2), (2, -1)],
+        (2, 1): [(0, 0), (1, 0), (-2, 0), (1, -2), (-2, 1)],
+        (2, 3): [(0, 0), (2, 0), (-1, 0), (2, 1), (-1, -2)],
+        (3, 2): [(0, 0), (-2, 0), (1, 0), (-2, -1), (1, 2)],
+        (3, 0): [(0, 0), (1, 0), (-2, 0), (1, -2), (-2, 1)],
+        (0, 3): [(0, 0), (-1, 0), (2, 0), (-1, 2), (2, -1)],
+    },
+    'half': {
+        (0, 2): [(0, 0), (0, 1), (1, 1), (-1, 1), (1, 0), (-1, 0)],
+        (2, 0): [(0, 0), (0, -1), (-1, -1), (1, -1), (-1, 0), (1, 0)],
+        (1, 3): [(0, 0), (1, 0), (1, 2), (1, 1), (0, 2), (0, 1)],
+        (3, 1): [(0, 0), (-1, 0), (-1, 2), (-1, 1), (0, 2), (0, 1)],
+    },
+}
+
+
+class ReferenceRotation:
+    """Rotation the plain way, as the oracle for tetris_rotation.
+
+    Looks the offsets up in REFERENCE_KICKS on every call and converts them
+    to board coordinates on the spot; with kicks=False it rotates in place
+    or not at all. Never optimise this class either.
+    """
+
+    def __init__(self, kicks):
+        self.kicks = kicks
+        self.name = 'srs' if kicks else 'none'
+
+    def offsets(self, shape, start, target, direction):
+        # Candidate offsets in test order, y pointing up
+        if not self.kicks or shape == 'O':
+            return [(0, 0)]
+        if direction == 2:
+            table = REFERENCE_KICKS['half']
+        else:
+            table = REFERENCE_KICKS['I' if shape == 'I' else 'JLSTZ']
+        return table.get((start, target), [(0, 0)])
+
+    def rotate(self, board, piece, position, direction=1):
+        start = piece.rotation
+        target = (start + direction) % len(piece.rotations)
+        offsets = self.offsets(piece.shape, start, target, direction)
+        piece.rotation = target
+        for index, (x, y) in enumerate(offsets):
+            candidate = [position[0] + x, position[1] - y]
+            if not board.is_collision(piece, candidate):
+                return candidate, index
+        piece.rotation = start
+        return None
+
+
+class ReferenceScoring:
+    """Scoring the plain way, as the oracle for tetris_scoring.
+
+    Finds the T's centre and nose from its shape matrix and scans the board
+    for the all-clear check instead of using precomputed corner masks and
+    cell counts.
+    """
+
+    def __init__(self, guideline):
+        self.guideline = guideline
+        self.name = 'guideline' if guideline else 'classic'
+
+    def spin(self, game):
+        # 0 none, 1 mini, 2 full
+        piece = game.current_tetromino
+        if piece.shape != 'T' or game.last_rotation is None:
+            return 0
+        matrix = piece.get_shape_matrix()
+        cells = {(x, y) for y in range(4) for x in range(4) if matrix[y][x]}
+        sides = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+        center = [(x, y) for x, y in cells
+                  if sum((x + dx, y + dy) in cells for dx, dy in sides) == 3][0]
+        missing = [(dx, dy) for dx, dy in sides if (center[0] + dx, center[1] + dy) not in cells][0]
+
+        def occupied(dx, dy):
+            board = game.board
+            x = game.position[0] + center[0] + dx
+            y = game.position[1] + center[1] + dy
+            return x < 0 or x >= board.width or y >= board.height or (y >= 0 and board.grid[y][x])
+
+        corners = [(dx, dy) for dx in (-1, 1) for dy in (-1, 1)]
+        if sum(occupied(dx, dy) for dx, dy in corners) < 3:
+            return 0
+        # The front corners are on the side the T points to, away from the missing arm
+        front = [(dx, dy) for dx, dy in corners if dx * missing[0] + dy * missing[1] < 0]
+        direction, kick = game.last_rotation
+        if all(occupied(dx, dy) for dx, dy in front) or (kick == 4 and direction != 2):
+            return 2
+        return 1
+
+    def award(self, game, lines):
+        if not self.guideline:
+            return game.rules.scoring_table[lines] * game.level, None
+        spin = self.spin(game)
+        if spin == 1 and lines >= 3:
+            spin = 2
+        if spin == 2:
+            points = [400, 800, 1200, 1600][lines]
+        elif spin == 1:
+            points = [100, 200, 400][lines]
+        else:
+            points = game.rules.scoring_table[lines]
+        spin_name = ['', 'T-SPIN MINI', 'T-SPIN'][spin]
+
+        names = []
+        if lines:
+            difficult = spin != 0 or lines == 4
+            back_to_back = difficult and game.back_to_back
+            game.back_to_back = difficult
+            if back_to_back:
+                points = points * 3 // 2
+                names.append('BACK-TO-BACK')
+            if spin or back_to_back:
+                line_name = ['', 'SINGLE', 'DOUBLE', 'TRIPLE', 'TETRIS'][lines]
+                names.append(f"{spin_name} {line_name}".strip())
+            # All clear: every row is either about to be cleared or empty
+            if all(all(row) or not any(row) for row in game.board.grid):
+                if back_to_back and lines == 4:
+                    points += 3200
+                else:
+                    points += [0, 800, 1200, 1800, 2000][lines]
+                names.append('ALL CLEAR')
+        elif spin:
+            names.append(spin_name)
+        return points * game.level, ' '.join(names) or None
+
+
+def reference_rules(rules):
+    # A copy of `rules` that rotates and scores with the reference classes
+    names = (rules.rotation_system.name, rules.scoring.name)
+    if names[0] not in ('srs', 'none') or names[1] not in ('classic', 'guideline'):
+        raise ValueError(f"No reference for rotation system {names[0]!r} / scoring {names[1]!r}")
+    reference = copy.copy(rules)
+    reference.rotation_system = ReferenceRotation(kicks=names[0] == 'srs')
+    reference.scoring = ReferenceScoring(guideline=names[1] == 'guideline')
+    return reference
+
+
+def numpy_board(width, height):
+    # GameBoard over a NumPy array, as TetrisEnv / SyncVectorEnv share boards
+    return GameBoard(width, height, memoryview(np.zeros((height, width), dtype=np.uint8)))
+
+
+# Backends under test: factories taking (width, height)
+BACKENDS = {
+    'gameboard': GameBoard,
+    'numpy': numpy_board,
+}
+
+
+def load_backend(name):
+    # A BACKENDS name, or 'module:attribute' for a board class defined elsewhere
+    if name in BACKENDS:
+        return BACKENDS[name]
+    module, _, attribute = name.partition(':')
+    if not attribute:
+        raise ValueError(f"Unknown backend {name!r}; use one of {', '.join(BACKENDS)} "
+                         f"or module:attribute")
+    return getattr(importlib.import_module(module), attribute)
+
+
+def action_name(action):
+    if action >= GARBAGE:
+        return f"garbage({action - GARBAGE})"
+    return ACTION_NAMES[action]
+
+
+def random_actions(rng, length, width):
+    population = list(ACTION_WEIGHTS) + [GARBAGE + x for x in range(width)]
+    weights = list(ACTION_WEIGHTS.values()) + [GARBAGE_WEIGHT / width] * width
+    actions = []
+    while len(actions) < length:
+        if rng.random() >= TUCK_CHANCE:
+            actions.append(rng.choices(population, weights)[0])
+            continue
+        actions += [SOFT_DROP] * 20
+        if rng.random() < 0.5:
+            actions.append(rng.choice((LEFT, RIGHT)))
+        actions += [rng.choice((ROTATE, ROTATE_CCW)) for _ in range(rng.randint(1, 2))]
+        actions += [WAIT] * 3
+    return actions[:length]
+
+
+def take_garbage(game, hole_x):
+    # One garbage line, applied the way the versus server does
+    if game.board.add_garbage(1, hole_x):
+        game.end_game()
+        return
+    while game.board.is_collision(game.current_tetromino, game.position):
+        if game.position[1] <= -4:
+            game.end_game()
+            return
+        game.position = [game.position[0], game.position[1] - 1]
+
+
+def play(game, action):
+    # One action, then one frame of game logic; a finished game restarts
+    if game.game_over:
+        game.reset()
+        return
+    if not game.flash_lines:
+        if action == LEFT:
+            game.move_left()
+        elif action == RIGHT:
+            game.move_right()
+        elif action == ROTATE:
+            game.rotate()
+        elif action == SOFT_DROP:
+            game.move_down()
+        elif action == HARD_DROP:
+            game.hard_drop()
+        elif action == HOLD:
+            game.save_piece()
+        elif action == ROTATE_CCW:
+            game.rotate(-1)
+        elif action == ROTATE_180:
+            game.rotate(2)
+        elif action >= GARBAGE:
+            take_garbage(game, action - GARBAGE)
+    if not game.game_over:
+        game.update()
+
+
+STATE_FIELDS = ('score', 'level', 'lines', 'multiplier', 'game over', 'position', 'piece',
+                'rotation', 'next piece', 'held piece', 'can hold', 'flash lines', 'lock start',
+                'drop speed', 'back-to-back')
+
+
+def game_state(game):
+    saved = game.saved_tetromino
+    return (game.score, game.level, game.lines_cleared, game.multiplier, game.game_over,
+            tuple(game.position), game.current_tetromino.shape, game.current_tetromino.rotation,
+            game.next_tetromino.shape, saved.shape if saved is not None else None,
+            game.can_save_piece, tuple(game.flash_lines), game.lock_start, game.drop_speed,
+            game.back_to_back)
+
+
+def board_state(board):
+    return [bytes(row) for row in board.grid], board.colors, board.filled
+
+
+class SpotGame:
+    # The attributes a scoring system reads and writes, without a TetrisGame
+    def __init__(self, rules, board, piece, position, last_rotation, back_to_back, level):
+        self.rules = rules
+        self.board = board
+        self.current_tetromino = piece
+        self.position = position
+        self.last_rotation = last_rotation
+        self.back_to_back = back_to_back
+        self.level = level
+
+
+def fill(board, reference, x, y):
+    board.set_cell(x, y, True, GRAY)
+    reference.grid[y][x] = 1
+    reference.colors[y][x] = GRAY
+
+
+def empty(board, reference, x, y):
+    board.set_cell(x, y, False)
+    reference.grid[y][x] = 0
+    reference.colors[y][x] = 0
+
+
+def random_stacks(rng, board, reference):
+    # Gives both boards the same random ragged stack with holes in it, and
+    # sometimes a few full rows: drawn as rows of the reference and copied
+    # into `board` with one load()
+    width, height = board.width, board.height
+    grid = [[0] * width for _ in range(height)]
+    random, span = rng.random, height // 2 + 1
+    for x in range(width):
+        depth = int(random() * span)
+        filled = rng.getrandbits(depth) | rng.getrandbits(depth)  # Three cells in four
+        for y in range(height - depth, height):
+            grid[y][x] = filled & 1
+            filled >>= 1
+    for y in range(height - 1, height - 1 - rng.randint(0, 3), -1):
+        holes = rng.getrandbits(width) & rng.getrandbits(width) & rng.getrandbits(width)
+        grid[y] = [cell | (~holes >> x & 1) for x, cell in enumerate(grid[y])]
+    reference.grid = grid
+    reference.colors = [[GRAY if cell else 0 for cell in row] for row in grid]
+    reference.version += 1
+    board.load(b''.join(bytes(row) for row in grid), reference.colors)
+
+
+def kick_cases(rotation):
+    # Every (shape, rotation, direction, kick index) of a reference rotation,
+    # in a fixed order, for spot checks to work through
+    cases = []
+    for shape in SHAPES:
+        states = len(Tetromino(shape).rotations)
+        for start in range(states):
+            for direction in (1, -1, 2):
+                target = (start + direction) % states
+                for kick in range(len(rotation.offsets(shape, start, target, direction))):
+                    cases.append((shape, start, direction, kick))
+    return cases
+
+
+def carve_kick(rng, board, reference, rotation, piece, position, direction, kick):
+    # Empties the piece's cells and those of the given kick candidate of its
+    # rotation, and blocks every earlier candidate, so that kick is the one
+    # taken. Returns False, with the stack untouched, if it cannot be carved
+    # that way.
+    target = (piece.rotation + direction) % len(piece.rotations)
+    offsets = rotation.offsets(piece.shape, piece.rotation, target, direction)
+    turned = Tetromino(piece.shape)
+    turned.rotation = target
+
+    def cells(tetromino, dx, dy):
+        return {(position[0] + dx + x, position[1] - dy + y)
+                for x, y in reference.matrix_cells(tetromino)}
+
+    def inside(cell):
+        return 0 <= cell[0] < board.width and 0 <= cell[1] < board.height
+
+    keep = cells(piece, 0, 0) | cells(turned, *offsets[kick])
+    if not all(inside(cell) for cell in keep):
+        return False
+    blocks = []
+    for dx, dy in offsets[:kick]:
+        blockers = cells(turned, dx, dy)
+        if not all(inside(cell) for cell in blockers):
+            continue  # A wall or the floor blocks it already
+        blockers -= keep
+        if not blockers:
+            return False
+        blocks.append(rng.choice(sorted(blockers)))
+    for x, y in keep:
+        empty(board, reference, x, y)
+    for x, y in blocks:
+        fill(board, reference, x, y)
+    return True
+
+
+class Divergence(Exception):
+    def __init__(self, step, field, expected, actual):
+        super().__init__(f"step {step}: {field} differs: reference {expected!r}, backend {actual!r}")
+        self.step = step
+        self.field = field
+        self.expected = expected
+        self.actual = actual
+
+
+class Fuzzer:
+    """Plays action sequences on a reference game and a backend game in lockstep.
+
+    The reference game uses ReferenceBoard and reference_rules(rules); the
+    backend game uses the backend board and `rules` as they are. Both games
+    are built once and restarted per sequence. Game state is
+    compared after every action; boards are compared whenever either one's
+    version changed, so a backend must bump `version` on every change (the
+    ghost cache relies on that too). run() raises Divergence at the first
+    difference, including one backend raising where the other did not.
+    """
+
+    def __init__(self, backend, rules=None):
+        self.now = 0.0
+        self.rules = rules if rules is not None else DEFAULT_RULES
+        self.reference = self.new_game(ReferenceBoard, reference_rules(self.rules))
+        self.game = self.new_game(backend, self.rules)
+        self.width = self.rules.board_width
+        self.kick_cases = kick_cases(self.reference.rules.rotation_system)
+
+    def new_game(self, board_factory, rules):
+        board = board_factory(rules.board_width, rules.board_height)
+        game = TetrisGame(headless=True, board=board, rules=rules)
+        game.time_source = self.clock
+        game.highscores = []  # Never qualifies for the (file-backed) table
+        return game
+
+    def clock(self):
+        return self.now
+
+    def run(self, seed, actions):
+        reference, game = self.reference, self.game
+        self.now = 0.0
+        reference.reset(seed)
+        game.reset(seed)
+        self.compare(-1)
+        reference_board, board = reference.board, game.board
+        reference_version, version = reference_board.version, board.version
+        for step, action in enumerate(actions):
+            self.now += WAIT_TIME if action == WAIT else FRAME_TIME
+            expected = actual = None
+            try:
+                play(reference, action)
+            except Exception as error:
+                expected = repr(error)
+            try:
+                play(game, action)
+            except Exception as error:
+                actual = repr(error)
+            if expected != actual:
+                raise Divergence(step, 'exception', expected, actual)
+            if expected is not None:
+                return  # Both failed the same way: nothing more to compare
+            # One packed state tuple per game per step; the boards only when
+            # either one changed
+            if game_state(reference) != game_state(game):
+                self.compare(step)
+            if reference_board.version != reference_version or board.version != version:
+                reference_version, version = reference_board.version, board.version
+                self.compare(step)
+
+    def compare(self, step):
+        expected, actual = game_state(self.reference), game_state(self.game)
+        for field, a, b in zip(STATE_FIELDS, expected, actual):
+            if a != b:
+                raise Divergence(step, field, a, b)
+        expected, actual = board_state(self.reference.board), board_state(self.game.board)
+        if expected[2] != actual[2]:
+            raise Divergence(step, 'filled cells', expected[2], actual[2])
+        for field, a, b in zip(('cells', 'colors'), expected, actual):
+            if a == b:
+                continue
+            for y, (row_a, row_b) in enumerate(zip(a, b)):
+                if list(row_a) != list(row_b):
+                    raise Divergence(step, f"{field} row {y}", list(row_a), list(row_b))
+
+    def spot_check(self, seed, count=SPOT_CHECKS):
+        """Checks rotation and scoring directly on `count` random stacks.
+
+        Random play seldom sets up T-spins, late kicks or all clears, so
+        every other check carves a random stack so that one kick case is
+        the first to fit (carve_kick()) and locks the piece where that kick
+        takes it. The cases are taken in turn from seed * count / 2 on, so
+        a few consecutive seeds cover every kick. The other checks put a
+        random piece on or inside a random stack, or into rows it completes
+        on an empty board. Each check compares every rotation of the piece
+        and the score of locking it (with a random or the carved last
+        rotation, and a random back-to-back state) between `rules` and
+        reference_rules(). The board is always GameBoard; backends are
+        checked by run(). Raises Divergence with the check's index as the
+        step.
+        """
+        rng = random.Random(seed)
+        rules, reference_rules = self.game.rules, self.reference.rules
+        width, height = rules.board_width, rules.board_height
+        # Reloaded for every check
+        board, reference = GameBoard(width, height), ReferenceBoard(width, height)
+        cases = self.kick_cases
+        for check in range(count):
+            # Every other check carves the next kick case; the rest sit the
+            # piece in, on or (mode > 0.6) dropped onto a stack, or complete
+            # rows on an empty board
+            carve = check % 2 == 0
+            mode = rng.random()
+            all_clear = not carve and mode < 0.2
+            if carve:
+                shape, rotation, kick_direction, kick = cases[(seed * count // 2 + check // 2) % len(cases)]
+            else:
+                shape = rng.choice(SHAPE_NAMES)
+                rotation = rng.randrange(len(SHAPES[shape]))
+            piece = Tetromino(shape)
+            piece.rotation = rotation
+            if all_clear:
+                # Rows that the piece will complete and nothing else
+                board.clear()
+                reference.clear()
+                position = [rng.randint(-2, width - 1), -2]
+            else:
+                random_stacks(rng, board, reference)
+                for _ in range(CARVE_TRIES):
+                    position = [rng.randint(-2, width - 1), rng.randint(-2, height - 1)]
+                    if not carve or carve_kick(rng, board, reference,
+                                                  reference_rules.rotation_system, piece, position,
+                                                  kick_direction, kick):
+                        break
+                else:
+                    continue
+            if reference.is_collision(piece, position):
+                continue
+            if all_clear or (not carve and mode > 0.6):
+                position[1] += reference.drop_distance(piece, position)
+            if all_clear:
+                cells = {(position[0] + x, position[1] + y) for x, y in reference.matrix_cells(piece)}
+                for y in {y for _, y in cells}:
+                    for x in range(width):
+                        if (x, y) not in cells:
+                            fill(board, reference, x, y)
+            for direction in (1, -1, 2):
+                results = []
+                for system, target in ((reference_rules.rotation_system, reference),
+                                       (rules.rotation_system, board)):
+                    moved = Tetromino(shape)
+                    moved.rotation = piece.rotation
+                    results.append((system.rotate(target, moved, list(position), direction),
+                                    moved.rotation))
+                if results[0] != results[1]:
+                    raise Divergence(check, f"{shape} rotation {piece.rotation} by {direction}",
+                                     *results)
+
+            last_rotation = rng.choice([None, (rng.choice((1, -1, 2)), rng.randrange(6))])
+            if carve:
+                # Lock it where the carved kick takes it, as a T-spin would
+                kicked = reference_rules.rotation_system.rotate(reference, piece, position,
+                                                                kick_direction)
+                if kicked is not None:
+                    position, used = kicked
+                    last_rotation = (kick_direction, used)
+            back_to_back = rng.random() < 0.5
+            reference.place_tetromino(piece, position)
+            board.place_tetromino(piece, position)
+            lines = reference.clear_lines()[0]
+            results = []
+            for scoring_rules, target in ((reference_rules, reference), (rules, board)):
+                game = SpotGame(scoring_rules, target, piece, list(position), last_rotation,
+                                back_to_back, 3)
+                results.append((scoring_rules.scoring.award(game, lines), game.back_to_back))
+            if results[0] != results[1]:
+                raise Divergence(check, f"{shape} lock at {position} after {last_rotation} scoring",
+                                 *results)
+
+    def diverges(self, seed, actions):
+        # Step of the first divergence, or None
+        try:
+            self.run(seed, actions)
+        except Divergence as divergence:
+            return divergence.step
+        return None
+
+    def shrink(self, seed, actions):
+        """Minimal action list that still diverges (delta debugging).
+
+        Cuts everything after the first divergence, then tries dropping
+        chunks of halving size, keeping any cut that still diverges.
+        Returns None if the whole sequence no longer diverges.
+        """
+        step = self.diverges(seed, actions)
+        if step is None:
+            return None
+        actions = actions[:step + 1]
+        chunk = max(1, len(actions) // 2)
+        while True:
+            removed = False
+            start = 0
+            while start < len(actions):
+                candidate = actions[:start] + actions[start + chunk:]
+                step = self.diverges(seed, candidate) if candidate else None
+                if step is not None:
+                    actions = candidate[:step + 1]
+                    removed = True
+                else:
+                    start += chunk
+            if not removed:
+                if chunk == 1:
+                    return actions
+                chunk //= 2
+
+
+def fuzz_batch(backend_name, first_seed, sequences, length, rules_name='default'):
+    """Fuzzes seeds [first_seed, first_seed + sequences).
+
+    Each seed plays one action sequence and runs spot_check(). Returns
+    (actions played, None) or, at the first divergence, (actions played,
+    (seed, minimal actions or None for a spot check, message)).
+    """
+    fuzzer = Fuzzer(load_backend(backend_name), RULE_SETS[rules_name])
+    played = 0
+    for seed in range(first_seed, first_seed + sequences):
+        actions = random_actions(random.Random(seed), length, fuzzer.width)
+        try:
+            fuzzer.run(seed, actions)
+        except Divergence as divergence:
+            minimal = fuzzer.shrink(seed, actions)
+            if minimal is not None:
+                try:
+                    fuzzer.run(seed, minimal)
+                except Divergence as shrunk:
+                    return played, (seed, minimal, str(shrunk))
+            # Depends on state left by earlier runs: report the whole sequence
+            return played, (seed, actions, f"{divergence} (does not reproduce on a rerun)")
+        try:
+            fuzzer.spot_check(seed)
+        except Divergence as divergence:
+            return played, (seed, None, str(divergence))
+        played += length
+    return played, None
+
+
+def report(backend_name, rules_name, failure):
+    seed, actions, message = failure
+    print(f"Divergence for backend {backend_name}, seed {seed}: {message}")
+    if actions is None:
+        print(f"Reproducer: Fuzzer(load_backend({backend_name!r}), RULE_SETS[{rules_name!r}])"
+              f".spot_check({seed})")
+        return
+    print(f"Minimal reproducer ({len(actions)} actions): "
+          f"Fuzzer(load_backend({backend_name!r}), RULE_SETS[{rules_name!r}])"
+          f".run({seed}, {actions!r})")
+    print("  " + " ".join(action_name(action) for action in actions))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Differential fuzzing of board backends, "
+                                                 "rotation and scoring against reference code")
+    parser.add_argument('--backend', default='gameboard',
+                        help=f"one of {', '.join(BACKENDS)}, or module:BoardClass")
+    parser.add_argument('--seed', type=int, default=0, help="first sequence seed")
+    parser.add_argument('--sequences', type=int, default=1000,
+                        help="sequences to run (ignored with --duration)")
+    parser.add_argument('--length', type=int, default=SEQUENCE_LENGTH, help="actions per sequence")
+    parser.add_argument('--duration', type=float, default=None,
+                        help="keep fuzzing for this many seconds instead")
+    parser.add_argument('--rules', choices=RULE_SETS, default='default')
+    parser.add_argument('--processes', type=int, default=1, help="0 for one per CPU")
+    args = parser.parse_args()
+
+    load_backend(args.backend)  # Fail fast on a bad name
+    processes = args.processes or os.cpu_count() or 1
+    started = time.perf_counter()
+    deadline = started + args.duration if args.duration is not None else None
+    played = 0
+
+    def batches():
+        first_seed, remaining = args.seed, args.sequences
+        while deadline is not None or remaining > 0:
+            count = BATCH_SEQUENCES if deadline is not None else min(BATCH_SEQUENCES, remaining)
+            yield first_seed, count
+            first_seed += count
+            remaining -= count
+
+    failure = None
+    if processes == 1:
+        for first_seed, count in batches():
+            actions, failure = fuzz_batch(args.backend, first_seed, count, args.length, args.rules)
+            played += actions
+            if failure is not None or (deadline is not None and time.perf_counter() >= deadline):
+                break
+    else:
+        with ProcessPoolExecutor(processes) as pool:
+            pending = deque()
+            for first_seed, count in batches():
+                pending.append(pool.submit(fuzz_batch, args.backend, first_seed, count, args.length,
+                                           args.rules))
+                if len(pending) < 2 * processes:
+                    continue
+                actions, failure = pending.popleft().result()
+                played += actions
+                if failure is not None or (deadline is not None and time.perf_counter() >= deadline):
+                    break
+            if failure is not None or deadline is not None:
+                # Stopped early: drop the batches that have not started
+                for future in pending:
+                    future.cancel()
+            for future in pending:
+                if not future.cancelled() and failure is None:
+                    actions, failure = future.result()
+                    played += actions
+
+    elapsed = time.perf_counter() - started
+    print(f"{played} actions in {elapsed:.1f} s ({played / elapsed:,.0f} actions/s), "
+          f"{played // args.length} sequences from seed {args.seed}, backend {args.backend}")
+    if failure is not None:
+        report(args.backend, args.rules, failure)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
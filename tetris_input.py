@@ -0,0 +1,122 @@
+import pygame
+
+# Held actions handled by the input engine
+MOVE_LEFT = 'left'
+MOVE_RIGHT = 'right'
+SOFT_DROP = 'soft_drop'
+
+KEY_ACTIONS = {
+    pygame.K_LEFT: MOVE_LEFT,
+    pygame.K_RIGHT: MOVE_RIGHT,
+    pygame.K_DOWN: SOFT_DROP,
+}
+
+# Longest stretch of time applied in one update, so a stall (window drag,
+# breakpoint, tab switch on the web) does not dump a burst of moves
+MAX_UPDATE_STEP = 0.25
+
+
+class InputHandler:
+    """Key-state based movement with DAS, ARR and soft drop.
+
+    Movement no longer relies on OS key repeat: the handler tracks which keys
+    are down and, on every logic update, turns the elapsed game time into
+    moves. A press moves the piece immediately (no waiting for the next
+    frame); holding it waits `das` seconds, then repeats every `arr` seconds
+    (0 = jump straight to the wall). Soft drop moves down at `soft_drop_factor`
+    times the current gravity. Timing uses the game's time source, so it
+    behaves the same on desktop, web and under a virtual clock.
+    """
+
+    def __init__(self, das=0.167, arr=0.033, soft_drop_factor=20):
+        self.das = das
+        self.arr = arr
+        self.soft_drop_factor = soft_drop_factor
+        self.reset()
+
+    def reset(self):
+        self.held = []  # Held directions, most recent last
+        self.soft_drop = False
+        self.das_elapsed = 0.0
+        self.arr_elapsed = 0.0
+        self.soft_drop_elapsed = 0.0
+        self.last_time = None
+
+    def handle_event(self, game, event):
+        # Returns True if the event was a movement key
+        if event.type not in (pygame.KEYDOWN, pygame.KEYUP):
+            return False
+        action = KEY_ACTIONS.get(event.key)
+        if action is None:
+            return False
+        if event.type == pygame.KEYDOWN:
+            self.press(game, action)
+        else:
+            self.release(action)
+        return True
+
+    def press(self, game, action):
+        if action == SOFT_DROP:
+            self.soft_drop = True
+            self.soft_drop_elapsed = 0.0
+            if not game.flash_lines:
+                game.move_down()
+            return
+        if action in self.held:
+            return
+        self.held.append(action)
+        self.das_elapsed = 0.0
+        self.arr_elapsed = 0.0
+        if not game.flash_lines:
+            self.shift(game, action)
+
+    def release(self, action):
+        if action == SOFT_DROP:
+            self.soft_drop = False
+        elif action in self.held:
+            was_active = self.held[-1] == action
+            self.held.remove(action)
+            if was_active:
+                # The other direction, if still held, takes over with fresh DAS
+                self.das_elapsed = 0.0
+                self.arr_elapsed = 0.0
+
+    def shift(self, game, action):
+        if action == MOVE_LEFT:
+            return game.move_left()
+        return game.move_right()
+
+    def update(self, game, now):
+        last_time, self.last_time = self.last_time, now
+        if last_time is None or game.flash_lines:
+            return
+        dt = min(MAX_UPDATE_STEP, now - last_time)
+
+        if self.held:
+            action = self.held[-1]
+            if self.das_elapsed < self.das:
+                self.das_elapsed += dt
+                # Time past the DAS threshold already counts towards auto-repeat
+                repeat_time = self.das_elapsed - self.das
+            else:
+                repeat_time = dt
+            if repeat_time >= 0:
+                if self.arr <= 0:
+                    while self.shift(game, action):
+                        pass
+                else:
+                    self.arr_elapsed += repeat_time
+                    while self.arr_elapsed >= self.arr:
+                        self.arr_elapsed -= self.arr
+                        if not self.shift(game, action):
+                            self.arr_elapsed = 0.0
+                            break
+
+        if self.soft_drop:
+            interval = game.drop_speed / self.soft_drop_factor
+            self.soft_drop_elapsed += dt
+            while self.soft_drop_elapsed >= interval:
+                self.soft_drop_elapsed -= interval
+                if not game.move_down():
+                    self.soft_drop_elapsed = 0.0
+                    break
@@ -0,0 +1,263 @@
+import argparse
+import bisect
+import http.server
+import random
+import threading
+import time
+
+# Histogram bucket upper bounds, in seconds
+FRAME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.0167, 0.025, 0.05, 0.1, 0.25, 1.0)
+WRITE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1, 1.0)
+MAX_LINES = 4  # Most lines one piece can clear
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    """Prometheus-style histogram: per-bucket counts (not cumulative), sum and count."""
+
+    __slots__ = ('bounds', 'counts', 'total', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # Last slot: above every bound
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.total += other.total
+        self.count += other.count
+
+
+class GameMetrics:
+    """One thread's share of the metrics.
+
+    Only the owning thread writes these fields, so the game's hot paths
+    update them with a plain `+= 1`: no lock, no shared cache line with other
+    threads' games. The registry adds all shards together when scraped.
+    """
+
+    __slots__ = ('games_started', 'games_over', 'moves_down', 'pieces_locked', 'line_clears',
+                 'frame_time', 'highscore_write')
+
+    def __init__(self):
+        self.games_started = 0
+        self.games_over = 0
+        self.moves_down = 0  # Gravity steps and soft drops, successful or not
+        self.pieces_locked = 0
+        self.line_clears = [0] * (MAX_LINES + 1)  # Clears by number of lines removed
+        self.frame_time = Histogram(FRAME_BUCKETS)
+        self.highscore_write = Histogram(WRITE_BUCKETS)
+
+
+class MetricsRegistry:
+    """Collects GameMetrics shards and serves them in the Prometheus text format.
+
+    attach() gives a game the shard of the calling thread, so call it on the
+    thread that runs the game. Games without a registry keep `metrics` None
+    and pay a single attribute check per hook.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+        self.shards = []
+        self.lock = threading.Lock()  # Only guards adding shards
+        self.server = None
+
+    def shard(self):
+        shard = getattr(self.local, 'shard', None)
+        if shard is None:
+            shard = self.local.shard = GameMetrics()
+            with self.lock:
+                self.shards.append(shard)
+        return shard
+
+    def attach(self, game):
+        shard = self.shard()
+        game.metrics = shard
+        if not game.game_over:
+            shard.games_started += 1  # Its reset() ran before it had metrics
+        return shard
+
+    def collect(self):
+        total = GameMetrics()
+        with self.lock:
+            shards = list(self.shards)
+        for shard in shards:
+            total.games_started += shard.games_started
+            total.games_over += shard.games_over
+            total.moves_down += shard.moves_down
+            total.pieces_locked += shard.pieces_locked
+            for lines, count in enumerate(shard.line_clears):
+                total.line_clears[lines] += count
+            total.frame_time.merge(shard.frame_time)
+            total.highscore_write.merge(shard.highscore_write)
+        return total, len(shards)
+
+    def render(self):
+        metrics, threads = self.collect()
+        out = []
+
+        def header(name, kind, help_text):
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+
+        def simple(name, kind, help_text, value):
+            header(name, kind, help_text)
+            out.append(f"{name} {value}")
+
+        def histogram(name, help_text, values):
+            header(name, 'histogram', help_text)
+            cumulative = 0
+            for bound, count in zip(values.bounds, values.counts):
+                cumulative += count
+                out.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+            # Buckets and count are read unlocked while the owning threads
+            # observe, so take +Inf and _count from the buckets themselves to
+            # keep them monotonic
+            cumulative += values.counts[-1]
+            out.append(f'{name}_bucket{{le="+Inf"}} {cumulative}')
+            out.append(f"{name}_sum {values.total}")
+            out.append(f"{name}_count {cumulative}")
+
+        simple('tetris_games_started_total', 'counter', "Games started.", metrics.games_started)
+        simple('tetris_games_over_total', 'counter', "Games that ended.", metrics.games_over)
+        simple('tetris_games_active', 'gauge', "Games started and not yet over.",
+               metrics.games_started - metrics.games_over)
+        simple('tetris_moves_down_total', 'counter', "Gravity steps and soft drops.",
+               metrics.moves_down)
+        simple('tetris_pieces_locked_total', 'counter', "Pieces placed.", metrics.pieces_locked)
+        header('tetris_line_clears_total', 'counter', "Line clears by number of lines removed.")
+        for lines in range(1, MAX_LINES + 1):
+            out.append(f'tetris_line_clears_total{{lines="{lines}"}} {metrics.line_clears[lines]}')
+        histogram('tetris_frame_seconds', "Frame (or server tick) time.", metrics.frame_time)
+        histogram('tetris_highscore_write_seconds', "Time to write the highscore file.",
+                  metrics.highscore_write)
+        simple('tetris_metrics_threads', 'gauge', "Threads that have reported metrics.", threads)
+        return '\n'.join(out) + '\n'
+
+    def serve(self, port=9108, host='127.0.0.1'):
+        # Serves GET /metrics from a daemon thread; returns the HTTP server
+        registry = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Scrapes every few seconds would flood the console
+
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        print(f"Metrics on http://{host}:{port}/metrics")
+        return self.server
+
+
+class _NullConnection:
+    # Swallows a room's messages, so a benchmark times the games and encoding only
+    def send(self, message):
+        pass
+
+
+def env_workload(steps, seed):
+    # TetrisEnv steps: one action and one gravity step each, nothing else
+    from tetris_env import TetrisEnv, NUM_ACTIONS  # NumPy, only for the benchmark
+    rng = random.Random(seed)
+    actions = [rng.randrange(NUM_ACTIONS) for _ in range(steps)]
+    env = TetrisEnv()
+    env.reset(seed=seed)
+    shard = MetricsRegistry().attach(env.game)
+
+    def run(metered):
+        env.game.metrics = shard if metered else None
+        env.reset(seed=seed)
+        step, reset = env.step, env.reset
+        start = time.perf_counter()
+        for action in actions:
+            if step(action)[2]:
+                reset()
+        return time.perf_counter() - start
+    return run
+
+
+def room_workload(steps, seed):
+    # Versus server rooms ticked at 60 Hz on their own clock, with about four
+    # random inputs per player per second; a finished match starts over
+    from tetris_server import Room, LEFT, HARD_DROP
+    registry = MetricsRegistry()
+    rng = random.Random(seed)
+    inputs = [[rng.randint(LEFT, HARD_DROP) if rng.random() < 4 / 60 else 0 for _ in range(2)]
+              for _ in range(steps)]
+
+    def run(metered):
+        room = None
+        start = time.perf_counter()
+        for actions in inputs:
+            if room is None or room.finished:
+                room = Room(0, seed)
+                room.metrics = registry if metered else None
+                for _ in range(2):
+                    room.add_player(_NullConnection())
+            for player, action in zip(room.players, actions):
+                if action:
+                    player.inputs.append(action)
+            room.step(1 / 60)
+        return time.perf_counter() - start
+    return run
+
+
+WORKLOADS = {'env': env_workload, 'rooms': room_workload}
+
+
+def benchmark(workload='env', steps=2000, rounds=600, seed=0):
+    """Steps per second of a workload without and with metrics.
+
+    Both modes replay the same seeded inputs in every round; rounds are
+    short and swap which mode goes first, so drift in machine speed cancels
+    out of each pair. Returns (best steps/s without metrics, best steps/s
+    with metrics, median fraction of throughput lost over the pairs).
+    """
+    run = WORKLOADS[workload](steps, seed)
+    best = [0.0, 0.0]
+    costs = []
+    for round_index in range(rounds):
+        rates = [0.0, 0.0]
+        for metered in ((0, 1), (1, 0))[round_index % 2]:
+            rates[metered] = steps / run(metered)
+            best[metered] = max(best[metered], rates[metered])
+        costs.append(1 - rates[1] / rates[0])
+    costs.sort()
+    return best[0], best[1], costs[len(costs) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput cost of the game metrics")
+    parser.add_argument('--workload', choices=WORKLOADS, nargs='+', default=list(WORKLOADS))
+    parser.add_argument('--steps', type=int, default=2000, help="env steps or room ticks per round")
+    parser.add_argument('--rounds', type=int, default=600, help="back-to-back pairs of rounds")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for workload in args.workload:
+        plain, metered, cost = benchmark(workload, args.steps, args.rounds, args.seed)
+        print(f"{workload:>6}: metrics off {plain:,.0f} steps/s, on {metered:,.0f} steps/s "
+              f"(best rounds); throughput cost {cost:+.2%} (median of {args.rounds} pairs)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import pygame
+
+# Functions timed while profiling: (owner attribute on the game or "", method name)
+HOT_PATHS = [
+    ('board', 'is_collision'),
+    ('board', 'remove_lines'),
+    ('', 'play_sound'),
+]
+
+
+class Profiler:
+    """Frame-phase and hot-path timers for TetrisGame.
+
+    While disabled nothing is wrapped and the run loop skips every timer, so
+    profiling costs nothing. enable() wraps the HOT_PATHS on the game instance
+    (shadowing the class methods) and disable() removes the wrappers again.
+    Timings are kept as Chrome trace events ("X" complete events, microseconds)
+    and can be written out with export_chrome_trace() for chrome://tracing or
+    Perfetto.
+    """
+
+    def __init__(self, window=300, max_trace_events=200000):
+        self.enabled = False
+        self.game = None
+        self.frame_times = deque(maxlen=window)  # ms per frame
+        self.phase_times = {}  # phase -> deque of ms per frame
+        self.current_phases = {}
+        self.trace = deque(maxlen=max_trace_events)
+        self.window = window
+        self.frame_start = 0
+        self.frame_count = 0
+        self.overlay_font = None
+        self.overlay_lines = []
+        self.overlay_surfaces = []
+        self.pid = os.getpid()
+
+    def enable(self, game):
+        if self.enabled:
+            return
+        self.game = game
+        for owner_name, name in HOT_PATHS:
+            owner = getattr(game, owner_name) if owner_name else game
+            setattr(owner, name, self.wrap(name, getattr(owner, name)))
+        self.enabled = True
+        self.frame_start = time.perf_counter_ns()
+
+    def disable(self):
+        if not self.enabled:
+            return
+        for owner_name, name in HOT_PATHS:
+            owner = getattr(self.game, owner_name) if owner_name else self.game
+            owner.__dict__.pop(name, None)
+        self.enabled = False
+
+    def toggle(self, game):
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable(game)
+
+    def wrap(self, name, func):
+        trace = self.trace
+        pid = self.pid
+        perf_counter_ns = time.perf_counter_ns
+
+        def timed(*args, **kwargs):
+            start = perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                end = perf_counter_ns()
+                trace.append((name, 'hot', start, end - start, pid, threading.get_ident()))
+        return timed
+
+    def begin(self):
+        return time.perf_counter_ns()
+
+    def end(self, phase, start):
+        end = time.perf_counter_ns()
+        self.current_phases[phase] = self.current_phases.get(phase, 0) + (end - start)
+        self.trace.append((phase, 'phase', start, end - start, self.pid, threading.get_ident()))
+
+    def end_frame(self):
+        now = time.perf_counter_ns()
+        self.frame_times.append((now - self.frame_start) / 1e6)
+        self.trace.append(('frame', 'frame', self.frame_start, now - self.frame_start,
+                           self.pid, threading.get_ident()))
+        self.frame_start = now
+        for phase, ns in self.current_phases.items():
+            history = self.phase_times.get(phase)
+            if history is None:
+                history = self.phase_times[phase] = deque(maxlen=self.window)
+            history.append(ns / 1e6)
+        self.current_phases = {}
+        self.frame_count += 1
+
+    def stats(self):
+        frames = sorted(self.frame_times)
+        if not frames:
+            return None
+        mean = sum(frames) / len(frames)
+        return {
+            'fps': 1000.0 / mean if mean else 0.0,
+            'p50': frames[len(frames) // 2],
+            'p99': frames[min(len(frames) - 1, int(len(frames) * 0.99))],
+            'phases': {phase: sum(history) / len(history)
+                       for phase, history in self.phase_times.items() if history},
+        }
+
+    def draw_overlay(self, screen):
+        if self.overlay_font is None:
+            self.overlay_font = pygame.font.SysFont('Arial', 14)
+        font = self.overlay_font
+        # Re-render the text a few times per second; blit the cached lines otherwise
+        if self.frame_count % 15 == 0 or not self.overlay_surfaces:
+            stats = self.stats()
+            if stats is None:
+                return
+            lines = [f"FPS {stats['fps']:.0f}",
+                     f"p50 {stats['p50']:.1f} ms  p99 {stats['p99']:.1f} ms"]
+            for phase, ms in sorted(stats['phases'].items()):
+                lines.append(f"{phase}: {ms:.2f} ms")
+            if lines != self.overlay_lines:
+                self.overlay_lines = lines
+                self.overlay_surfaces = [font.render(line, True, (255, 255, 0)) for line in lines]
+
+        height = sum(s.get_height() for s in self.overlay_surfaces)
+        width = max(s.get_width() for s in self.overlay_surfaces)
+        backdrop = pygame.Surface((width + 8, height + 8))
+        backdrop.set_alpha(180)
+        screen.blit(backdrop, (0, 0))
+        y = 4
+        for surface in self.overlay_surfaces:
+            screen.blit(surface, (4, y))
+            y += surface.get_height()
+
+    def export_chrome_trace(self, path):
+        events = [{'name': name, 'cat': cat, 'ph': 'X',
+                   'ts': start / 1000.0, 'dur': duration / 1000.0,
+                   'pid': pid, 'tid': tid}
+                  for name, cat, start, duration, pid, tid in self.trace]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        print(f"Wrote {len(events)} trace events to {path}")
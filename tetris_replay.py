@@ -0,0 +1,326 @@
+import argparse
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# Keep pygame's import banner off stdout, which may carry raw video
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import pygame
+
+from tetris import TetrisGame, SOUNDS, SOUND_VOLUMES, DEFAULT_RULES
+from tetris_snapshot import encode_game, decode_game, snapshot_rules
+from tetris_stats import GameStats
+
+# Pillow is optional: only animated GIF export needs it
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Replay file: header, the game snapshot the recording starts from (with RNG
+# state), then per frame its time since the start and the key events that
+# frame handled. Replaying runs the same handle_event()/step() code on a clock
+# that returns the recorded frame times, so it reproduces the game exactly.
+# The snapshot names the game's rule set, which the replay is played under.
+MAGIC = b'TRPL'
+FORMAT_VERSION = 2
+HEADER = struct.Struct('<4sHBII')  # magic, version, paused at start, snapshot length, frames
+FRAME = struct.Struct('<dH')  # seconds since the first frame, key events
+KEY_EVENT = struct.Struct('<BIHI')  # key down (1) or up (0), key, modifiers, unicode code point
+
+EXPORT_CHUNK_FRAMES = 120  # Video frames per pool task
+DEFAULT_TAIL = 2.0  # Seconds rendered after the last recorded frame (the game over screen)
+
+
+class Replay:
+    def __init__(self, start, paused=False, frames=None):
+        self.start = start  # encode_game() snapshot taken on the first frame
+        self.paused = paused
+        self.frames = frames if frames is not None else []  # [(time, [key event tuple])]
+
+    @property
+    def duration(self):
+        return self.frames[-1][0] if self.frames else 0.0
+
+    @property
+    def rules(self):
+        # Recordings of games with custom rules replay under the default ones
+        rules = snapshot_rules(self.start)
+        return rules if rules is not None else DEFAULT_RULES
+
+
+def write_replay(path, replay):
+    parts = [HEADER.pack(MAGIC, FORMAT_VERSION, replay.paused, len(replay.start), len(replay.frames)),
+             replay.start]
+    for frame_time, events in replay.frames:
+        parts.append(FRAME.pack(frame_time, len(events)))
+        parts += [KEY_EVENT.pack(*event) for event in events]
+    with open(path, 'wb') as f:
+        f.write(b''.join(parts))
+
+
+def read_replay(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version, paused, start_size, frame_count = HEADER.unpack_from(data)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError(f"{path} is not a replay of this format version")
+    offset = HEADER.size
+    start = data[offset:offset + start_size]
+    offset += start_size
+    frames = []
+    for _ in range(frame_count):
+        frame_time, event_count = FRAME.unpack_from(data, offset)
+        offset += FRAME.size
+        events = [KEY_EVENT.unpack_from(data, offset + i * KEY_EVENT.size) for i in range(event_count)]
+        offset += event_count * KEY_EVENT.size
+        frames.append((frame_time, events))
+    return Replay(start, bool(paused), frames)
+
+
+class ReplayRecorder:
+    """Records a windowed game for export; set as TetrisGame.recorder.
+
+    While recording, the game's clock is frozen at the start of each frame
+    (time_source returns the frame's time), which is what makes the key
+    events plus frame times enough to replay it. Recording stops and the file
+    is written when the game ends or the window is closed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.replay = None
+        self.start_time = None
+        self.frame_time = None
+        self.live_clock = None
+
+    def clock(self):
+        return self.frame_time
+
+    def begin_frame(self, game):
+        now = time.time()
+        if self.replay is None:
+            self.start_time = self.frame_time = now
+            self.live_clock = game.time_source
+            game.time_source = self.clock
+            self.replay = Replay(encode_game(game), game.paused)
+        elif game.game_over:
+            self.finish(game)
+            return
+        self.frame_time = now
+        self.replay.frames.append((now - self.start_time, []))
+
+    def record(self, event):
+        code = getattr(event, 'unicode', '')
+        self.replay.frames[-1][1].append((event.type == pygame.KEYDOWN, event.key, event.mod,
+                                          ord(code) if len(code) == 1 else 0))
+
+    def finish(self, game):
+        game.recorder = None
+        if self.replay is None:
+            return
+        game.time_source = self.live_clock
+        write_replay(self.path, self.replay)
+        print(f"Recorded {len(self.replay.frames)} frames ({self.replay.duration:.1f} s) to {self.path}")
+
+
+class ReplayPlayer:
+    """Steps a game through a recording the way run_frame() played it.
+
+    With a surface, the game renders into it with the same effects (popups)
+    as the window, but never opens one and plays no sounds.
+    """
+
+    def __init__(self, replay, surface=None):
+        self.frames = replay.frames
+        self.index = 0  # Next recorded frame
+        self.now = 0.0
+        self.game = game = TetrisGame(headless=True, rules=replay.rules)
+        game.time_source = self.clock
+        if surface is not None:
+            SOUNDS.update(dict.fromkeys(SOUND_VOLUMES))  # Sound effects become no-ops
+            game.init_graphics(surface)
+            game.subscribe_effects()
+        decode_game(replay.start, game)
+        game.paused = replay.paused
+        if surface is not None:
+            # Headless games track no stats; the video shows them from the first frame
+            game.stats = GameStats()
+            game.stats.reset(self.now)
+            game.stats.set_paused(game.paused, self.now)
+
+    def clock(self):
+        return self.now
+
+    def next_time(self):
+        # Time of the next frame; past the recording, frames keep coming at 60 FPS
+        if self.index < len(self.frames):
+            return self.frames[self.index][0]
+        return self.now + 1 / 60
+
+    def step(self):
+        game = self.game
+        self.now = self.next_time()
+        if self.index < len(self.frames):
+            for down, key, mod, code in self.frames[self.index][1]:
+                game.handle_event(pygame.event.Event(pygame.KEYDOWN if down else pygame.KEYUP,
+                                                     key=key, mod=mod, unicode=chr(code) if code else ''))
+        self.index += 1
+        game.step()
+
+
+_worker_state = None  # (path, player, next video frame) kept between a worker's tasks
+
+
+def _init_worker():
+    # Offscreen rendering needs no display or audio device
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+
+def render_frames(path, start, stop, fps, scale=1, png_pattern=None):
+    """Renders video frames [start, stop) of the replay at `path`.
+
+    Video frame k shows the game as drawn by the last recorded frame at or
+    before k / fps, so dropped frames in the recording do not change the
+    clip's timing. Returns the frames as RGB bytes, or writes them as PNGs
+    and returns how many. A worker keeps its player between tasks, and
+    tasks arrive in order, so it only simulates each stretch of game once.
+    """
+    global _worker_state
+    if _worker_state is not None and _worker_state[0] == path and _worker_state[2] <= start:
+        _, player, frame = _worker_state
+    else:
+        replay = read_replay(path)
+        surface = pygame.Surface((replay.rules.screen_width, replay.rules.screen_height))
+        player = ReplayPlayer(replay, surface)
+        frame = 0
+    game = player.game
+    surface = game.screen
+    if scale > 1:
+        size = (surface.get_width() * scale, surface.get_height() * scale)
+        output = pygame.Surface(size)
+
+    rendered = []
+    while frame < stop:
+        # Play every recorded frame up to this video frame's time
+        while player.next_time() <= frame / fps:
+            player.step()
+        if frame >= start:
+            game.render()
+            image = surface
+            if scale > 1:
+                pygame.transform.scale(surface, size, output)
+                image = output
+            if png_pattern is not None:
+                pygame.image.save(image, png_pattern % frame)
+            else:
+                rendered.append(pygame.image.tobytes(image, 'RGB'))
+        frame += 1
+    _worker_state = (path, player, frame)
+    return rendered if png_pattern is None else stop - start
+
+
+def export(path, output, fps=60, scale=1, processes=None, tail=DEFAULT_TAIL):
+    """Renders a replay to `output` and returns (frames, seconds taken).
+
+    output '-' streams raw RGB frames to stdout; a name ending in .png writes
+    a PNG sequence (a '%05d'-style pattern, or one is added to the name);
+    .gif writes an animated GIF (needs Pillow); anything else is encoded by
+    ffmpeg from a raw RGB pipe. Chunks of frames are rendered by a process
+    pool and written in order.
+    """
+    started = time.perf_counter()
+    replay = read_replay(path)
+    total = int((replay.duration + tail) * fps) + 1
+    width, height = replay.rules.screen_width * scale, replay.rules.screen_height * scale
+    processes = processes or os.cpu_count() or 1
+
+    png_pattern = None
+    sink = None
+    gif_frames = None
+    encoder = None
+    if output.lower().endswith('.png'):
+        png_pattern = output if '%' in output else output[:-4] + '_%05d.png'
+        directory = os.path.dirname(png_pattern)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    elif output.lower().endswith('.gif'):
+        if Image is None:
+            raise RuntimeError("GIF export needs Pillow (pip install pillow)")
+        gif_frames = []
+    elif output == '-':
+        sink = sys.stdout.buffer
+    else:
+        ffmpeg = shutil.which('ffmpeg')
+        if ffmpeg is None:
+            raise RuntimeError("ffmpeg not found; export to '-' and pipe the raw RGB into an encoder")
+        encoder = subprocess.Popen([ffmpeg, '-y', '-loglevel', 'error', '-f', 'rawvideo',
+                                    '-pix_fmt', 'rgb24', '-s', f'{width}x{height}', '-r', str(fps),
+                                    '-i', '-', '-pix_fmt', 'yuv420p', output],
+                                   stdin=subprocess.PIPE)
+        sink = encoder.stdin
+
+    def write(result):
+        if png_pattern is not None:
+            return
+        for data in result:
+            if gif_frames is not None:
+                gif_frames.append(Image.frombytes('RGB', (width, height), data).quantize(256))
+            else:
+                sink.write(data)
+
+    chunks = [(path, start, min(start + EXPORT_CHUNK_FRAMES, total), fps, scale, png_pattern)
+              for start in range(0, total, EXPORT_CHUNK_FRAMES)]
+    if processes == 1:
+        _init_worker()
+        for chunk in chunks:
+            write(render_frames(*chunk))
+    else:
+        # A bounded window of chunks in flight keeps memory flat for long games
+        with ProcessPoolExecutor(processes, initializer=_init_worker) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(render_frames, *chunk))
+                if len(pending) >= 2 * processes:
+                    write(pending.popleft().result())
+            while pending:
+                write(pending.popleft().result())
+
+    if gif_frames:
+        gif_frames[0].save(output, save_all=True, append_images=gif_frames[1:],
+                           duration=round(1000 / fps), loop=0)
+    if encoder is not None:
+        encoder.stdin.close()
+        encoder.wait()
+    elif sink is not None:
+        sink.flush()
+    return total, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a recorded game (tetris.py --record) to video")
+    parser.add_argument('replay')
+    parser.add_argument('output', help="'-' for raw RGB on stdout, NAME.png for a PNG sequence, "
+                                       "NAME.gif, or a video file for ffmpeg (e.g. clip.mp4)")
+    parser.add_argument('--fps', type=int, default=None, help="default 60, or 25 for GIFs")
+    parser.add_argument('--scale', type=int, default=1, help="integer upscale of the logical frame size")
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--tail', type=float, default=DEFAULT_TAIL,
+                        help="seconds to keep rendering after the recording ends")
+    args = parser.parse_args()
+
+    fps = args.fps or (25 if args.output.lower().endswith('.gif') else 60)
+    frames, elapsed = export(args.replay, args.output, fps, args.scale, args.processes, args.tail)
+    # stdout may carry the video, so the summary goes to stderr
+    print(f"Rendered {frames} frames ({frames / fps:.1f} s of video) in {elapsed:.2f} s, "
+          f"{frames / fps / elapsed:.1f}x real time", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# Rotation systems: how a rotation is resolved when the rotated piece collides.
+#
+# Rotation indexes follow Tetromino.rotate(): 0 = spawn, 1 = R (clockwise),
+# 2 = 180, 3 = L. The shapes in tetris.SHAPES are the SRS states (J, L, S, T
+# and Z shifted down one row inside the 4x4 box, which does not affect kicks),
+# so the standard SRS offsets apply unchanged.
+
+# Standard SRS kick offsets as (x, y) with y pointing up, per (from, to) state
+JLSTZ_KICKS = {
+    (0, 1): [(0, 0), (-1, 0), (-1, 1), (0, -2), (-1, -2)],
+    (1, 0): [(0, 0), (1, 0), (1, -1), (0, 2), (1, 2)],
+    (1, 2): [(0, 0), (1, 0), (1, -1), (0, 2), (1, 2)],
+    (2, 1): [(0, 0), (-1, 0), (-1, 1), (0, -2), (-1, -2)],
+    (2, 3): [(0, 0), (1, 0), (1, 1), (0, -2), (1, -2)],
+    (3, 2): [(0, 0), (-1, 0), (-1, -1), (0, 2), (-1, 2)],
+    (3, 0): [(0, 0), (-1, 0), (-1, -1), (0, 2), (-1, 2)],
+    (0, 3): [(0, 0), (1, 0), (1, 1), (0, -2), (1, -2)],
+}
+
+I_KICKS = {
+    (0, 1): [(0, 0), (-2, 0), (1, 0), (-2, -1), (1, 2)],
+    (1, 0): [(0, 0), (2, 0), (-1, 0), (2, 1), (-1, -2)],
+    (1, 2): [(0, 0), (-1, 0), (2, 0), (-1, 2), (2, -1)],
+    (2, 1): [(0, 0), (1, 0), (-2, 0), (1, -2), (-2, 1)],
+    (2, 3): [(0, 0), (2, 0), (-1, 0), (2, 1), (-1, -2)],
+    (3, 2): [(0, 0), (-2, 0), (1, 0), (-2, -1), (1, 2)],
+    (3, 0): [(0, 0), (1, 0), (-2, 0), (1, -2), (-2, 1)],
+    (0, 3): [(0, 0), (-1, 0), (2, 0), (-1, 2), (2, -1)],
+}
+
+# 180 degree rotation is not part of SRS; these are the common modern-guideline kicks
+HALF_TURN_KICKS = {
+    (0, 2): [(0, 0), (0, 1), (1, 1), (-1, 1), (1, 0), (-1, 0)],
+    (2, 0): [(0, 0), (0, -1), (-1, -1), (1, -1), (-1, 0), (1, 0)],
+    (1, 3): [(0, 0), (1, 0), (1, 2), (1, 1), (0, 2), (0, 1)],
+    (3, 1): [(0, 0), (-1, 0), (-1, 2), (-1, 1), (0, 2), (0, 1)],
+}
+
+NO_KICK = ((0, 0),)
+
+
+def build_kick_table(shape):
+    # (from, to) -> board offsets (dx, dy) with y pointing down, in test order
+    if shape == 'O':
+        return {(0, 0): NO_KICK}
+    quarter = I_KICKS if shape == 'I' else JLSTZ_KICKS
+    table = {}
+    for transitions in (quarter, HALF_TURN_KICKS):
+        for key, offsets in transitions.items():
+            table[key] = tuple((x, -y) for x, y in offsets)
+    return table
+
+
+class RotationSystem:
+    """Resolves rotations by trying candidate offsets until one fits.
+
+    Candidates come from precomputed per-(shape, from, to) tables, and each
+    costs exactly one board.is_collision() call. Subclasses only provide the
+    tables.
+    """
+
+    name = 'base'
+
+    def __init__(self):
+        # Stateless after construction, so one instance can be shared by many games
+        self.tables = {shape: self.build_table(shape) for shape in 'IOTSZJL'}
+
+    def build_table(self, shape):
+        raise NotImplementedError
+
+    def rotate(self, board, piece, position, direction=1):
+        # direction: 1 clockwise, -1 counter-clockwise, 2 for 180 degrees.
+        # Returns (new position, index of the kick used) and leaves the piece
+        # rotated, or returns None and leaves the piece untouched if every
+        # candidate collides.
+        num_rotations = len(piece.rotations)
+        start = piece.rotation
+        target = (start + direction) % num_rotations
+        kicks = self.tables[piece.shape].get((start, target), NO_KICK)
+
+        pos_x, pos_y = position
+        piece.rotation = target
+        for index, (dx, dy) in enumerate(kicks):
+            candidate = [pos_x + dx, pos_y + dy]
+            if not board.is_collision(piece, candidate):
+                return candidate, index
+        piece.rotation = start
+        return None
+
+
+class NoKickRotation(RotationSystem):
+    # The original behaviour: rotate in place or not at all
+    name = 'none'
+
+    def build_table(self, shape):
+        return {}
+
+
+class SRSRotation(RotationSystem):
+    name = 'srs'
+
+    def build_table(self, shape):
+        return build_kick_table(shape)
+
+
+ROTATION_SYSTEMS = {
+    NoKickRotation.name: NoKickRotation,
+    SRSRotation.name: SRSRotation,
+}
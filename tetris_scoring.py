@@ -0,0 +1,122 @@
+# Scoring systems: what each placed piece is worth.
+#
+# lock_piece() asks the rule set's scoring system for the base points of every
+# lock, before the combo multiplier. 'classic' scores line clears only;
+# 'guideline' adds T-spins (3-corner rule), all clears and back-to-back.
+#
+# Corner offsets assume the T rotations of tetris.SHAPES, whose centre is at
+# (1, 2) in the 4x4 box in every rotation.
+
+NO_SPIN = 0
+MINI_SPIN = 1
+FULL_SPIN = 2
+
+# The four cells diagonal to the T's centre, as (dx, dy) from the piece
+# position; corner i is bit i of a corner mask
+T_CORNERS = ((0, 1), (2, 1), (0, 3), (2, 3))  # Top-left, top-right, bottom-left, bottom-right
+# Per rotation (0 = spawn, R, 2, L): the two corners on the side the T points to
+T_FRONT_CORNERS = (0b0011, 0b1010, 0b1100, 0b0101)
+CORNER_COUNTS = tuple(bin(mask).count('1') for mask in range(16))
+TST_KICK = 4  # Index of the SRS kick that upgrades a mini T-spin to a full one
+
+# Guideline base points by lines cleared (multiplied by the level)
+SPIN_POINTS = {
+    MINI_SPIN: (100, 200, 400),
+    FULL_SPIN: (400, 800, 1200, 1600),
+}
+ALL_CLEAR_POINTS = (0, 800, 1200, 1800, 2000)
+BACK_TO_BACK_ALL_CLEAR = 3200  # Replaces ALL_CLEAR_POINTS[4] for a back-to-back tetris
+SPIN_NAMES = {NO_SPIN: '', MINI_SPIN: 'T-SPIN MINI', FULL_SPIN: 'T-SPIN'}
+LINE_NAMES = ('', 'SINGLE', 'DOUBLE', 'TRIPLE', 'TETRIS')
+
+
+class ScoringSystem:
+    """Turns a locked piece into base points.
+
+    award() runs once per lock, after the piece is placed and full rows are
+    found but before they are removed. It returns (points, label): points
+    times the level, before the multiplier, and a popup label for special
+    clears or None. Per-game state lives on the game, so one instance can be
+    shared by many games.
+    """
+
+    name = 'base'
+
+    def award(self, game, lines):
+        raise NotImplementedError
+
+
+class ClassicScoring(ScoringSystem):
+    # The original behaviour: the rule set's points per line count
+    name = 'classic'
+
+    def award(self, game, lines):
+        return game.rules.scoring_table[lines] * game.level, None
+
+
+class GuidelineScoring(ScoringSystem):
+    """T-spins, all clears and back-to-back on top of the line scores.
+
+    A T-spin needs a T whose last successful move was a rotation and at
+    least three occupied corners (walls and floor count); it is a full spin
+    if both front corners are occupied or the rotation used the TST kick,
+    otherwise a mini. Tetrises and T-spins that clear lines are difficult
+    clears; a difficult clear right after another (locks that clear nothing
+    do not break the chain) scores 1.5 times. The all-clear check compares
+    the board's filled-cell count with the rows being cleared, so it is O(1).
+    """
+
+    name = 'guideline'
+
+    def spin(self, game):
+        piece = game.current_tetromino
+        if piece.shape != 'T' or game.last_rotation is None:
+            return NO_SPIN
+        board = game.board
+        grid = board.grid
+        width, height = board.width, board.height
+        pos_x, pos_y = game.position
+        mask = 0
+        for bit, (dx, dy) in enumerate(T_CORNERS):
+            x = pos_x + dx
+            y = pos_y + dy
+            if x < 0 or x >= width or y >= height or (y >= 0 and grid[y][x]):
+                mask |= 1 << bit
+        if CORNER_COUNTS[mask] < 3:
+            return NO_SPIN
+        front = T_FRONT_CORNERS[piece.rotation]
+        direction, kick = game.last_rotation
+        if mask & front == front or (kick == TST_KICK and direction != 2):
+            return FULL_SPIN
+        return MINI_SPIN
+
+    def award(self, game, lines):
+        spin = self.spin(game)
+        if spin == MINI_SPIN and lines >= len(SPIN_POINTS[MINI_SPIN]):
+            spin = FULL_SPIN  # No mini triple: three rows always need the full shape
+        points = SPIN_POINTS[spin][lines] if spin else game.rules.scoring_table[lines]
+
+        names = []
+        if lines:
+            difficult = spin != NO_SPIN or lines == 4
+            back_to_back = difficult and game.back_to_back
+            game.back_to_back = difficult
+            if back_to_back:
+                points = points * 3 // 2
+                names.append('BACK-TO-BACK')
+            board = game.board
+            all_clear = board.filled == lines * board.width
+            if spin or back_to_back:
+                names.append(f"{SPIN_NAMES[spin]} {LINE_NAMES[lines]}".strip())
+            if all_clear:
+                points += BACK_TO_BACK_ALL_CLEAR if back_to_back and lines == 4 else ALL_CLEAR_POINTS[lines]
+                names.append('ALL CLEAR')
+        elif spin:
+            names.append(SPIN_NAMES[spin])
+        return points * game.level, ' '.join(names) or None
+
+
+SCORING_SYSTEMS = {
+    ClassicScoring.name: ClassicScoring,
+    GuidelineScoring.name: GuidelineScoring,
+}
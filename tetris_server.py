@@ -0,0 +1,584 @@
+import argparse
+import asyncio
+import random
+import struct
+import time
+from collections import deque
+
+from tetris import TetrisGame, SHAPES
+from tetris_events import LinesCleared
+from tetris_metrics import MetricsRegistry
+from tetris_snapshot import BoardEncoder, BoardDecoder
+
+# Wire format: every message is a little-endian struct starting with a type byte.
+# Over TCP each message is prefixed by its length (uint16); loopback and
+# WebSocket transports carry whole messages.
+
+# Client -> server
+MSG_JOIN = 1      # room id
+MSG_INPUT = 2     # action
+# Server -> client
+MSG_WELCOME = 10  # room id, player index
+MSG_START = 11    # piece seed shared by both players
+MSG_STATE = 12    # one player's board delta, see encode_state()
+MSG_GARBAGE = 13  # target player, lines sent
+MSG_GAME_OVER = 14  # winner
+
+JOIN = struct.Struct('<BI')
+INPUT = struct.Struct('<BB')
+WELCOME = struct.Struct('<BIB')
+START = struct.Struct('<BQ')
+STATE_HEADER = struct.Struct('<BBIIBBbb')  # type, player, tick, score, shape, rotation, x, y
+GARBAGE = struct.Struct('<BBB')
+GAME_OVER = struct.Struct('<BB')
+LENGTH = struct.Struct('<H')
+
+# Input actions
+LEFT = 1
+RIGHT = 2
+ROTATE_CW = 3
+ROTATE_CCW = 4
+ROTATE_180 = 5
+SOFT_DROP = 6
+HARD_DROP = 7
+HOLD = 8
+
+SHAPE_IDS = {shape: i + 1 for i, shape in enumerate(SHAPES)}
+
+# Garbage sent for 1-4 lines cleared at once
+GARBAGE_TABLE = (0, 0, 1, 2, 4)
+
+
+def encode_join(room_id):
+    return JOIN.pack(MSG_JOIN, room_id)
+
+
+def encode_input(action):
+    return INPUT.pack(MSG_INPUT, action)
+
+
+def encode_state(player, tick, game, board_data=b''):
+    # board_data: a tetris_snapshot board snapshot or delta, empty if the board
+    # did not change since the last state sent
+    piece = game.current_tetromino
+    return STATE_HEADER.pack(MSG_STATE, player, tick, game.score, SHAPE_IDS[piece.shape],
+                             piece.rotation, game.position[0], game.position[1]) + board_data
+
+
+def decode_state(message):
+    _, player, tick, score, shape, rotation, x, y = STATE_HEADER.unpack_from(message)
+    return {'player': player, 'tick': tick, 'score': score, 'shape': shape,
+            'rotation': rotation, 'position': (x, y),
+            'board': message[STATE_HEADER.size:]}
+
+
+class LoopbackConnection:
+    """One end of an in-process connection built on asyncio queues.
+
+    Messages sent during a tick are handed over as one batch by flush(), so
+    the receiving task wakes at most once per tick.
+    """
+
+    def __init__(self, inbox, outbox):
+        self.inbox = inbox
+        self.outbox = outbox
+        self.pending = []
+        self.received = []
+        self.closed = False
+
+    def send(self, message):
+        if not self.closed:
+            self.pending.append(message)
+
+    def flush(self):
+        if self.pending and not self.closed:
+            self.outbox.put_nowait(self.pending)
+            self.pending = []
+
+    async def drain(self):
+        pass
+
+    async def recv(self):
+        if not self.received:
+            batch = await self.inbox.get()
+            if batch is None:
+                self.closed = True
+                return None
+            batch.reverse()
+            self.received = batch
+        return self.received.pop()
+
+    def close(self):
+        if not self.closed:
+            self.flush()
+            self.closed = True
+            self.outbox.put_nowait(None)
+
+
+def loopback_pair():
+    a, b = asyncio.Queue(), asyncio.Queue()
+    return LoopbackConnection(a, b), LoopbackConnection(b, a)
+
+
+class TcpConnection:
+    """Length-prefixed messages over an asyncio stream."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.pending = []
+        self.closed = False
+
+    def send(self, message):
+        if not self.closed:
+            self.pending.append(LENGTH.pack(len(message)))
+            self.pending.append(message)
+
+    def flush(self):
+        # One write (and usually one packet) per tick
+        if self.pending and not self.closed:
+            self.writer.write(b''.join(self.pending))
+            self.pending = []
+
+    async def drain(self):
+        if not self.closed:
+            try:
+                await self.writer.drain()
+            except ConnectionError:
+                self.closed = True
+
+    async def recv(self):
+        try:
+            header = await self.reader.readexactly(LENGTH.size)
+            return await self.reader.readexactly(LENGTH.unpack(header)[0])
+        except (asyncio.IncompleteReadError, ConnectionError):
+            self.closed = True
+            return None
+
+    def close(self):
+        if not self.closed:
+            self.flush()
+            self.closed = True
+            self.writer.close()
+
+
+class WebSocketConnection:
+    """Binary WebSocket frames, one message per frame (needs `websockets`)."""
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.pending = []
+        self.outgoing = []
+        self.closed = False
+
+    def send(self, message):
+        if not self.closed:
+            self.pending.append(message)
+
+    def flush(self):
+        self.outgoing.extend(self.pending)
+        self.pending = []
+
+    async def drain(self):
+        outgoing, self.outgoing = self.outgoing, []
+        try:
+            for message in outgoing:
+                await self.websocket.send(message)
+        except Exception:
+            self.closed = True
+
+    async def recv(self):
+        try:
+            return await self.websocket.recv()
+        except Exception:
+            self.closed = True
+            return None
+
+    def close(self):
+        self.closed = True
+
+
+class Player:
+    def __init__(self, index, connection, game):
+        self.index = index
+        self.connection = connection
+        self.game = game
+        self.inputs = []
+        self.pending_garbage = 0
+        self.encoder = BoardEncoder(game.board)
+        self.sent_piece = None
+
+
+class Room:
+    """Two authoritative headless games sharing a piece seed and a clock."""
+
+    def __init__(self, room_id, seed):
+        self.room_id = room_id
+        self.seed = seed
+        self.players = []
+        self.now = 0.0
+        self.tick = 0
+        self.started = False
+        self.finished = False
+        self.garbage_rng = random.Random(seed)
+        self.spectators = None  # tetris_spectator channel watching this room
+        self.metrics = None  # Registry the players' games report to
+
+    def clock(self):
+        return self.now
+
+    def add_player(self, connection):
+        index = len(self.players)
+        game = TetrisGame(headless=True, seed=self.seed)
+        game.time_source = self.clock
+        game.last_drop_time = self.now
+        if self.metrics is not None:
+            self.metrics.attach(game)
+        player = Player(index, connection, game)
+        game.events.subscribe(LinesCleared,
+                              lambda event, player=player: self.send_garbage(player, event))
+        self.players.append(player)
+        connection.send(WELCOME.pack(MSG_WELCOME, self.room_id, index))
+        if len(self.players) == 2:
+            self.started = True
+            for p in self.players:
+                p.connection.send(START.pack(MSG_START, self.seed))
+        return player
+
+    def send_garbage(self, sender, event):
+        lines = GARBAGE_TABLE[min(event.lines, 4)]
+        if not lines:
+            return
+        for player in self.players:
+            if player is not sender:
+                player.pending_garbage += lines
+                self.broadcast(GARBAGE.pack(MSG_GARBAGE, player.index, lines))
+
+    def broadcast(self, message):
+        for player in self.players:
+            player.connection.send(message)
+        if self.spectators is not None:
+            self.spectators.publish(message)
+
+    def apply_input(self, game, action):
+        if game.flash_lines:
+            return  # The piece is already locked
+        if action == LEFT:
+            game.move_left()
+        elif action == RIGHT:
+            game.move_right()
+        elif action == ROTATE_CW:
+            game.rotate()
+        elif action == ROTATE_CCW:
+            game.rotate(-1)
+        elif action == ROTATE_180:
+            game.rotate(2)
+        elif action == SOFT_DROP:
+            game.move_down()
+        elif action == HARD_DROP:
+            game.hard_drop()
+        elif action == HOLD:
+            game.save_piece()
+
+    def apply_garbage(self, player):
+        game = player.game
+        lines, player.pending_garbage = player.pending_garbage, 0
+        hole_x = self.garbage_rng.randrange(game.board.width)
+        if game.board.add_garbage(lines, hole_x):
+            game.end_game()
+            return
+        # Lift the falling piece out of the new rows if needed
+        while game.board.is_collision(game.current_tetromino, game.position):
+            if game.position[1] <= -4:
+                game.end_game()
+                return
+            game.position = [game.position[0], game.position[1] - 1]
+
+    def step(self, dt):
+        self.now += dt
+        self.tick += 1
+        game_over = False
+        for player in self.players:
+            game = player.game
+            if player.inputs:
+                for action in player.inputs:
+                    if game.game_over:
+                        break
+                    self.apply_input(game, action)
+                player.inputs.clear()
+            if player.pending_garbage and not game.flash_lines and not game.game_over:
+                self.apply_garbage(player)
+            if not game.game_over:
+                game.update()
+            if game.events.pending:
+                game.events.flush()
+            self.send_state(player)
+            game_over = game_over or game.game_over
+
+        if game_over:
+            losers = [p for p in self.players if p.game.game_over]
+            winner = 255 if len(losers) == 2 else 1 - losers[0].index
+            self.broadcast(GAME_OVER.pack(MSG_GAME_OVER, winner))
+            self.finished = True
+
+    def send_state(self, player):
+        # The first state carries a full board snapshot, later ones only the
+        # rows that changed, and nothing is sent if neither the board nor the
+        # falling piece moved
+        game = player.game
+        piece = game.current_tetromino
+        piece_state = (piece, piece.rotation, game.position[0], game.position[1], game.score)
+        encoder = player.encoder
+        if encoder.rows is None:
+            board_data = encoder.snapshot()
+        else:
+            board_data = encoder.delta()
+            if board_data is None:
+                if piece_state == player.sent_piece:
+                    return
+                board_data = b''
+        player.sent_piece = piece_state
+        self.broadcast(encode_state(player.index, self.tick, game, board_data))
+
+
+class GameServer:
+    """Asyncio versus server: rooms of two, one tick loop for all rooms."""
+
+    def __init__(self, tick_rate=60):
+        self.tick_rate = tick_rate
+        self.rooms = {}
+        self.running = False
+        self.tick_times = deque(maxlen=100000)  # Seconds spent per server tick
+        self.hub = None  # tetris_spectator.SpectatorHub, fanned out once per tick
+        self.metrics = None  # tetris_metrics.MetricsRegistry for the rooms' games
+
+    def get_room(self, room_id):
+        room = self.rooms.get(room_id)
+        if room is None or room.finished:
+            room = self.rooms[room_id] = Room(room_id, random.getrandbits(63))
+            room.metrics = self.metrics
+        return room
+
+    async def handle_connection(self, connection):
+        message = await connection.recv()
+        if message is None or len(message) != JOIN.size or message[0] != MSG_JOIN:
+            connection.close()
+            return
+        room = self.get_room(JOIN.unpack(message)[1])
+        if len(room.players) >= 2:
+            room = self.get_room(random.getrandbits(32))
+        player = room.add_player(connection)
+        while True:
+            message = await connection.recv()
+            if message is None:
+                break
+            if not message or (message[0] == MSG_INPUT and len(message) != INPUT.size):
+                connection.close()  # Malformed: treat it as leaving
+                break
+            if message[0] == MSG_INPUT:
+                player.inputs.append(message[1])
+        # A player who leaves loses the match
+        if not room.finished:
+            player.game.end_game()
+        if not room.started:
+            # Nobody to play against yet: leave no lost game for the next joiner
+            room.players.remove(player)
+            connection.close()
+            if not room.players and self.rooms.get(room.room_id) is room:
+                del self.rooms[room.room_id]
+
+    async def run(self):
+        self.running = True
+        interval = 1.0 / self.tick_rate
+        next_tick = time.perf_counter()
+        while self.running:
+            start = time.perf_counter()
+            finished = []
+            for room_id, room in self.rooms.items():
+                if room.started and not room.finished:
+                    room.step(interval)
+                    if room.finished:
+                        finished.append((room_id, room))
+            if self.hub is not None:
+                self.hub.tick()
+            streams = []
+            for room in self.rooms.values():
+                for player in room.players:
+                    connection = player.connection
+                    connection.flush()
+                    if not isinstance(connection, LoopbackConnection):
+                        streams.append(connection)
+            if streams:
+                await asyncio.gather(*(c.drain() for c in streams))
+            for room_id, room in finished:
+                for player in room.players:
+                    player.connection.close()
+                # A join during the drain may have opened a new room under this id
+                if self.rooms.get(room_id) is room:
+                    del self.rooms[room_id]
+            tick_time = time.perf_counter() - start
+            self.tick_times.append(tick_time)
+            if self.metrics is not None:
+                self.metrics.shard().frame_time.observe(tick_time)
+
+            next_tick += interval
+            delay = next_tick - time.perf_counter()
+            if delay < -5 * interval:
+                # Far behind: drop the missed ticks instead of bursting through them
+                next_tick = time.perf_counter()
+            await asyncio.sleep(max(0.0, delay))
+
+    def stop(self):
+        self.running = False
+
+    def connect_loopback(self):
+        # Returns the client end of an in-process connection
+        client, server = loopback_pair()
+        asyncio.ensure_future(self.handle_connection(server))
+        return client
+
+    async def serve_tcp(self, host='127.0.0.1', port=7777):
+        async def on_connect(reader, writer):
+            await self.handle_connection(TcpConnection(reader, writer))
+        return await asyncio.start_server(on_connect, host, port)
+
+    async def serve_websocket(self, host='127.0.0.1', port=7778):
+        import websockets  # Optional dependency, only for browser clients
+
+        async def on_connect(websocket, *args):
+            await self.handle_connection(WebSocketConnection(websocket))
+        return await websockets.serve(on_connect, host, port)
+
+
+async def open_tcp_connection(host='127.0.0.1', port=7777):
+    reader, writer = await asyncio.open_connection(host, port)
+    return TcpConnection(reader, writer)
+
+
+class RemoteBoard:
+    """Client-side mirror of a player's board rebuilt from state deltas."""
+
+    def __init__(self):
+        self.decoder = BoardDecoder()
+        self.score = 0
+        self.piece = None
+
+    @property
+    def board(self):
+        return self.decoder.board
+
+    def apply(self, state):
+        if state['board']:
+            self.decoder.apply(state['board'])
+        self.score = state['score']
+        self.piece = (state['shape'], state['rotation'], state['position'])
+
+
+class LoadTestBot:
+    """A client that is polled instead of running its own task."""
+
+    def __init__(self, server, room_id):
+        self.server = server
+        self.room_id = room_id
+        self.boards = [RemoteBoard(), RemoteBoard()]
+        self.received = 0
+        self.matches = 0
+        self.join()
+
+    def join(self):
+        self.connection = self.server.connect_loopback()
+        self.connection.send(encode_join(self.room_id))
+        self.connection.flush()
+
+    def poll(self):
+        # Handle everything delivered since the last poll, without awaiting
+        inbox = self.connection.inbox
+        while not inbox.empty():
+            batch = inbox.get_nowait()
+            if batch is None:
+                # Match over and connection closed by the server: play again
+                self.matches += 1
+                self.join()
+                return
+            for message in batch:
+                self.received += len(message)
+                if message[0] == MSG_STATE:
+                    state = decode_state(message)
+                    self.boards[state['player']].apply(state)
+
+    def send_input(self, action):
+        self.connection.send(encode_input(action))
+        self.connection.flush()
+
+
+async def load_test(rooms=1000, seconds=10.0, tick_rate=60, inputs_per_second=4):
+    """Runs `rooms` concurrent matches between random bots over loopback.
+
+    All bots are driven from one task that polls their inboxes, so the
+    numbers are dominated by server work rather than by client task wakeups.
+    """
+    server = GameServer(tick_rate)
+    runner = asyncio.ensure_future(server.run())
+    rng = random.Random(0)
+    bots = [LoadTestBot(server, room_id) for room_id in range(rooms) for _ in range(2)]
+    # Clients poll less often than the server ticks; messages queue up in between
+    poll_rate = 30
+    input_chance = inputs_per_second / poll_rate
+
+    start = time.perf_counter()
+    room_samples = []
+    while time.perf_counter() - start < seconds:
+        for bot in bots:
+            bot.poll()
+            if rng.random() < input_chance:
+                bot.send_input(rng.randint(LEFT, HARD_DROP))
+        room_samples.append(sum(1 for room in server.rooms.values() if room.started))
+        await asyncio.sleep(1.0 / poll_rate)
+    elapsed = time.perf_counter() - start
+    server.stop()
+    await runner
+
+    times = sorted(server.tick_times)
+    print(f"rooms: {rooms} requested, {sum(room_samples) / len(room_samples):.0f} playing on average, "
+          f"{sum(bot.matches for bot in bots) // 2} matches finished")
+    print(f"ticks: {len(times)} ({len(times) / elapsed:.1f}/s, target {tick_rate}/s)")
+    print(f"tick time p50 {times[len(times) // 2] * 1000:.2f} ms  "
+          f"p99 {times[int(len(times) * 0.99)] * 1000:.2f} ms  "
+          f"budget {1000 / tick_rate:.2f} ms  server load {sum(times) / elapsed:.0%}")
+    print(f"bytes to clients: {sum(bot.received for bot in bots) / elapsed / 1024:.0f} KiB/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tetris versus server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7777)
+    parser.add_argument('--ws-port', type=int, default=None, help="also serve WebSocket clients")
+    parser.add_argument('--tick-rate', type=int, default=60)
+    parser.add_argument('--load-test', type=int, metavar='ROOMS', default=None,
+                        help="run a loopback load test with this many rooms and exit")
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="serve Prometheus metrics on this port")
+    args = parser.parse_args()
+
+    if args.load_test:
+        asyncio.run(load_test(args.load_test, args.seconds, args.tick_rate))
+        return
+
+    async def serve():
+        server = GameServer(args.tick_rate)
+        if args.metrics_port:
+            server.metrics = MetricsRegistry()
+            server.metrics.serve(args.metrics_port)
+        tcp = await server.serve_tcp(args.host, args.port)
+        print(f"Listening on {args.host}:{args.port}")
+        if args.ws_port:
+            await server.serve_websocket(args.host, args.ws_port)
+            print(f"WebSocket on {args.host}:{args.ws_port}")
+        async with tcp:
+            await server.run()
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
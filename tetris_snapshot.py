@@ -0,0 +1,343 @@
+import random
+import struct
+
+from tetris import (GameBoard, Tetromino, SHAPES, RULE_SETS, rule_set_name, CYAN, YELLOW,
+                    PURPLE, GREEN, RED, BLUE, ORANGE, GRAY)
+
+# Binary board and game-state snapshots, also the layout of tetris.py's save file.
+#
+# Board snapshot:  header, then every row as bitpacked occupancy (ceil(width / 8)
+#                  bytes, bit x = column x) followed by one color-index nibble per
+#                  cell (two cells per byte, low nibble first).
+# Board delta:     header with the sequence it applies on top of, a bitmap of the
+#                  changed rows, then the changed rows in the same row format.
+# Game snapshot:   a board snapshot plus pieces, position, score, timers and the
+#                  rule set's name, and optionally the RNG state, so a game can
+#                  be resumed exactly.
+
+MAGIC = b'TS'
+FORMAT_VERSION = 2
+KIND_BOARD = 1
+KIND_DELTA = 2
+KIND_GAME = 3
+
+# magic, format version, kind, width, height, sequence, base sequence (deltas)
+HEADER = struct.Struct('<2sBBBBII')
+
+# Color index 0 is an empty cell; 15 stands for any color not in the palette
+PALETTE = [None, CYAN, YELLOW, PURPLE, GREEN, RED, BLUE, ORANGE, GRAY]
+COLOR_INDEX = {color: i for i, color in enumerate(PALETTE) if color is not None}
+COLOR_INDEX[0] = 0
+OTHER_COLOR = 15
+
+SHAPE_NAMES = list(SHAPES)
+SHAPE_INDEX = {shape: i + 1 for i, shape in enumerate(SHAPE_NAMES)}  # 0 = no piece
+
+# score, level, lines, multiplier, prev multiplier, current/next/held (shape, rotation),
+# x, y, can save, game over, flash row count, drop speed, combo seconds left,
+# seconds since the last drop, lock seconds elapsed (-1 = not grounded), lock resets,
+# lowest row, back-to-back, last rotation (direction, 0 = none; kick), rule set name
+# (tetris.RULE_SETS, empty for custom rules), has RNG state
+GAME = struct.Struct('<QIIIIBBBBBBhhBBBddddBhBbb12sB')
+RNG_STATE = struct.Struct('<I625Id')  # random.Random state: version, key, gauss
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def row_size(width):
+    return (width + 7) // 8 + (width + 1) // 2
+
+
+def encode_row(occupancy, colors, width):
+    # occupancy: bytes of 0/1 per cell, colors: color per cell
+    bits = 0
+    for x in range(width):
+        if occupancy[x]:
+            bits |= 1 << x
+    out = bytearray(bits.to_bytes((width + 7) // 8, 'little'))
+    color_index = COLOR_INDEX
+    for x in range(0, width, 2):
+        low = color_index.get(colors[x], OTHER_COLOR) if occupancy[x] else 0
+        high = 0
+        if x + 1 < width and occupancy[x + 1]:
+            high = color_index.get(colors[x + 1], OTHER_COLOR)
+        out.append(low | high << 4)
+    return bytes(out)
+
+
+def decode_row(board, y, data, offset):
+    width = board.width
+    bit_bytes = (width + 7) // 8
+    bits = int.from_bytes(data[offset:offset + bit_bytes], 'little')
+    offset += bit_bytes
+    grid_row = board.grid[y]
+    color_row = board.colors[y]
+    for x in range(width):
+        nibble = data[offset + x // 2] >> (4 * (x & 1)) & 0xF
+        if bits >> x & 1:
+            grid_row[x] = 1
+            color_row[x] = PALETTE[nibble] if nibble < len(PALETTE) and nibble else GRAY
+        else:
+            grid_row[x] = 0
+            color_row[x] = 0
+    return offset + (width + 1) // 2
+
+
+def encode_rows(board):
+    width = board.width
+    cells = bytes(board.cells)
+    return [encode_row(cells[y * width:(y + 1) * width], board.colors[y], width)
+            for y in range(board.height)]
+
+
+def decode_rows(board, data, offset):
+    if len(data) < offset + board.height * row_size(board.width):
+        raise SnapshotError("truncated board snapshot")
+    for y in range(board.height):
+        offset = decode_row(board, y, data, offset)
+    board.recount()
+    board.version += 1
+    return offset
+
+
+def read_header(data, kind):
+    if len(data) < HEADER.size:
+        raise SnapshotError("snapshot too short")
+    magic, version, found_kind, width, height, sequence, base = HEADER.unpack_from(data)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise SnapshotError("not a snapshot of this format version")
+    if found_kind != kind:
+        raise SnapshotError(f"expected snapshot kind {kind}, got {found_kind}")
+    return width, height, sequence, base
+
+
+class BoardEncoder:
+    """Encodes one board as a snapshot followed by deltas.
+
+    Rows are re-encoded only when board.version changed since the last call,
+    and a delta carries just the rows whose encoding differs, so an idle
+    board costs one comparison per frame.
+    """
+
+    def __init__(self, board):
+        self.board = board
+        self.sequence = 0
+        self.rows = None  # Encoded rows as of the last snapshot/delta
+        self.version = None
+
+    def snapshot(self):
+        board = self.board
+        self.rows = encode_rows(board)
+        self.version = board.version
+        self.sequence += 1
+        return (HEADER.pack(MAGIC, FORMAT_VERSION, KIND_BOARD, board.width, board.height,
+                            self.sequence, 0)
+                + b''.join(self.rows))
+
+    def keyframe(self):
+        # Snapshot of the last encoded state without advancing the sequence, so
+        # a receiver joining mid-stream can follow the deltas from here on
+        board = self.board
+        return (HEADER.pack(MAGIC, FORMAT_VERSION, KIND_BOARD, board.width, board.height,
+                            self.sequence, 0)
+                + b''.join(self.rows))
+
+    def delta(self):
+        # Returns None when nothing changed since the last snapshot/delta
+        if self.rows is None:
+            raise SnapshotError("a delta needs a previous snapshot")
+        board = self.board
+        if board.version == self.version:
+            return None
+        rows = encode_rows(board)
+        changed = [y for y in range(board.height) if rows[y] != self.rows[y]]
+        self.rows = rows
+        self.version = board.version
+        if not changed:
+            return None
+        bitmap = 0
+        for y in changed:
+            bitmap |= 1 << y
+        base = self.sequence
+        self.sequence += 1
+        return b''.join([HEADER.pack(MAGIC, FORMAT_VERSION, KIND_DELTA, board.width,
+                                     board.height, self.sequence, base),
+                         bitmap.to_bytes((board.height + 7) // 8, 'little')]
+                        + [rows[y] for y in changed])
+
+
+class BoardDecoder:
+    """Rebuilds a board from a snapshot and the deltas that follow it."""
+
+    def __init__(self, board=None):
+        self.board = board
+        self.sequence = None
+
+    def apply_snapshot(self, data):
+        width, height, sequence, _ = read_header(data, KIND_BOARD)
+        if self.board is None or (self.board.width, self.board.height) != (width, height):
+            self.board = GameBoard(width, height)
+        offset = decode_rows(self.board, data, HEADER.size)
+        self.sequence = sequence
+        return offset
+
+    def apply_delta(self, data):
+        width, height, sequence, base = read_header(data, KIND_DELTA)
+        board = self.board
+        if board is None or (board.width, board.height) != (width, height):
+            raise SnapshotError("delta for a board this decoder has not seen")
+        if base != self.sequence:
+            # A delta was lost or reordered: the caller needs a new snapshot
+            raise SnapshotError(f"delta applies to sequence {base}, decoder is at {self.sequence}")
+        offset = HEADER.size
+        bitmap_size = (height + 7) // 8
+        bitmap = int.from_bytes(data[offset:offset + bitmap_size], 'little')
+        offset += bitmap_size
+        for y in range(height):
+            if bitmap >> y & 1:
+                offset = decode_row(board, y, data, offset)
+        board.recount()
+        board.version += 1
+        self.sequence = sequence
+        return offset
+
+    def apply(self, data):
+        # Snapshot or delta, whichever the data holds
+        if len(data) > 3 and data[3] == KIND_DELTA:
+            return self.apply_delta(data)
+        return self.apply_snapshot(data)
+
+
+def encode_board(board):
+    return BoardEncoder(board).snapshot()
+
+
+def decode_board(data, board=None):
+    decoder = BoardDecoder(board)
+    decoder.apply_snapshot(data)
+    return decoder.board
+
+
+def piece_fields(piece):
+    if piece is None:
+        return 0, 0
+    return SHAPE_INDEX[piece.shape], piece.rotation
+
+
+def make_piece(shape_index, rotation):
+    if not shape_index:
+        return None
+    piece = Tetromino(SHAPE_NAMES[shape_index - 1])
+    piece.rotation = rotation % len(piece.rotations)
+    return piece
+
+
+def game_snapshot_size(width, height):
+    # Largest encode_game() result for a board: four flashing rows and the RNG state
+    return HEADER.size + height * row_size(width) + GAME.size + 4 + RNG_STATE.size
+
+
+def encode_game(game, include_rng=True):
+    """Snapshot of a game's rules state (no surfaces, fonts or sounds)."""
+    now = game.time_source()
+    direction, kick = game.last_rotation if game.last_rotation is not None else (0, 0)
+    combo_left = max(0.0, game.combo_decay_time - (now - game.last_clear_time))
+    lock_elapsed = -1.0 if game.lock_start is None else now - game.lock_start
+    fields = GAME.pack(
+        game.score, game.level, game.lines_cleared, game.multiplier, game.prev_multiplier,
+        *piece_fields(game.current_tetromino), *piece_fields(game.next_tetromino),
+        *piece_fields(game.saved_tetromino),
+        game.position[0], game.position[1], game.can_save_piece, game.game_over,
+        len(game.flash_lines), game.drop_speed, combo_left, now - game.last_drop_time,
+        lock_elapsed, game.lock_resets, game.lowest_y, game.back_to_back, direction, kick,
+        rule_set_name(game.rules).encode(), include_rng)
+    board = game.board
+    parts = [HEADER.pack(MAGIC, FORMAT_VERSION, KIND_GAME, board.width, board.height, 0, 0)]
+    parts += encode_rows(board)
+    # Flashing rows and the RNG state follow the fixed fields
+    parts += [fields, bytes(game.flash_lines)]
+    if include_rng:
+        version, key, gauss = game.rng.getstate()
+        parts.append(RNG_STATE.pack(version, *key, gauss if gauss is not None else float('nan')))
+    return b''.join(parts)
+
+
+def read_game_fields(data):
+    # Header values and the GAME fields that follow the board rows
+    width, height, _, _ = read_header(data, KIND_GAME)
+    offset = HEADER.size + height * row_size(width)
+    if len(data) < offset + GAME.size:
+        raise SnapshotError("truncated game snapshot")
+    return width, height, GAME.unpack_from(data, offset)
+
+
+def snapshot_rules(data):
+    """The RULE_SETS entry a game snapshot was taken under, or None for custom rules."""
+    rules_name = read_game_fields(data)[2][-2].rstrip(b'\0').decode()
+    return RULE_SETS.get(rules_name)
+
+
+def decode_game(data, game):
+    """Restores a snapshot from encode_game() into an existing TetrisGame."""
+    width, height, fields = read_game_fields(data)
+    if (game.board.width, game.board.height) != (width, height):
+        raise SnapshotError("snapshot board size does not match the game's rules")
+    # Custom rules are not named, so only a named rule set can be checked
+    rules_name = fields[-2].rstrip(b'\0').decode()
+    if rules_name and rules_name != rule_set_name(game.rules):
+        raise SnapshotError(f"snapshot was taken under the {rules_name!r} rules")
+
+    (score, level, lines, multiplier, prev_multiplier,
+     current_shape, current_rotation, next_shape, next_rotation, held_shape, held_rotation,
+     x, y, can_save, game_over, flash_count, drop_speed, combo_left, since_drop,
+     lock_elapsed, lock_resets, lowest_y, back_to_back, direction, kick, _,
+     has_rng) = fields
+    # Check everything read below before the game is touched, so a damaged
+    # snapshot leaves it as it was
+    offset = HEADER.size + height * row_size(width) + GAME.size
+    if len(data) < offset + flash_count + (RNG_STATE.size if has_rng else 0):
+        raise SnapshotError("truncated game snapshot")
+    if not current_shape or not next_shape or max(current_shape, next_shape,
+                                                   held_shape) > len(SHAPE_NAMES):
+        raise SnapshotError("bad piece in game snapshot")
+    flash_lines = list(data[offset:offset + flash_count])
+    offset += flash_count
+    if any(row >= height for row in flash_lines):
+        raise SnapshotError("bad flashing row in game snapshot")
+    if has_rng:
+        rng_state = RNG_STATE.unpack_from(data, offset)
+        # random.Random.setstate() accepts only its own version and a key index <= 624
+        if rng_state[0] != random.Random.VERSION or rng_state[-2] > 624:
+            raise SnapshotError("bad RNG state in game snapshot")
+    decode_rows(game.board, data, HEADER.size)
+
+    now = game.time_source()
+    game.score = score
+    game.level = level
+    game.lines_cleared = lines
+    game.multiplier = multiplier
+    game.prev_multiplier = prev_multiplier
+    game.current_tetromino = make_piece(current_shape, current_rotation)
+    game.next_tetromino = make_piece(next_shape, next_rotation)
+    game.saved_tetromino = make_piece(held_shape, held_rotation)
+    game.position = [x, y]
+    game.can_save_piece = bool(can_save)
+    game.game_over = bool(game_over)
+    game.flash_lines = flash_lines
+    game.flash_start_time = now
+    game.drop_speed = drop_speed
+    game.last_clear_time = now - (game.combo_decay_time - combo_left) if combo_left > 0 else float('-inf')
+    game.last_drop_time = now - since_drop
+    game.lock_start = None if lock_elapsed < 0 else now - lock_elapsed
+    game.lock_resets = lock_resets
+    game.lowest_y = lowest_y
+    game.back_to_back = bool(back_to_back)
+    game.last_rotation = (direction, kick) if direction else None
+
+    if has_rng:
+        gauss = rng_state[-1]
+        game.rng.setstate((rng_state[0], tuple(rng_state[1:-1]),
+                           None if gauss != gauss else gauss))
+    return game
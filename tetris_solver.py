@@ -0,0 +1,428 @@
+import argparse
+import multiprocessing as mp
+import os
+import random
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import NamedTuple
+
+from tetris import GameBoard, Tetromino, SHAPES, SHAPE_ROTATIONS, DEFAULT_RULES
+
+# Perfect-clear solver.
+#
+# The field is a bitboard: one Python int, bit (y * width + x) set for a filled
+# cell, with y counted from the bottom. A perfect clear with k more pieces
+# needs filled + 4k cells to be exactly `lines` full rows, so the search picks
+# the line count up front and never lets a piece stick out above it. Pieces
+# are placed by hard drop (no tucks or spins), which is also what the finesse
+# keys reproduce.
+#
+# Pruning is sound, so "impossible" is a proof for that move model:
+# - Column parity. Line clears never move cells between columns, so the
+#   empty cells in even minus odd columns must be made up exactly by the
+#   remaining pieces: I contributes up to 4, T, L and J up to 2, O, S, Z 0.
+# - Hole regions. Every piece fills 4 connected empty cells. Cells in one
+#   row that touch stay neighbours, and any two empty cells in a column may
+#   become neighbours once the rows between them clear. Every group of
+#   columns linked that way must therefore hold a multiple of 4 empty cells.
+
+PIECE_PARITY = {'I': 4, 'T': 2, 'L': 2, 'J': 2, 'O': 0, 'S': 0, 'Z': 0}
+PARALLEL_MIN_PIECES = 8  # Shorter searches are faster than starting a pool
+DEADLINE_CHECK_NODES = 1024
+
+SOLVED = 'solved'
+IMPOSSIBLE = 'impossible'
+TIMEOUT = 'timeout'
+
+
+class Placement(NamedTuple):
+    shape: str
+    rotation: int
+    position: tuple  # TetrisGame position (x, y) of the piece's 4x4 box
+    hold: bool  # Hold was pressed before placing this piece
+    keys: tuple  # Finesse: fewest inputs from spawn, ending with 'hard_drop'
+
+
+class SolveResult(NamedTuple):
+    status: str  # SOLVED, IMPOSSIBLE or TIMEOUT
+    placements: list
+    nodes: int
+    elapsed: float
+
+
+def piece_masks(width):
+    # shape -> [(mask with the piece's bottom-left at bit 0, width, height,
+    # rotation index, PieceRotation)] for each distinct rotation
+    masks = {}
+    for shape, rotations in SHAPE_ROTATIONS.items():
+        seen = set()
+        masks[shape] = []
+        for index, rotation in enumerate(rotations):
+            mask = 0
+            for dx, dy in rotation.cells:
+                mask |= 1 << ((rotation.max_y - dy) * width + dx - rotation.min_x)
+            if mask in seen:
+                continue
+            seen.add(mask)
+            masks[shape].append((mask, rotation.width, rotation.height, index, rotation))
+    return masks
+
+
+def field_from_board(board):
+    field = 0
+    for y in range(board.height):
+        row = board.grid[board.height - 1 - y]
+        for x in range(board.width):
+            if row[x]:
+                field |= 1 << (y * board.width + x)
+    return field
+
+
+def field_from_rows(rows, width):
+    # rows: strings top to bottom, '#' or 'X' filled; they become the bottom rows
+    field = 0
+    for y, row in enumerate(reversed(rows)):
+        for x, cell in enumerate(row[:width]):
+            if cell in '#Xx':
+                field |= 1 << (y * width + x)
+    return field
+
+
+class Search:
+    """Depth-first search for one line count and piece count."""
+
+    def __init__(self, queue, width, pieces, hold=True, deadline=None, stop=None):
+        self.queue = queue
+        self.width = width
+        self.pieces = pieces
+        self.hold = hold
+        self.deadline = deadline
+        self.stop = stop  # multiprocessing.Event shared by parallel workers
+        self.masks = piece_masks(width)
+        self.full_row = (1 << width) - 1
+        self.even_columns = sum(1 << x for x in range(0, width, 2))
+        self.dead = set()  # (field, index, held) known to have no solution
+        self.nodes = 0
+        self.timed_out = False
+
+    def options(self, index, held):
+        # (shape to place, next index, next held, hold pressed)
+        queue = self.queue
+        if index >= len(queue):
+            return [(held, index, None, True)] if held else []
+        current = queue[index]
+        options = [(current, index + 1, held, False)]
+        if self.hold:
+            if held is None:
+                if index + 1 < len(queue):
+                    options.append((queue[index + 1], index + 2, current, True))
+            elif held != current:
+                options.append((held, index + 1, current, True))
+        return options
+
+    def placements(self, field, lines, shape):
+        # (new field, new line count, x, landing row, mask entry) for each hard drop
+        width = self.width
+        full_row = self.full_row
+        for entry in self.masks[shape]:
+            mask, piece_width, piece_height, _, _ = entry
+            top = lines - piece_height
+            if top < 0:
+                continue
+            for x in range(width - piece_width + 1):
+                shifted = mask << x
+                # Fall from just above the field, which is empty
+                y = lines
+                while y > 0 and not field & (shifted << ((y - 1) * width)):
+                    y -= 1
+                if y > top:
+                    continue  # Would stick out above the perfect-clear lines
+                placed = field | (shifted << (y * width))
+                new_lines = lines
+                for row in range(y + piece_height - 1, y - 1, -1):
+                    if (placed >> (row * width)) & full_row == full_row:
+                        low = placed & ((1 << (row * width)) - 1)
+                        placed = low | ((placed >> ((row + 1) * width)) << (row * width))
+                        new_lines -= 1
+                yield placed, new_lines, x, y, entry
+
+    def viable(self, field, lines, index, held, left):
+        width = self.width
+        area = (1 << (lines * width)) - 1
+        empty = ~field & area
+
+        # Column parity against what the pieces still to come can make up
+        even = sum(((empty >> (y * width)) & self.even_columns).bit_count() for y in range(lines))
+        imbalance = abs(2 * even - empty.bit_count())
+        available = list(self.queue[index:index + left + 1])
+        if held:
+            available.append(held)
+        capacity = sum(sorted((PIECE_PARITY[shape] for shape in available), reverse=True)[:left])
+        if imbalance > capacity:
+            return False
+
+        # Hole regions: union columns that share an empty run in some row
+        parent = list(range(width))
+
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        counts = [0] * width
+        full_row = self.full_row
+        for y in range(lines):
+            row = (empty >> (y * width)) & full_row
+            previous = False
+            for x in range(width):
+                if row >> x & 1:
+                    counts[x] += 1
+                    if previous:
+                        parent[find(x)] = find(x - 1)
+                    previous = True
+                else:
+                    previous = False
+        totals = {}
+        for x in range(width):
+            if counts[x]:
+                root = find(x)
+                totals[root] = totals.get(root, 0) + counts[x]
+        return all(total % 4 == 0 for total in totals.values())
+
+    def expired(self):
+        self.nodes += 1
+        if self.nodes % DEADLINE_CHECK_NODES:
+            return False
+        if (self.deadline is not None and time.time() > self.deadline) or \
+                (self.stop is not None and self.stop.is_set()):
+            self.timed_out = True
+        return self.timed_out
+
+    def children(self, field, lines, index, held, left):
+        # (placement record, child state) in search order
+        for shape, next_index, next_held, hold in self.options(index, held):
+            for placed, new_lines, x, y, entry in self.placements(field, lines, shape):
+                if placed == 0 and left > 1:
+                    continue  # Cleared early; this search wants exactly `pieces`
+                yield ((shape, entry, x, y, hold),
+                       (placed, new_lines, next_index, next_held, left - 1))
+
+    def run(self, field, lines, index, held, left):
+        # Returns the list of placement records, or None
+        if left == 0:
+            return [] if field == 0 else None
+        if self.timed_out or self.expired():
+            return None
+        key = (field, index, held)
+        if key in self.dead:
+            return None
+        for record, child in self.children(field, lines, index, held, left):
+            placed, new_lines, next_index, next_held, next_left = child
+            if next_left and not self.viable(placed, new_lines, next_index, next_held, next_left):
+                continue
+            rest = self.run(*child)
+            if rest is not None:
+                return [record] + rest
+            if self.timed_out:
+                return None
+        self.dead.add(key)
+        return None
+
+
+_worker_stop = None
+
+
+def _init_worker(stop):
+    global _worker_stop
+    _worker_stop = stop
+
+
+def _search_branch(queue, width, pieces, hold, deadline, record, child):
+    search = Search(queue, width, pieces, hold, deadline, _worker_stop)
+    rest = search.run(*child)
+    if rest is not None:
+        _worker_stop.set()
+        return [record] + rest, search.nodes, False
+    return None, search.nodes, search.timed_out
+
+
+def finesse(board, shape, rotation, position, rules=DEFAULT_RULES):
+    """Fewest inputs that bring `shape` from spawn to hard drop onto `position`.
+
+    Inputs are 'left', 'right', 'das_left', 'das_right' (shift to the wall),
+    'cw', 'ccw', '180' and the final 'hard_drop'. Rotations go through the
+    rules' rotation system, kicks included.
+    """
+    piece = Tetromino(shape)
+
+    def cells(rot, x, y):
+        piece.rotation = rot
+        return frozenset((x + dx, y + dy) for dx, dy in piece.get_cells())
+
+    piece.rotation = rotation
+    target = cells(rotation, *position)
+    start = (0, *rules.spawn_position)
+    previous = {start: None}
+    frontier = deque([start])
+    while frontier:
+        state = frontier.popleft()
+        rot, x, y = state
+        piece.rotation = rot
+        landing = (x, y + board.drop_distance(piece, [x, y]))
+        if cells(rot, *landing) == target:
+            keys = ['hard_drop']
+            while previous[state] is not None:
+                state, key = previous[state]
+                keys.append(key)
+            return tuple(reversed(keys))
+        moves = []
+        for key, dx in (('left', -1), ('right', 1)):
+            piece.rotation = rot
+            if not board.is_collision(piece, [x + dx, y]):
+                moves.append((key, (rot, x + dx, y)))
+                shift = x + dx
+                while not board.is_collision(piece, [shift + dx, y]):
+                    shift += dx
+                moves.append(('das_' + key, (rot, shift, y)))
+        for key, direction in (('cw', 1), ('ccw', -1), ('180', 2)):
+            piece.rotation = rot
+            result = rules.rotation_system.rotate(board, piece, [x, y], direction)
+            if result is not None:
+                (new_x, new_y), _ = result
+                moves.append((key, (piece.rotation, new_x, new_y)))
+        for key, next_state in moves:
+            if next_state not in previous:
+                previous[next_state] = (state, key)
+                frontier.append(next_state)
+    return None
+
+
+def replay(board, records, rules=DEFAULT_RULES):
+    # Turns search records into Placements by playing them on a copy of `board`
+    work = GameBoard(board.width, board.height)
+    work.load(board.cells)
+    placements = []
+    for shape, entry, x, y, hold in records:
+        _, _, _, rotation, shape_rotation = entry
+        position = (x - shape_rotation.min_x,
+                    board.height - 1 - y - shape_rotation.max_y)
+        keys = finesse(work, shape, rotation, position, rules)
+        piece = Tetromino(shape)
+        piece.rotation = rotation
+        work.place_tetromino(piece, list(position))
+        work.remove_lines(work.clear_lines()[1])
+        placements.append(Placement(shape, rotation, position, hold, keys))
+    return placements
+
+
+def solve(board, queue, max_pieces=None, hold=True, held=None, time_budget=10.0,
+          processes=None, rules=DEFAULT_RULES):
+    """Finds a perfect clear of `board` using pieces from `queue`, in order.
+
+    Tries every piece count up to `max_pieces` (default: the whole queue,
+    plus the held piece) that can add up to whole lines, fewest pieces first.
+    Returns SOLVED with the placements, IMPOSSIBLE once the search is
+    exhaustive, or TIMEOUT when `time_budget` seconds run out. Searches of at
+    least PARALLEL_MIN_PIECES pieces split their first move across
+    `processes` worker processes (default: one per CPU).
+    """
+    start = time.time()
+    deadline = start + time_budget
+    queue = list(queue)
+    width = board.width
+    field = field_from_board(board)
+    filled = field.bit_count()
+    height = (field.bit_length() + width - 1) // width
+    if max_pieces is None:
+        max_pieces = len(queue) + (1 if held else 0)
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    nodes = 0
+    for pieces in range(1, max_pieces + 1):
+        if (filled + 4 * pieces) % width:
+            continue
+        lines = (filled + 4 * pieces) // width
+        if lines < height or lines > board.height:
+            continue
+        if processes > 1 and pieces >= PARALLEL_MIN_PIECES:
+            records, searched, timed_out = solve_parallel(
+                queue, width, pieces, hold, held, field, lines, deadline, processes)
+        else:
+            search = Search(queue, width, pieces, hold, deadline)
+            records = search.run(field, lines, 0, held, pieces)
+            searched, timed_out = search.nodes, search.timed_out
+        nodes += searched
+        if records is not None:
+            return SolveResult(SOLVED, replay(board, records, rules), nodes, time.time() - start)
+        if timed_out:
+            return SolveResult(TIMEOUT, [], nodes, time.time() - start)
+    return SolveResult(IMPOSSIBLE, [], nodes, time.time() - start)
+
+
+def solve_parallel(queue, width, pieces, hold, held, field, lines, deadline, processes):
+    # One task per first placement; the first solution stops the others
+    search = Search(queue, width, pieces, hold, deadline)
+    branches = [(record, child) for record, child in search.children(field, lines, 0, held, pieces)
+                if not child[-1] or search.viable(*child)]
+    context = mp.get_context()
+    stop = context.Event()
+    nodes = 0
+    timed_out = False
+    with ProcessPoolExecutor(processes, mp_context=context, initializer=_init_worker,
+                             initargs=(stop,)) as pool:
+        pending = {pool.submit(_search_branch, queue, width, pieces, hold, deadline, record, child)
+                   for record, child in branches}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                records, searched, branch_timed_out = future.result()
+                nodes += searched
+                if records is not None:
+                    stop.set()
+                    for other in pending:
+                        other.cancel()
+                    return records, nodes, False
+                timed_out = timed_out or (branch_timed_out and not stop.is_set())
+    return None, nodes, timed_out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perfect-clear solver")
+    parser.add_argument('--queue', default=None,
+                        help="piece queue, e.g. IOTLJSZ (default: a random 11-piece bag queue)")
+    parser.add_argument('--rows', nargs='*', default=[],
+                        help="bottom board rows, top to bottom, '#' filled and '.' empty")
+    parser.add_argument('--pieces', type=int, default=None, help="most pieces to use")
+    parser.add_argument('--no-hold', action='store_true')
+    parser.add_argument('--budget', type=float, default=10.0, help="time budget in seconds")
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    rules = DEFAULT_RULES
+    queue = args.queue
+    if queue is None:
+        rng = random.Random(args.seed)
+        bags = [rng.sample(list(SHAPES), len(SHAPES)) for _ in range(2)]
+        queue = ''.join(bags[0] + bags[1])[:11]
+    board = GameBoard(rules.board_width, rules.board_height)
+    field = field_from_rows(args.rows, board.width)
+    for y in range(board.height):
+        for x in range(board.width):
+            if field >> (y * board.width + x) & 1:
+                board.set_cell(x, board.height - 1 - y, True)
+
+    result = solve(board, queue, args.pieces, not args.no_hold, time_budget=args.budget,
+                   processes=args.processes, rules=rules)
+    print(f"Queue {queue}: {result.status} after {result.nodes} nodes in {result.elapsed:.2f} s")
+    for placement in result.placements:
+        hold = "hold, " if placement.hold else ""
+        print(f"  {placement.shape} rotation {placement.rotation} at {placement.position}: "
+              f"{hold}{' '.join(placement.keys)}")
+
+
+if __name__ == "__main__":
+    main()
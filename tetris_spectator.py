@@ -0,0 +1,275 @@
+import argparse
+import asyncio
+import gc
+import random
+import struct
+import time
+import tracemalloc
+from collections import deque
+
+from tetris_server import (GameServer, LoadTestBot, RemoteBoard, TcpConnection, MSG_STATE,
+                           LEFT, HARD_DROP, encode_state, decode_state)
+from tetris_snapshot import SnapshotError
+
+# Viewer -> hub: watch a room. Everything after that flows hub -> viewer and
+# uses the versus server's message formats (MSG_STATE, MSG_GARBAGE, MSG_GAME_OVER).
+MSG_WATCH = 3
+WATCH = struct.Struct('<BI')
+
+
+def encode_watch(room_id):
+    return WATCH.pack(MSG_WATCH, room_id)
+
+
+class Viewer:
+    """One spectator: a bounded queue of per-tick message batches."""
+
+    __slots__ = ('room_id', 'queue', 'keyframes')
+
+    def __init__(self, room_id, max_queue):
+        self.room_id = room_id
+        self.queue = asyncio.Queue(max_queue)
+        self.keyframes = 0  # Times the viewer fell behind and was resynced
+
+    def drop_backlog(self):
+        queue = self.queue
+        while not queue.empty():
+            queue.get_nowait()
+
+
+class Channel:
+    """The viewers of one room and the messages the room broadcast this tick."""
+
+    def __init__(self, room_id):
+        self.room_id = room_id
+        self.room = None
+        self.viewers = []
+        self.batch = []
+        self.cached_keyframe = None
+
+    def attach(self, room):
+        if self.room is not None:
+            self.room.spectators = None
+        self.room = room
+        self.cached_keyframe = None
+        if room is not None:
+            room.spectators = self
+
+    def publish(self, message):
+        # Called by Room.broadcast; the same bytes go to every viewer
+        self.batch.append(message)
+
+    def keyframe(self):
+        # Full boards of both players at the encoders' current sequences, built
+        # at most once per tick however many viewers need it
+        if self.cached_keyframe is None:
+            room = self.room
+            self.cached_keyframe = [
+                encode_state(player.index, room.tick, player.game, player.encoder.keyframe())
+                for player in room.players if player.encoder.rows is not None]
+        return self.cached_keyframe
+
+
+class SpectatorHub:
+    """Fans each room's state deltas out to any number of viewers.
+
+    Rooms are encoded once by the server; the hub only collects the messages
+    a room broadcast during a tick and hands the same batch object to every
+    viewer's bounded queue, so a viewer costs a queue slot per buffered tick
+    rather than a copy of the stream. A viewer whose queue is full has its
+    backlog dropped and gets a keyframe (full boards at the current delta
+    sequence) instead, after which the regular deltas apply again.
+    """
+
+    def __init__(self, server, max_queue=120):
+        self.server = server
+        self.max_queue = max_queue
+        self.channels = {}
+        self.tick_times = deque(maxlen=100000)
+        server.hub = self
+
+    def watch(self, room_id):
+        channel = self.channels.get(room_id)
+        if channel is None:
+            channel = self.channels[room_id] = Channel(room_id)
+            channel.attach(self.server.rooms.get(room_id))
+        viewer = Viewer(room_id, self.max_queue)
+        channel.viewers.append(viewer)
+        if channel.room is not None and channel.room.started:
+            # Joining mid-match: start from the current boards
+            viewer.queue.put_nowait(channel.keyframe())
+        return viewer
+
+    def unwatch(self, viewer):
+        channel = self.channels.get(viewer.room_id)
+        if channel is None:
+            return
+        channel.viewers.remove(viewer)
+        if not channel.viewers:
+            channel.attach(None)
+            del self.channels[viewer.room_id]
+
+    def tick(self):
+        # Called by GameServer.run after every room has stepped
+        start = time.perf_counter()
+        rooms = self.server.rooms
+        for room_id, channel in self.channels.items():
+            room = rooms.get(room_id)
+            if room is not channel.room:
+                # The match ended and a new one started under the same id
+                channel.attach(room)
+            if not channel.batch:
+                continue
+            batch, channel.batch = channel.batch, []
+            channel.cached_keyframe = None
+            for viewer in channel.viewers:
+                queue = viewer.queue
+                if queue.full():
+                    viewer.drop_backlog()
+                    viewer.keyframes += 1
+                    queue.put_nowait(channel.keyframe())
+                else:
+                    queue.put_nowait(batch)
+        self.tick_times.append(time.perf_counter() - start)
+
+    async def handle_connection(self, connection):
+        message = await connection.recv()
+        if message is None or len(message) != WATCH.size or message[0] != MSG_WATCH:
+            connection.close()
+            return
+        viewer = self.watch(WATCH.unpack(message)[1])
+        # Also notice a viewer leaving while its room is idle or over, when
+        # nothing would ever be queued to wake the loop below
+        reader = asyncio.ensure_future(self.wait_closed(connection, viewer))
+        try:
+            while not connection.closed:
+                batch = await viewer.queue.get()
+                if batch is None:
+                    break
+                for message in batch:
+                    connection.send(message)
+                connection.flush()
+                # A slow socket blocks here and the viewer's queue fills up
+                await connection.drain()
+        finally:
+            reader.cancel()
+            self.unwatch(viewer)
+            connection.close()
+
+    async def wait_closed(self, connection, viewer):
+        # Viewers send nothing after MSG_WATCH; recv() returns None once they go
+        while await connection.recv() is not None:
+            pass
+        viewer.drop_backlog()
+        viewer.queue.put_nowait(None)
+
+    async def serve_tcp(self, host='127.0.0.1', port=7779):
+        async def on_connect(reader, writer):
+            await self.handle_connection(TcpConnection(reader, writer))
+        return await asyncio.start_server(on_connect, host, port)
+
+
+async def load_test(viewer_counts=(100, 1000, 10000), rooms=20, seconds=5.0, tick_rate=60,
+                    max_queue=16):
+    """Measures hub memory per viewer as the number of viewers grows.
+
+    Every tenth viewer stalls, reading its queue only every `stall` seconds,
+    so it overflows `max_queue` and exercises the keyframe path. The first
+    two viewers of each room (one fast, one stalling) decode everything they
+    receive, which checks that the deltas still apply after a keyframe.
+    Streaming memory counts only allocations made by the hub and its queues,
+    not the games.
+    """
+    rng = random.Random(0)
+    poll_rate = 30
+    stall = 3
+    input_chance = 4 / poll_rate
+    print(f"{'viewers':>8} {'joined B/viewer':>16} {'streaming B/viewer':>19} "
+          f"{'fan-out p50/p99 ms':>19} {'keyframes':>10} {'errors':>7}")
+    for count in viewer_counts:
+        server = GameServer(tick_rate)
+        hub = SpectatorHub(server, max_queue)
+        runner = asyncio.ensure_future(server.run())
+        bots = [LoadTestBot(server, room_id) for room_id in range(rooms) for _ in range(2)]
+        while sum(1 for room in server.rooms.values() if room.started) < rooms:
+            await asyncio.sleep(0.01)
+
+        gc.collect()
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        viewers = [hub.watch(i % rooms) for i in range(count)]
+        joined = tracemalloc.get_traced_memory()[0] - base
+        slow = [(i // rooms) % 10 == 1 for i in range(count)]
+        mirrors = {i: [RemoteBoard(), RemoteBoard()] for i in range(min(count, 2 * rooms))}
+        errors = 0
+
+        start = time.perf_counter()
+        polls = 0
+        while time.perf_counter() - start < seconds:
+            polls += 1
+            for bot in bots:
+                bot.poll()
+                if rng.random() < input_chance:
+                    bot.send_input(rng.randint(LEFT, HARD_DROP))
+            for i, viewer in enumerate(viewers):
+                if slow[i] and polls % (stall * poll_rate):
+                    continue
+                queue = viewer.queue
+                boards = mirrors.get(i)
+                while not queue.empty():
+                    batch = queue.get_nowait()
+                    if boards is None:
+                        continue
+                    for message in batch:
+                        if message[0] == MSG_STATE:
+                            state = decode_state(message)
+                            try:
+                                boards[state['player']].apply(state)
+                            except SnapshotError:
+                                errors += 1
+            await asyncio.sleep(1.0 / poll_rate)
+        hub_files = [tracemalloc.Filter(True, __file__), tracemalloc.Filter(True, asyncio.queues.__file__)]
+        snapshot = tracemalloc.take_snapshot().filter_traces(hub_files)
+        streaming = sum(stat.size for stat in snapshot.statistics('filename'))
+        tracemalloc.stop()
+        server.stop()
+        await runner
+        for bot in bots:
+            bot.connection.close()
+        await asyncio.sleep(0)
+
+        times = sorted(hub.tick_times)
+        print(f"{count:>8} {joined / count:>16.0f} {streaming / count:>19.0f} "
+              f"{times[len(times) // 2] * 1000:>9.2f} {times[int(len(times) * 0.99)] * 1000:>9.2f} "
+              f"{sum(v.keyframes for v in viewers):>10} {errors:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tetris versus server with spectators")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7777)
+    parser.add_argument('--spectator-port', type=int, default=7779)
+    parser.add_argument('--tick-rate', type=int, default=60)
+    parser.add_argument('--load-test', type=int, nargs='+', metavar='VIEWERS', default=None,
+                        help="measure memory per viewer for these viewer counts and exit")
+    parser.add_argument('--rooms', type=int, default=20)
+    parser.add_argument('--seconds', type=float, default=3.0)
+    args = parser.parse_args()
+
+    if args.load_test:
+        asyncio.run(load_test(args.load_test, args.rooms, args.seconds, args.tick_rate))
+        return
+
+    async def serve():
+        server = GameServer(args.tick_rate)
+        hub = SpectatorHub(server)
+        players = await server.serve_tcp(args.host, args.port)
+        spectators = await hub.serve_tcp(args.host, args.spectator_port)
+        print(f"Players on {args.host}:{args.port}, spectators on {args.host}:{args.spectator_port}")
+        async with players, spectators:
+            await server.run()
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+from collections import deque
+
+# Garbage lines a clear of 0-4 lines is worth, as sent in versus (tetris_server.GARBAGE_TABLE)
+ATTACK_TABLE = (0, 0, 1, 2, 4)
+WINDOW_PIECES = 20  # Pieces in the rolling PPS / KPP / APM window
+
+
+class GameStats:
+    """Competitive statistics for one game, updated incrementally.
+
+    The game calls on_key() for every key press that plays and on_lock() for
+    every placed piece; nothing is recomputed per frame. Rolling PPS, KPP and
+    APM cover the last `window` pieces through running sums over a fixed-size
+    deque, so each update is O(1). Times are active play time from the game's
+    time source, with pauses left out. `version` changes whenever the values
+    shown change, so a renderer can cache its text.
+    """
+
+    def __init__(self, window=WINDOW_PIECES):
+        self.window = window
+        self.version = 0
+        self.reset(0.0)
+
+    def reset(self, now):
+        self.start_time = now
+        self.paused_time = 0.0
+        self.pause_start = None
+        self.end_time = None
+        self.pieces = 0
+        self.keys = 0
+        self.attack = 0
+        self.lines = 0
+        self.clears = [0] * 5  # Locks by lines cleared
+        self.combo = 0  # Consecutive locks that cleared lines
+        self.max_combo = 0
+        self.keys_at_last_lock = 0
+        # (active time, keys, attack) per piece in the window
+        self.recent = deque()
+        self.recent_keys = 0
+        self.recent_attack = 0
+        self.window_start = 0.0  # Active time of the lock just before the window
+        self.version += 1
+
+    def active_time(self, now):
+        if self.end_time is not None:
+            now = self.end_time
+        paused = self.paused_time
+        if self.pause_start is not None:
+            paused += now - self.pause_start
+        return now - self.start_time - paused
+
+    def set_paused(self, paused, now):
+        if paused and self.pause_start is None:
+            self.pause_start = now
+        elif not paused and self.pause_start is not None:
+            self.paused_time += now - self.pause_start
+            self.pause_start = None
+
+    def finish(self, now):
+        # Game over: freeze the clock for summary()
+        self.set_paused(False, now)
+        self.end_time = now
+
+    def on_key(self):
+        self.keys += 1
+
+    def on_lock(self, now, lines):
+        time = self.active_time(now)
+        keys = self.keys - self.keys_at_last_lock
+        self.keys_at_last_lock = self.keys
+        attack = ATTACK_TABLE[min(lines, 4)]
+
+        self.pieces += 1
+        self.attack += attack
+        self.lines += lines
+        self.clears[min(lines, 4)] += 1
+        if lines:
+            self.combo += 1
+            self.max_combo = max(self.max_combo, self.combo)
+        else:
+            self.combo = 0
+
+        recent = self.recent
+        if len(recent) == self.window:
+            self.window_start, old_keys, old_attack = recent.popleft()
+            self.recent_keys -= old_keys
+            self.recent_attack -= old_attack
+        recent.append((time, keys, attack))
+        self.recent_keys += keys
+        self.recent_attack += attack
+        self.version += 1
+
+    def rolling(self):
+        # (PPS, KPP, APM) over the window
+        recent = self.recent
+        if not recent:
+            return 0.0, 0.0, 0.0
+        span = recent[-1][0] - self.window_start
+        pieces = len(recent)
+        if span <= 0:
+            return 0.0, self.recent_keys / pieces, 0.0
+        return pieces / span, self.recent_keys / pieces, self.recent_attack * 60 / span
+
+    def tetris_rate(self):
+        # Share of cleared lines that came from tetrises
+        return 4 * self.clears[4] / self.lines if self.lines else 0.0
+
+    def panel_lines(self):
+        pps, kpp, apm = self.rolling()
+        clears = self.clears
+        return [f"PPS {pps:.2f}   KPP {kpp:.2f}",
+                f"APM {apm:.1f}",
+                f"Tetris rate {self.tetris_rate():.0%}",
+                f"Max combo {self.max_combo}",
+                f"1L {clears[1]}  2L {clears[2]}  3L {clears[3]}  4L {clears[4]}"]
+
+    def summary(self, now):
+        # Whole-game figures, as stored with the highscore
+        time = self.active_time(now)
+        minutes = time / 60
+        return {
+            "time": round(time, 2),
+            "pieces": self.pieces,
+            "pps": round(self.pieces / time, 3) if time > 0 else 0.0,
+            "kpp": round(self.keys / self.pieces, 3) if self.pieces else 0.0,
+            "apm": round(self.attack / minutes, 2) if minutes > 0 else 0.0,
+            "tetris_rate": round(self.tetris_rate(), 3),
+            "max_combo": self.max_combo,
+            "clears": self.clears[1:],
+        }
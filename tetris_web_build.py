@@ -0,0 +1,260 @@
+import argparse
+import ast
+import hashlib
+import http.server
+import io
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import zipfile
+from functools import partial
+
+# Browser build: one content-hashed, compressed bundle for pygbag.
+#
+# The bundle is a zip (pygbag's .apk) holding a generated main.py, the game
+# modules with desktop-only code stripped, and the sounds transcoded to
+# OGG/Opus. Its name carries a hash of its contents, so it can be cached
+# forever; index.html is rewritten to point at it and is never cached.
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+WEB_DIR = os.path.join(ROOT, 'build', 'web')
+TTI_LOG = os.path.join(ROOT, 'build', 'tti.jsonl')
+
+# Game modules the browser needs, with the top-level functions and methods
+# that only make sense on desktop
+WEB_MODULES = {
+    'tetris.py': {'benchmark_restart', 'main', 'TetrisGame.run'},
+    'tetris_events.py': set(),
+    'tetris_profiler.py': set(),
+    'tetris_rotation.py': set(),
+    'tetris_input.py': set(),
+    'tetris_stats.py': set(),
+    'tetris_scoring.py': set(),
+}
+SOUND_FILES = ['line_clear.mp3', 'multiplier_up.mp3']
+OPUS_BITRATE = '32k'  # Plenty for short mono effects
+
+BUNDLE_PREFIX = 'tetris-'
+IMMUTABLE = 'public, max-age=31536000, immutable'
+NO_CACHE = 'no-cache'
+
+# Fixed zip timestamps keep the bundle, and so its hash, reproducible
+ZIP_DATE = (1980, 1, 1, 0, 0, 0)
+
+MAIN_PY = '''\
+import asyncio
+import platform  # pygbag's bridge to the page
+
+from tetris import TetrisGame
+
+BUNDLE = {bundle!r}
+
+
+async def main():
+    game = TetrisGame()
+    while game.run_frame():
+        if game.frame_count == 1:
+            # Interactive: the page measures the time since navigation start
+            platform.window.eval("window.tetrisReady && window.tetrisReady(%r)" % BUNDLE)
+        await asyncio.sleep(0)
+
+
+asyncio.run(main())
+'''
+
+# Added to index.html: reports time-to-interactive to the build's dev server
+TTI_SCRIPT = '''<script>
+window.tetrisReady = function (bundle) {
+    var tti = performance.now();
+    console.log("Tetris interactive after " + tti.toFixed(0) + " ms (" + bundle + ")");
+    fetch("/tti", {method: "POST", body: JSON.stringify({bundle: bundle, tti_ms: tti,
+                                                        agent: navigator.userAgent})})
+        .catch(function () {});
+};
+</script>
+'''
+
+
+def is_main_guard(node):
+    # if __name__ == "__main__":
+    return (isinstance(node, ast.If) and isinstance(node.test, ast.Compare)
+            and isinstance(node.test.left, ast.Name) and node.test.left.id == '__name__')
+
+
+def is_docstring(node):
+    return (isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant)
+            and isinstance(node.value.value, str))
+
+
+def strip_body(body, names, prefix=''):
+    kept = []
+    for node in body:
+        if is_main_guard(node) or is_docstring(node):
+            continue
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            if prefix + node.name in names:
+                continue
+            node.body = strip_body(node.body, names, prefix + node.name + '.') or [ast.Pass()]
+        kept.append(node)
+    return kept
+
+
+def strip_module(source, names):
+    """Drops desktop-only definitions, the __main__ block, docstrings and comments."""
+    tree = ast.parse(source)
+    tree.body = strip_body(tree.body, names)
+    return ast.unparse(tree) + '\n'
+
+
+def transcode(source, target):
+    # Returns False if ffmpeg is not available
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        return False
+    subprocess.run([ffmpeg, '-y', '-loglevel', 'error', '-i', source, '-ac', '1',
+                    '-c:a', 'libopus', '-b:a', OPUS_BITRATE, target], check=True)
+    return True
+
+
+def bundle_files(work_dir):
+    # (name inside the bundle, bytes) for everything the browser game loads
+    files = []
+    for module, desktop_only in WEB_MODULES.items():
+        with open(os.path.join(ROOT, module)) as f:
+            files.append((module, strip_module(f.read(), desktop_only).encode()))
+
+    for sound in SOUND_FILES:
+        source = os.path.join(ROOT, sound)
+        # load_sound() tries .ogg before .mp3, so the game needs no changes
+        target = os.path.join(work_dir, os.path.splitext(sound)[0] + '.ogg')
+        if transcode(source, target):
+            name, path = os.path.basename(target), target
+        else:
+            print(f"ffmpeg not found, bundling {sound} untranscoded")
+            name, path = sound, source
+        with open(path, 'rb') as f:
+            files.append((name, f.read()))
+    return files
+
+
+def write_bundle(files, main_py):
+    # Deflated zip with fixed timestamps, built in memory
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as bundle:
+        for name, data in [('main.py', main_py.encode())] + sorted(files):
+            bundle.writestr(zipfile.ZipInfo('assets/' + name, ZIP_DATE), data,
+                            zipfile.ZIP_DEFLATED, 9)
+    return buffer.getvalue()
+
+
+def rewrite_index(bundle_name):
+    path = os.path.join(WEB_DIR, 'index.html')
+    with open(path) as f:
+        html = f.read()
+    # pygbag's loader names the bundle in one assignment
+    start = html.index('apk = "') + len('apk = "')
+    end = html.index('"', start)
+    html = html[:start] + bundle_name + html[end:]
+    if 'window.tetrisReady' not in html:
+        html = html.replace('</body>', TTI_SCRIPT + '</body>', 1)
+    with open(path, 'w') as f:
+        f.write(html)
+
+
+def write_headers(bundle_name):
+    # Netlify / Cloudflare Pages style header rules
+    with open(os.path.join(WEB_DIR, '_headers'), 'w') as f:
+        f.write(f"/{bundle_name}\n  Cache-Control: {IMMUTABLE}\n"
+                f"/index.html\n  Cache-Control: {NO_CACHE}\n"
+                f"/\n  Cache-Control: {NO_CACHE}\n")
+
+
+def build():
+    with tempfile.TemporaryDirectory() as work_dir:
+        files = bundle_files(work_dir)
+    # The hash covers everything but main.py, which embeds the bundle name
+    digest = hashlib.sha256()
+    for name, data in sorted(files):
+        digest.update(name.encode() + b'\0' + data)
+    bundle_name = f"{BUNDLE_PREFIX}{digest.hexdigest()[:16]}.apk"
+    data = write_bundle(files, MAIN_PY.format(bundle=bundle_name))
+
+    for old in os.listdir(WEB_DIR):
+        if old.startswith(BUNDLE_PREFIX) and old.endswith('.apk') and old != bundle_name:
+            os.remove(os.path.join(WEB_DIR, old))
+    with open(os.path.join(WEB_DIR, bundle_name), 'wb') as f:
+        f.write(data)
+    rewrite_index(bundle_name)
+    write_headers(bundle_name)
+
+    raw = sum(os.path.getsize(os.path.join(ROOT, name)) for name in list(WEB_MODULES) + SOUND_FILES)
+    print(f"Wrote {bundle_name}: {len(data) / 1024:.1f} KiB "
+          f"(sources and sounds {raw / 1024:.1f} KiB)")
+    return bundle_name
+
+
+class WebHandler(http.server.SimpleHTTPRequestHandler):
+    """Serves build/web with the production cache headers and logs TTI reports."""
+
+    def end_headers(self):
+        name = self.path.split('?')[0].lstrip('/')
+        immutable = name.startswith(BUNDLE_PREFIX) and name.endswith('.apk')
+        self.send_header('Cache-Control', IMMUTABLE if immutable else NO_CACHE)
+        super().end_headers()
+
+    def do_POST(self):
+        if self.path != '/tti':
+            self.send_error(404)
+            return
+        report = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        report['time'] = time.time()
+        with open(TTI_LOG, 'a') as f:
+            f.write(json.dumps(report) + '\n')
+        print(f"TTI {report.get('tti_ms', 0):.0f} ms for {report.get('bundle')}")
+        self.send_response(204)
+        self.end_headers()
+
+
+def serve(port=8000):
+    handler = partial(WebHandler, directory=WEB_DIR)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', port), handler)
+    print(f"Serving {WEB_DIR} on http://127.0.0.1:{port}/, TTI reports go to {TTI_LOG}")
+    server.serve_forever()
+
+
+def tti_report():
+    # Median time-to-interactive per bundle, oldest bundle first
+    if not os.path.exists(TTI_LOG):
+        print("No TTI reports recorded yet")
+        return
+    by_bundle = {}
+    with open(TTI_LOG) as f:
+        for line in f:
+            report = json.loads(line)
+            by_bundle.setdefault(report['bundle'], []).append(report['tti_ms'])
+    for bundle, times in by_bundle.items():
+        times.sort()
+        print(f"{bundle}: median {times[len(times) // 2]:.0f} ms over {len(times)} loads")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the pygbag web bundle")
+    parser.add_argument('--serve', action='store_true', help="serve build/web after building")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--tti-report', action='store_true',
+                        help="summarise recorded time-to-interactive and exit")
+    args = parser.parse_args()
+
+    if args.tti_report:
+        tti_report()
+        return
+    build()
+    if args.serve:
+        serve(args.port)
+
+
+if __name__ == "__main__":
+    main()